@@ -4,6 +4,9 @@ import sys
 import time
 
 
+# The longest internal write cycle of a 24LCxx EEPROM (seconds)
+_MAX_WRITE_CYCLE_TIME = 0.005
+
 class Adaptor(ABC):
     def __init__(self, ):
         pass
@@ -51,3 +54,17 @@ class I2CAdaptor(Adaptor):
     @property
     def speed(self,):
         return self.i2c_clock_speed
+
+    def select(self, i2c_address):
+        """Addresses another device on the same bus from the next transaction on."""
+        self.i2c_address = i2c_address
+
+    def ack(self,):
+        """
+        Addresses the device without writing anything, returning True if it
+        acknowledged. EEPROMs don't acknowledge while busy with their internal
+        write cycle (ACK polling). Adaptors that can't address a device on its
+        own wait for the longest write cycle instead.
+        """
+        time.sleep(_MAX_WRITE_CYCLE_TIME)
+        return True
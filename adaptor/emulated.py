@@ -0,0 +1,107 @@
+import time
+
+from .adapter import I2CAdaptor
+
+
+# Clock cycles per byte on the bus (8 data bits and an ACK)
+_CLOCKS_PER_BYTE = 9
+
+
+class _EmulatedEEPROM(object):
+    """The memory and state of one emulated EEPROM on the bus"""
+    def __init__(self, size, fill_byte):
+        self.memory = bytearray([fill_byte]*size)
+        self.pointer = 0
+        # When the current internal write cycle finishes
+        self.busy_until = 0.0
+
+
+class EmulatedEEPROMAdaptor(I2CAdaptor):
+    """
+    An I2C adaptor with emulated 24LCxx EEPROMs attached, for testing
+    without hardware. There is one EEPROM at `i2c_address`, or one at each
+    of `addresses` (as if strapped with A0-A2). Like the real part, writes
+    wrap around within a page and reads continue sequentially from the last
+    address. If `realtime` is set, transfers take as long as they would on
+    the bus and an EEPROM is busy with its internal write cycle for
+    `write_cycle_time` after every write: it doesn't acknowledge ACK polls
+    and other transfers to it wait until the cycle is finished.
+    """
+    def __init__(self, i2c_address=0x50, i2c_clock_speed=100000, size=4096, page_size=32, fill_byte=0xFF,
+                 realtime=False, write_cycle_time=0.005, addresses=None):
+        super(EmulatedEEPROMAdaptor, self).__init__(i2c_address, i2c_clock_speed)
+        self.devices = {address : _EmulatedEEPROM(size, fill_byte) for address in (addresses or [i2c_address])}
+        self.page_size = page_size
+        self.realtime = realtime
+        self.write_cycle_time = write_cycle_time
+        self.is_open = False
+        self.num_transactions = 0
+
+    @property
+    def device(self,):
+        if self.address not in self.devices:
+            raise IOError(f"No device acknowledged I2C address 0x{self.address:02x}")
+        return self.devices[self.address]
+
+    @property
+    def memory(self,):
+        return self.device.memory
+
+    @property
+    def pointer(self,):
+        return self.device.pointer
+
+    def _bus_delay(self, num_bytes):
+        self.num_transactions += 1
+        if self.realtime:
+            # Address byte plus the data
+            time.sleep((num_bytes + 1)*_CLOCKS_PER_BYTE/self.speed)
+
+    def _wait_for_write_cycle(self, device):
+        delay = device.busy_until - time.perf_counter()
+        if delay > 0:
+            time.sleep(delay)
+
+    def open(self,):
+        self.is_open = True
+        # Mirror the dummy read done when opening a real adaptor
+        return self.read_bytes(1)
+
+    def close(self,):
+        self.is_open = False
+
+    def ack(self,):
+        self._bus_delay(0)
+        return self.address in self.devices and time.perf_counter() >= self.device.busy_until
+
+    def read_bytes(self, num_bytes):
+        device = self.device
+        self._wait_for_write_cycle(device)
+        self._bus_delay(num_bytes)
+        memory = device.memory
+        data = bytes(memory[(device.pointer + i) % len(memory)] for i in range(num_bytes))
+        device.pointer = (device.pointer + num_bytes) % len(memory)
+        return data
+
+    def write_bytes(self, byte_list):
+        data = bytes(byte_list)
+        if len(data) < 2:
+            raise ValueError("EEPROM writes start with a two byte address")
+        device = self.device
+        self._wait_for_write_cycle(device)
+        self._bus_delay(len(data))
+        memory = device.memory
+        address = ((data[0] << 8) | data[1]) % len(memory)
+        page = address - address % self.page_size
+        for i, byte in enumerate(data[2:]):
+            memory[page + (address - page + i) % self.page_size] = byte
+        if len(data) > 2:
+            device.pointer = page + (address - page + len(data) - 2) % self.page_size
+            if self.realtime:
+                device.busy_until = time.perf_counter() + self.write_cycle_time
+        else:
+            device.pointer = address
+
+    def write_then_read_bytes(self, byte_list, num_read_bytes):
+        self.write_bytes(byte_list)
+        return self.read_bytes(num_read_bytes)
@@ -1,5 +1,5 @@
 import EasyMCP2221
-from EasyMCP2221.exceptions import LowSCLError, LowSDAError
+from EasyMCP2221.exceptions import LowSCLError, LowSDAError, NotAckError
 from .adapter import I2CAdaptor
 
 
@@ -8,13 +8,15 @@ class UnexpectedHardwareException(Exception):
 
 
 class MCP2221I2CAdaptor(I2CAdaptor):
-    def __init__(self, i2c_address, i2c_clock_speed=100000, transaction_timeout_ms=20):
+    def __init__(self, i2c_address, i2c_clock_speed=100000, transaction_timeout_ms=20, devnum=None):
         super(MCP2221I2CAdaptor, self).__init__(i2c_address, i2c_clock_speed)
         self.timeout = transaction_timeout_ms
+        # Which MCP2221 to use when more than one is connected
+        self.devnum = devnum
         self.mcp = None
 
     def open(self,):
-        self.mcp = EasyMCP2221.Device()
+        self.mcp = EasyMCP2221.Device() if self.devnum is None else EasyMCP2221.Device(devnum=self.devnum)
         self.mcp.I2C_speed(self.speed)
 
         # Ensure there is something connected by doing a dummy read
@@ -35,6 +37,16 @@ class MCP2221I2CAdaptor(I2CAdaptor):
         except (LowSCLError, LowSDAError):
             raise UnexpectedHardwareException("Unexpected programmer state. Try unplugging and re-plugging the programmer and trying again.")
 
+    def ack(self,):
+        # The MCP2221 can't address a device without transferring data, so read a byte
+        try:
+            self.mcp.I2C_read(self.address, size=1, timeout_ms=self.timeout)
+        except NotAckError:
+            return False
+        except (LowSCLError, LowSDAError):
+            raise UnexpectedHardwareException("Unexpected programmer state. Try unplugging and re-plugging the programmer and trying again.")
+        return True
+
     def write_then_read_bytes(self, byte_list, num_read_bytes):
         self.mcp.I2C_write(self.address, byte_list, kind='nonstop', timeout_ms=self.timeout)
         return self.mcp.I2C_read(self.address, num_read_bytes, kind='restart', timeout_ms=self.timeout)
@@ -0,0 +1,208 @@
+import struct
+import time
+from pathlib import Path
+from typing import List, NamedTuple
+
+from .adapter import Adaptor
+
+
+TRACE_MAGIC = b'FV1TRACE'
+TRACE_VERSION = 2
+
+# Record kinds
+OPEN, CLOSE, WRITE, READ, WRITE_THEN_READ, SELECT = range(6)
+KIND_NAMES = ["open", "close", "write", "read", "write_then_read", "select"]
+
+# Record flags
+FLAG_EXCEPTION = 0x01
+
+# kind, flags, start (seconds since the trace started), duration (seconds),
+# written length, requested read length, result (or exception) length
+_RECORD = struct.Struct('<BBdfIII')
+# Version 1 traces had 16 bit lengths
+_RECORD_FORMATS = {1 : struct.Struct('<BBdfHHH'), TRACE_VERSION : _RECORD}
+
+
+class TraceRecord(NamedTuple):
+    """A single adaptor call from a trace"""
+    kind : int
+    start : float
+    duration : float
+    written : bytes = b''
+    num_read_bytes : int = 0
+    result : bytes = b''
+    # "ExceptionType: message" if the call raised
+    exception : str = None
+
+    def pack(self) -> bytes:
+        result = self.result if self.exception is None else self.exception.encode('utf-8')
+        return _RECORD.pack(self.kind, FLAG_EXCEPTION if self.exception is not None else 0, self.start,
+                            self.duration, len(self.written), self.num_read_bytes, len(result)) + self.written + result
+
+
+def read_trace(filepath : Path) -> List[TraceRecord]:
+    """Reads every record of a trace file"""
+    with open(filepath, 'rb') as f:
+        data = f.read()
+    if not data.startswith(TRACE_MAGIC) or len(data) <= len(TRACE_MAGIC):
+        raise ValueError(f"'{str(filepath)}' is not an adaptor trace")
+    if data[len(TRACE_MAGIC)] not in _RECORD_FORMATS:
+        raise ValueError(f"Unsupported trace version {data[len(TRACE_MAGIC)]}")
+    record_format = _RECORD_FORMATS[data[len(TRACE_MAGIC)]]
+
+    records = []
+    offset = len(TRACE_MAGIC) + 1
+    while offset + record_format.size <= len(data):
+        kind, flags, start, duration, num_written, num_read, num_result = record_format.unpack_from(data, offset)
+        offset += record_format.size
+        written = data[offset:offset + num_written]
+        offset += num_written
+        result = data[offset:offset + num_result]
+        offset += num_result
+        if flags & FLAG_EXCEPTION:
+            records.append(TraceRecord(kind, start, duration, written, num_read, b'', result.decode('utf-8')))
+        else:
+            records.append(TraceRecord(kind, start, duration, written, num_read, result))
+    return records
+
+
+class TracingAdaptor(Adaptor):
+    """
+    Wraps an adaptor, recording every call (data written and read, timing
+    and any exception raised) to a binary trace file.
+    """
+    def __init__(self, adaptor : Adaptor, filepath : Path) -> None:
+        super(TracingAdaptor, self).__init__()
+        self.adaptor = adaptor
+        self.filepath = filepath
+        self._file = open(filepath, 'wb')
+        self._file.write(TRACE_MAGIC + bytes([TRACE_VERSION]))
+        self._start = time.perf_counter()
+
+    def __getattr__(self, name):
+        # Pass through adaptor properties (address, speed...)
+        if name == 'adaptor':
+            raise AttributeError(name)
+        return getattr(self.adaptor, name)
+
+    def _call(self, kind, func, written=b'', num_read_bytes=0):
+        start = time.perf_counter()
+        try:
+            result = func()
+        except Exception as e:
+            self._record(TraceRecord(kind, start - self._start, time.perf_counter() - start, written, num_read_bytes,
+                                     exception=f"{type(e).__name__}: {e}"))
+            raise
+        data = bytes(result) if kind in (READ, WRITE_THEN_READ) and result is not None else b''
+        self._record(TraceRecord(kind, start - self._start, time.perf_counter() - start, written, num_read_bytes,
+                                 data))
+        return result
+
+    def _record(self, record : TraceRecord) -> None:
+        if not self._file.closed:
+            # Flushed every time so nothing is lost if the program crashes
+            self._file.write(record.pack())
+            self._file.flush()
+
+    def open(self,):
+        return self._call(OPEN, self.adaptor.open)
+
+    def close(self,):
+        try:
+            return self._call(CLOSE, self.adaptor.close)
+        finally:
+            self._file.close()
+
+    def ack(self,):
+        # Not recorded, replays acknowledge straight away
+        return self.adaptor.ack()
+
+    def select(self, i2c_address):
+        # Recorded (address as the written byte) so replays address the same devices in the same order
+        return self._call(SELECT, lambda: self.adaptor.select(i2c_address), written=bytes([i2c_address]))
+
+    def read_bytes(self, num_bytes):
+        return self._call(READ, lambda: self.adaptor.read_bytes(num_bytes), num_read_bytes=num_bytes)
+
+    def write_bytes(self, byte_list):
+        return self._call(WRITE, lambda: self.adaptor.write_bytes(byte_list), written=bytes(byte_list))
+
+    def write_then_read_bytes(self, byte_list, num_read_bytes):
+        return self._call(WRITE_THEN_READ, lambda: self.adaptor.write_then_read_bytes(byte_list, num_read_bytes),
+                          written=bytes(byte_list), num_read_bytes=num_read_bytes)
+
+
+class TraceMismatch(Exception):
+    """Raised when a replayed call doesn't match the next call in the trace"""
+    pass
+
+
+class ReplayedException(Exception):
+    """An exception raised by the traced adaptor, raised again during replay"""
+    pass
+
+
+class ReplayAdaptor(Adaptor):
+    """
+    Plays back a trace: each call must match the next record in the trace
+    and returns (or raises) what the traced adaptor did. Each call takes
+    its recorded duration divided by `speedup` (0 replays as fast as
+    possible).
+    """
+    def __init__(self, filepath : Path, speedup : float=0.0, i2c_address=0x50, i2c_clock_speed=100000) -> None:
+        super(ReplayAdaptor, self).__init__()
+        self.records = read_trace(filepath)
+        self.speedup = speedup
+        self.position = 0
+        self.i2c_address = i2c_address
+        self.i2c_clock_speed = i2c_clock_speed
+
+    @property
+    def address(self,):
+        return self.i2c_address
+
+    @property
+    def speed(self,):
+        return self.i2c_clock_speed
+
+    @property
+    def finished(self) -> bool:
+        return self.position >= len(self.records)
+
+    def _replay(self, kind, written=b'', num_read_bytes=0):
+        if self.finished:
+            raise TraceMismatch(f"Unexpected {KIND_NAMES[kind]} after the end of the trace")
+        record = self.records[self.position]
+        if record.kind != kind or record.written != bytes(written) or record.num_read_bytes != num_read_bytes:
+            raise TraceMismatch(f"Call {self.position} is {KIND_NAMES[kind]} of {bytes(written).hex()} "
+                                f"(reading {num_read_bytes}) but the trace has {KIND_NAMES[record.kind]} of "
+                                f"{record.written.hex()} (reading {record.num_read_bytes})")
+        self.position += 1
+        if self.speedup > 0:
+            time.sleep(record.duration/self.speedup)
+        if record.exception is not None:
+            raise ReplayedException(record.exception)
+        return record.result
+
+    def open(self,):
+        self._replay(OPEN)
+
+    def close(self,):
+        self._replay(CLOSE)
+
+    def ack(self,):
+        # The recorded calls already include any time spent waiting for the device
+        return True
+
+    def select(self, i2c_address):
+        self._replay(SELECT, written=bytes([i2c_address]))
+        self.i2c_address = i2c_address
+
+    def read_bytes(self, num_bytes):
+        return self._replay(READ, num_read_bytes=num_bytes)
+
+    def write_bytes(self, byte_list):
+        self._replay(WRITE, written=byte_list)
+
+    def write_then_read_bytes(self, byte_list, num_read_bytes):
+        return self._replay(WRITE_THEN_READ, written=byte_list, num_read_bytes=num_read_bytes)
@@ -2,16 +2,83 @@ from abc import ABC, abstractmethod
 from adaptor.adapter import Adaptor
 
 import logging
+import time
 from pathlib import Path
-from intelhex import IntelHex
+from typing import Callable, NamedTuple, Optional
 
 
 _MAX_TRANSACTION_SIZE = 65535
 _DEFAULT_PAGE_SIZE = 32
+# Longest time to wait for an internal write cycle to finish (5 ms on most parts)
+_WRITE_CYCLE_TIMEOUT = 0.1
 
 logger = logging.getLogger('eeprom')
 
 
+class ProgressEvent(NamedTuple):
+    """A snapshot of the progress of an EEPROM operation"""
+    operation : str
+    done : int
+    total : int
+    elapsed : float
+
+    @property
+    def fraction(self) -> float:
+        return self.done / self.total if self.total else 1.0
+
+    @property
+    def rate(self) -> float:
+        """Bytes per second"""
+        return self.done / self.elapsed if self.elapsed > 0 else 0.0
+
+    @property
+    def eta(self) -> Optional[float]:
+        """Estimated seconds remaining"""
+        return (self.total - self.done) / self.rate if self.rate > 0 else None
+
+
+class OperationCancelled(Exception):
+    """Raised at a page boundary when an EEPROM operation is cancelled"""
+    def __init__(self, event : ProgressEvent) -> None:
+        self.event = event
+        super().__init__(f"{event.operation.capitalize()} cancelled after {event.done} of {event.total} bytes")
+
+
+class TransferProgress(object):
+    """
+    Tracks the progress of one or more EEPROM operations. `callback` is
+    called with a ProgressEvent after every page and `is_cancelled` is
+    polled before every page.
+    """
+    def __init__(self, total : int=0, callback : Callable[[ProgressEvent], None]=None,
+                 is_cancelled : Callable[[], bool]=None) -> None:
+        self.total = total
+        self.done = 0
+        self.operation = ""
+        self.callback = callback
+        self.is_cancelled = is_cancelled
+        self.start = time.monotonic()
+
+    def expect(self, num_bytes : int) -> None:
+        """Adds `num_bytes` to the expected total."""
+        self.total += num_bytes
+
+    @property
+    def event(self) -> ProgressEvent:
+        return ProgressEvent(self.operation, self.done, max(self.total, self.done), time.monotonic() - self.start)
+
+    def check_cancelled(self, operation : str) -> None:
+        self.operation = operation
+        if self.is_cancelled is not None and self.is_cancelled():
+            raise OperationCancelled(self.event)
+
+    def advance(self, operation : str, num_bytes : int) -> None:
+        self.operation = operation
+        self.done += num_bytes
+        if self.callback is not None:
+            self.callback(self.event)
+
+
 class EEPROM(ABC):
     def __init__(self, adaptor : Adaptor, size_in_bytes : int, page_size_in_bytes : int =_DEFAULT_PAGE_SIZE) -> None:
         assert size_in_bytes > 0, "Size must be > 0"
@@ -57,7 +124,7 @@ class EEPROM(ABC):
         Returns a list of tuples of (address, offset, length) for each transaction.
         """
         aligned_size = (max_size - start_address) % max_size
-        first_length = aligned_size if aligned_size != 0 else min(max_size, total_bytes)
+        first_length = min(aligned_size if aligned_size != 0 else max_size, total_bytes)
         transactions = [(start_address, 0, first_length),]
         current_address = start_address + first_length
         current_offset = 0 + first_length
@@ -77,60 +144,131 @@ class EEPROM(ABC):
 
         return transactions
 
-    def load_file(self, filepath : Path, padding=0xFF, verify : bool=False):
+    def write(self, byte_address, byte_list, progress : TransferProgress=None):
+        """
+        Writes a list of bytes to EEPROM one page at a time, reporting progress
+        and stopping at a page boundary if the operation is cancelled.
+        """
+        data = EEPROM.ensure_bytes(byte_list)
+        if progress is None:
+            self.write_bytes(byte_address, data)
+        else:
+            for _addr, _offset, _len in EEPROM.split_transaction(self.page_size, byte_address, len(data)):
+                progress.check_cancelled("write")
+                self.write_bytes(_addr, data[_offset:_offset+_len])
+                progress.advance("write", _len)
+        self.wait_until_ready()
+
+    def wait_until_ready(self,):
+        """Waits until the EEPROM has finished writing the last page."""
+        pass
+
+    def read(self, byte_address, num_bytes, progress : TransferProgress=None, operation : str="read"):
+        """
+        Reads a series of sequential bytes from EEPROM one page at a time,
+        reporting progress and stopping at a page boundary if cancelled.
+        """
+        if progress is None:
+            return self.read_bytes(byte_address, num_bytes)
+        data = b''
+        for _addr, _offset, _len in EEPROM.split_transaction(self.page_size, byte_address, num_bytes):
+            progress.check_cancelled(operation)
+            data += self.read_bytes(_addr, _len)
+            progress.advance(operation, _len)
+        return data
+
+    def verify(self, byte_address, byte_list, progress : TransferProgress=None) -> bool:
+        """
+        Reads back and compares a list of bytes written at `byte_address`.
+        """
+        return self.read(byte_address, len(byte_list), progress, operation="verify") == EEPROM.ensure_bytes(byte_list)
+
+    def load_file(self, filepath : Path, padding=0xFF, verify : bool=False, progress : TransferProgress=None):
         """
         Loads a file onto the connected EEPROM.
         """
         assert filepath.is_file() and filepath.exists(), f"Invalid file path {str(filepath)}"
         if filepath.suffix.lower() == '.hex':
-            return self.load_hex(filepath, padding=padding, verify=verify)
+            return self.load_hex(filepath, padding=padding, verify=verify, progress=progress)
         elif filepath.suffix.lower() == '.bin':
-            return self.load_bin(filepath, verify=verify)
+            return self.load_bin(filepath, verify=verify, progress=progress)
 
         raise ValueError(f"Don't know how to handle file suffix '{filepath.suffix}'")
 
-    def load_hex(self, filepath : Path, padding=0xFF, verify : bool=False):
+    def load_hex(self, filepath : Path, padding=0xFF, verify : bool=False, progress : TransferProgress=None):
         """
         Loads a hex file onto the connected EEPROM.
         """
-        hex_file = IntelHex(str(filepath))
-        hex_file.padding = padding
-        write_data = hex_file.tobinstr(start=0, size=self.size)
-        self.write_bytes(0, write_data)
+        from .hexfile import read_records
+        write_data = bytearray([padding]*self.size)
+        if progress is not None:
+            progress.expect(len(write_data)*(2 if verify else 1))
+
+        # The records are checked and placed in a single pass before anything is
+        # written, so a bad file leaves the EEPROM untouched and records in any
+        # order write each page once. The image never takes more than the size
+        # of the EEPROM, and parsing is quick next to the page writes.
+        with open(filepath, 'r') as f:
+            for address, data in read_records(f):
+                end = min(address + len(data), self.size)
+                if address < end:
+                    write_data[address:end] = data[:end - address]
+        self.write(0, write_data, progress)
         if verify:
-            readback = self.read_bytes(0, self.size)
-            assert readback == write_data
+            assert self.verify(0, write_data, progress)
 
-    def load_bin(self, filepath : Path, verify : bool=False):
+    def load_bin(self, filepath : Path, verify : bool=False, progress : TransferProgress=None):
         """
         Loads a binary file onto the connected EEPROM.
         """
         with open(filepath, 'rb') as f:
             write_data = f.read(self.size)
             assert len(write_data) <= self.size
-            self.write_bytes(0, write_data)
+            if progress is not None:
+                progress.expect(len(write_data)*(2 if verify else 1))
+            self.write(0, write_data, progress)
             if verify:
-                readback = self.read_bytes(0, self.size)
-                assert readback == write_data
+                assert self.verify(0, write_data, progress)
 
-    def save_file(self, filepath : Path):
+    def save_file(self, filepath : Path, progress : TransferProgress=None):
         """
-        Dumps the entire contents of EEPROM to a binary file.
+        Dumps the entire contents of EEPROM to a binary (.bin) or Intel HEX
+        (.hex) file.
         """
-        with open(filepath, 'wb') as f:
-            f.write(self.read_bytes(0, self.size))
-
-    def erase(self, byte_value : int, verify : bool=False):
+        suffix = filepath.suffix.lower()
+        if suffix not in ('.bin', '.hex'):
+            raise ValueError(f"Don't know how to handle file suffix '{filepath.suffix}'")
+        if progress is not None:
+            progress.expect(self.size)
+        data = self.read(0, self.size, progress)
+        if suffix == '.hex':
+            from .hexfile import write_hex
+            with open(filepath, 'w') as f:
+                write_hex(f, data)
+        else:
+            with open(filepath, 'wb') as f:
+                f.write(data)
+
+    def erase(self, byte_value : int, verify : bool=False, progress : TransferProgress=None):
         """
         Erase the EEPROM by filling it with `byte_value`
         """
         erase_bytes = bytes([byte_value]*self.size)
-        self.write_bytes(0, erase_bytes)
+        if progress is not None:
+            progress.expect(self.size*(2 if verify else 1))
+        self.write(0, erase_bytes, progress)
         if verify:
-            assert self.read_bytes(0, self.size) == erase_bytes
+            assert self.verify(0, erase_bytes, progress)
 
 
 class I2CEEPROM(EEPROM):
+    def wait_until_ready(self, timeout : float=_WRITE_CYCLE_TIMEOUT):
+        # ACK polling: the EEPROM doesn't acknowledge its address until the write cycle is done
+        deadline = time.monotonic() + timeout
+        while not self.adaptor.ack():
+            if time.monotonic() > deadline:
+                raise TimeoutError(f"EEPROM at I2C address 0x{self.adaptor.address:02x} did not finish writing")
+
     def read_bytes(self, byte_address, num_bytes):
         return self.adaptor.write_then_read_bytes(byte_address.to_bytes(2, 'big'), num_bytes)
 
@@ -0,0 +1,83 @@
+from pathlib import Path
+from typing import Iterable, Iterator, TextIO, Tuple
+
+
+# Record types
+DATA, END_OF_FILE, EXTENDED_SEGMENT_ADDRESS, START_SEGMENT_ADDRESS, EXTENDED_LINEAR_ADDRESS, \
+    START_LINEAR_ADDRESS = range(6)
+
+_RECORD_SIZE = 16
+
+
+def read_records(lines : Iterable[str]) -> Iterator[Tuple[int, bytes]]:
+    """
+    Parses the lines of an Intel HEX file one at a time, yielding the
+    (address, data) of each data record. Extended segment and linear address
+    records move the base address of the records that follow.
+    """
+    base = 0
+    for line_number, line in enumerate(lines, start=1):
+        line = line.strip()
+        if not len(line):
+            continue
+        if line[0] != ':':
+            raise ValueError(f"Line {line_number} is not an Intel HEX record")
+        try:
+            record = bytes.fromhex(line[1:])
+        except ValueError:
+            raise ValueError(f"Line {line_number} has invalid hex digits")
+        if len(record) < 5 or len(record) != record[0] + 5:
+            raise ValueError(f"Line {line_number} has the wrong length")
+        if sum(record) & 0xFF:
+            raise ValueError(f"Line {line_number} has a bad checksum")
+
+        kind, data = record[3], record[4:-1]
+        if kind == DATA:
+            yield base + ((record[1] << 8) | record[2]), data
+        elif kind == END_OF_FILE:
+            return
+        elif kind == EXTENDED_SEGMENT_ADDRESS:
+            base = int.from_bytes(data, 'big') << 4
+        elif kind == EXTENDED_LINEAR_ADDRESS:
+            base = int.from_bytes(data, 'big') << 16
+        elif kind not in (START_SEGMENT_ADDRESS, START_LINEAR_ADDRESS):
+            raise ValueError(f"Line {line_number} has unknown record type {kind}")
+
+
+def read_hex(filepath : Path, size : int=None, padding : int=0xFF) -> bytearray:
+    """
+    Reads an Intel HEX file into a bytearray, filling gaps with `padding`.
+    If `size` is given the image is exactly `size` bytes (data beyond it is
+    dropped), otherwise it ends with the highest address in the file.
+    """
+    image = bytearray([padding]*size) if size is not None else bytearray()
+    with open(filepath, 'r') as f:
+        for address, data in read_records(f):
+            end = address + len(data)
+            if size is None and end > len(image):
+                image.extend(bytes([padding]*(end - len(image))))
+            if address < len(image):
+                num_bytes = min(len(data), len(image) - address)
+                image[address:address + num_bytes] = data[:num_bytes]
+    return image
+
+
+def _record(kind : int, address : int, data : bytes) -> str:
+    record = bytes([len(data), (address >> 8) & 0xFF, address & 0xFF, kind]) + data
+    return f":{(record + bytes([-sum(record) & 0xFF])).hex().upper()}\n"
+
+
+def write_hex(f : TextIO, data : bytes, start_address : int=0, record_size : int=_RECORD_SIZE) -> None:
+    """Writes `data` (to be loaded at `start_address`) to an open text file as Intel HEX records"""
+    segment = 0
+    offset = 0
+    while offset < len(data):
+        address = start_address + offset
+        if address >> 16 != segment:
+            segment = address >> 16
+            f.write(_record(EXTENDED_LINEAR_ADDRESS, 0, segment.to_bytes(2, 'big')))
+        # Records don't cross a 64 KB boundary
+        num_bytes = min(record_size, 0x10000 - (address & 0xFFFF), len(data) - offset)
+        f.write(_record(DATA, address & 0xFFFF, bytes(data[offset:offset + num_bytes])))
+        offset += num_bytes
+    f.write(_record(END_OF_FILE, 0, b''))
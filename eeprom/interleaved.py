@@ -0,0 +1,93 @@
+import time
+from collections import deque
+from typing import Dict, List, Union
+
+from adaptor.adapter import I2CAdaptor
+from .eeprom import EEPROM, I2CEEPROM, TransferProgress, _DEFAULT_PAGE_SIZE, _WRITE_CYCLE_TIMEOUT
+
+
+class InterleavedI2CEEPROMs(object):
+    """
+    Several EEPROMs of the same type on one I2C bus, at the addresses set by
+    their A0-A2 pins. Writes are interleaved a page at a time: while one
+    EEPROM is busy with its internal write cycle the next page is written to
+    another, and ACK polling tells when each one is ready again. The bus is
+    kept busy instead of idling through every write cycle, so programming N
+    EEPROMs takes little longer than programming one.
+    """
+    def __init__(self, adaptor : I2CAdaptor, addresses : List[int], size_in_bytes : int,
+                 page_size_in_bytes : int=_DEFAULT_PAGE_SIZE, write_cycle_timeout : float=_WRITE_CYCLE_TIMEOUT) -> None:
+        assert len(addresses) and len(set(addresses)) == len(addresses), "I2C addresses must be unique"
+        self.adaptor = adaptor
+        self.addresses = list(addresses)
+        self.eeprom = I2CEEPROM(adaptor, size_in_bytes, page_size_in_bytes=page_size_in_bytes)
+        self.write_cycle_timeout = write_cycle_timeout
+        # ACK polls answered while an EEPROM was still busy (in the last write)
+        self.busy_polls = 0
+
+    @property
+    def size(self,):
+        return self.eeprom.size
+
+    @property
+    def page_size(self,):
+        return self.eeprom.page_size
+
+    def write(self, byte_address : int, data : Union[bytes, Dict[int, bytes]], progress : TransferProgress=None):
+        """
+        Writes `data` at `byte_address` on every EEPROM, or a different image to
+        each if `data` maps I2C addresses to bytes. If cancelled, the EEPROMs
+        stop at a page boundary (each may have been written to a different point).
+        """
+        images = data if isinstance(data, dict) else {address : data for address in self.addresses}
+        if not set(images).issubset(self.addresses):
+            raise ValueError("Images can only be written to the EEPROMs in the group")
+        pages = {address : deque(EEPROM.split_transaction(self.page_size, byte_address, len(image)))
+                 for address, image in images.items() if len(image)}
+        # I2C address -> when its last page write was sent
+        busy = {}
+        self.busy_polls = 0
+        selected = self.adaptor.address
+        try:
+            while len(pages) or len(busy):
+                for address in self.addresses:
+                    if address in busy:
+                        self.adaptor.select(address)
+                        if not self.adaptor.ack():
+                            self.busy_polls += 1
+                            if time.monotonic() - busy[address] > self.write_cycle_timeout:
+                                raise TimeoutError(f"EEPROM at I2C address 0x{address:02x} did not finish writing")
+                            continue
+                        del busy[address]
+                    if address not in pages:
+                        continue
+
+                    _addr, _offset, _len = pages[address].popleft()
+                    if not len(pages[address]):
+                        del pages[address]
+                    if progress is not None:
+                        progress.check_cancelled("write")
+                    self.adaptor.select(address)
+                    self.eeprom.write_bytes(_addr, EEPROM.ensure_bytes(images[address][_offset:_offset + _len]))
+                    busy[address] = time.monotonic()
+                    if progress is not None:
+                        progress.advance("write", _len)
+        finally:
+            self.adaptor.select(selected)
+
+    def read(self, address : int, byte_address : int, num_bytes : int, progress : TransferProgress=None,
+             operation : str="read") -> bytes:
+        """Reads from the EEPROM at I2C address `address`"""
+        selected = self.adaptor.address
+        try:
+            self.adaptor.select(address)
+            return self.eeprom.read(byte_address, num_bytes, progress, operation=operation)
+        finally:
+            self.adaptor.select(selected)
+
+    def verify(self, byte_address : int, data : Union[bytes, Dict[int, bytes]],
+               progress : TransferProgress=None) -> List[int]:
+        """Reads back what write() wrote, returning the I2C addresses of the EEPROMs that differ"""
+        images = data if isinstance(data, dict) else {address : data for address in self.addresses}
+        return [address for address, image in images.items()
+                if self.read(address, byte_address, len(image), progress, operation="verify") != bytes(image)]
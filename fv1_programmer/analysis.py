@@ -0,0 +1,170 @@
+from dataclasses import dataclass, field
+from typing import Dict, List, Tuple
+
+from fv1_programmer.isa import (
+    FV1_PROGRAM_LENGTH, FV1_DELAY_MEMORY_SIZE, FV1_NUM_REGISTERS, NOP, REG0, REGISTER_NAMES, LFO_NAMES,
+    DACL, DACR, SIN0_RATE, SIN0_RANGE, RMP0_RANGE,
+    CHO_NA, decode_program, program_length, skip_target, registers_read, registers_written,
+    delay_address, lfos_used,
+)
+
+
+_RAMP_RANGES = {0 : 4096, 1 : 2048, 2 : 1024, 3 : 512}
+
+
+@dataclass
+class ProgramAnalysis:
+    """Static resource usage of an assembled FV-1 program"""
+    instructions : int = 0
+    delay_memory : Dict[str, Tuple[int, int]] = None
+    delay_memory_used : int = 0
+    registers_read : List[int] = field(default_factory=list)
+    registers_written : List[int] = field(default_factory=list)
+    lfos : List[str] = field(default_factory=list)
+    unreachable : List[int] = field(default_factory=list)
+    issues : List[str] = field(default_factory=list)
+
+    @property
+    def registers(self) -> List[int]:
+        """General purpose registers (REG0-REG31) used by the program"""
+        return sorted(r for r in set(self.registers_read) | set(self.registers_written)
+                      if REG0 <= r < REG0 + FV1_NUM_REGISTERS)
+
+    def summary(self) -> str:
+        lfos = ", ".join(self.lfos) if len(self.lfos) else "none"
+        return (f"{self.instructions}/{FV1_PROGRAM_LENGTH} instructions, "
+                f"{self.delay_memory_used}/{FV1_DELAY_MEMORY_SIZE} delay words, "
+                f"{len(self.registers)}/{FV1_NUM_REGISTERS} registers, LFOs: {lfos}")
+
+    def report(self) -> str:
+        lines = [f"Instructions: {self.instructions}/{FV1_PROGRAM_LENGTH} "
+                 f"({FV1_PROGRAM_LENGTH - self.instructions} free)",
+                 f"Delay memory: {self.delay_memory_used}/{FV1_DELAY_MEMORY_SIZE} words "
+                 f"({FV1_DELAY_MEMORY_SIZE - self.delay_memory_used} free)"]
+        if self.delay_memory:
+            for name, (address, length) in sorted(self.delay_memory.items(), key=lambda r: r[1]):
+                lines.append(f"  {name}: {address}-{address + length} ({length} words)")
+        lines.append(f"Registers: {len(self.registers)}/{FV1_NUM_REGISTERS} "
+                     f"({', '.join(REGISTER_NAMES[r] for r in self.registers) or 'none'})")
+        lines.append(f"LFOs: {', '.join(self.lfos) or 'none'}")
+        if len(self.unreachable):
+            lines.append(f"Unreachable instructions: {', '.join(str(a) for a in self.unreachable)}")
+        lines += [f"Warning: {issue}" for issue in self.issues]
+        return "\n".join(lines)
+
+
+def _region_of(regions : Dict[str, Tuple[int, int]], address : int):
+    for name, (start, length) in regions.items():
+        if start <= address <= start + length:
+            return name
+    return None
+
+
+def analyze(program : bytes, delay_memory : Dict[str, Tuple[int, int]]=None) -> ProgramAnalysis:
+    """
+    Analyzes the resource usage of an assembled program. `delay_memory` is the
+    optional map of MEM declarations (name -> (address, length)) recorded by
+    FV1Program.assemble(), used to check delay accesses against their region.
+    """
+    instructions = decode_program(program)
+    result = ProgramAnalysis(delay_memory=delay_memory)
+
+    length = program_length(program)
+    result.instructions = length
+    instructions = instructions[:length]
+
+    # Reachability from the first instruction through fall-through and SKPs
+    reachable = set()
+    pending = [0] if length else []
+    while pending:
+        address = pending.pop()
+        if address >= length or address in reachable:
+            continue
+        reachable.add(address)
+        inst = instructions[address]
+        if inst.mnemonic == 'SKP' and inst.word != NOP.word:
+            target = skip_target(address, inst)
+            if target > FV1_PROGRAM_LENGTH:
+                result.issues.append(f"SKP at {address} jumps past the end of the program (to {target})")
+            elif target > length:
+                result.issues.append(f"SKP at {address} jumps past the last instruction (to {target})")
+            pending.append(target)
+            if inst.args[0] != 0:
+                pending.append(address + 1)
+        else:
+            pending.append(address + 1)
+    result.unreachable = [a for a in range(length) if a not in reachable]
+
+    # Registers
+    read, written = set(), set()
+    for inst in instructions:
+        read.update(registers_read(inst))
+        written.update(registers_written(inst))
+    result.registers_read = sorted(read)
+    result.registers_written = sorted(written)
+    for r in sorted(read - written):
+        if REG0 <= r < REG0 + FV1_NUM_REGISTERS:
+            result.issues.append(f"{REGISTER_NAMES[r]} is read but never written")
+    for r in sorted(written - read):
+        if REG0 <= r < REG0 + FV1_NUM_REGISTERS:
+            result.issues.append(f"{REGISTER_NAMES[r]} is written but never read")
+    if length and not written & {DACL, DACR}:
+        result.issues.append("Nothing is written to DACL or DACR")
+
+    # LFOs and their maximum delay excursion (in samples)
+    used = sorted(set(lfo for inst in instructions for lfo in lfos_used(inst)))
+    result.lfos = [LFO_NAMES[lfo] for lfo in used]
+    excursion = {0 : 0, 1 : 0, 2 : 0, 3 : 0}
+    for inst in instructions:
+        if inst.mnemonic == 'WLDS':
+            excursion[inst.args[0]] = max(excursion[inst.args[0]], inst.args[2] // 2)
+        elif inst.mnemonic == 'WLDR':
+            lfo = inst.args[0] | 0x2
+            excursion[lfo] = max(excursion[lfo], _RAMP_RANGES[inst.args[2]])
+    for lfo in range(4):
+        # A range set at run time (e.g. from a POT) can be anything
+        range_register = SIN0_RANGE + 2*lfo if lfo < 2 else RMP0_RANGE + 2*(lfo - 2)
+        if range_register in written and not any(i.mnemonic in ('WLDS', 'WLDR') and lfo in lfos_used(i)
+                                                 for i in instructions):
+            excursion[lfo] = FV1_DELAY_MEMORY_SIZE // 2 if lfo < 2 else 4096
+    for lfo in used:
+        rate_register = SIN0_RATE + 2*lfo if lfo < 2 else SIN0_RATE + 4 + 2*(lfo - 2)
+        if rate_register not in written:
+            result.issues.append(f"{LFO_NAMES[lfo]} is used but never loaded with "
+                                 f"{'WLDS' if lfo < 2 else 'WLDR'}")
+
+    # Delay memory
+    top = 0
+    if delay_memory:
+        top = max(address + length + 1 for address, length in delay_memory.values())
+        regions = sorted(delay_memory.items(), key=lambda r: r[1])
+        for (name, (start, size)), (next_name, (next_start, _)) in zip(regions, regions[1:]):
+            if start + size >= next_start:
+                result.issues.append(f"MEM regions {name} and {next_name} overlap")
+    for address, inst in enumerate(instructions):
+        access = delay_address(inst)
+        if access is None:
+            continue
+        base, _ = access
+        low, high = base, base
+        if inst.mnemonic == 'CHO' and not inst.args[2] & CHO_NA:
+            lfo = inst.args[1]
+            if lfo < 2:
+                low, high = base - excursion[lfo], base + excursion[lfo] + 1
+            else:
+                high = base + excursion[lfo] + 1
+        top = max(top, high + 1)
+        if delay_memory:
+            region = _region_of(delay_memory, base)
+            if region is None:
+                result.issues.append(f"{inst.mnemonic} at {address} accesses address {base} outside of any MEM region")
+            elif _region_of(delay_memory, low) != region or _region_of(delay_memory, high) != region:
+                result.issues.append(f"{inst.mnemonic} at {address} may access outside of MEM region "
+                                     f"{region} ({low} to {high})")
+        if high >= FV1_DELAY_MEMORY_SIZE or low < 0:
+            result.issues.append(f"{inst.mnemonic} at {address} wraps around the end of delay memory")
+    if any(inst.mnemonic == 'RMPA' for inst in instructions):
+        result.issues.append("RMPA addresses are computed at run time and are not checked")
+    result.delay_memory_used = min(top, FV1_DELAY_MEMORY_SIZE)
+
+    return result
@@ -0,0 +1,214 @@
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import List, Optional
+
+from fv1_programmer.fv1 import FV1_PROGRAM_MAX_BYTES, FV1Program, source_hash, __version__
+from fv1_programmer.isa import program_length
+
+
+FV1_PROGRAMS_PER_BANK = 8
+FV1_BANK_MAX_BYTES = FV1_PROGRAMS_PER_BANK*FV1_PROGRAM_MAX_BYTES
+
+IMAGE_FILE_SUFFIXES = [".bin", ".hex"]
+
+# Bank .json files from version 2 store each program's binary next to its source
+BANK_FORMAT_VERSION = 2
+
+
+def read_image(filepath : Path, size : int=None, padding : int=0xFF) -> bytes:
+    """
+    Reads a binary EEPROM image from a .bin or .hex file. If `size` is given the
+    image is truncated or padded (with `padding`) to exactly `size` bytes.
+    """
+    suffix = filepath.suffix.lower()
+    if suffix == '.hex':
+        from eeprom.hexfile import read_hex
+        return bytes(read_hex(filepath, size, padding=padding))
+    elif suffix == '.bin':
+        with open(filepath, 'rb') as f:
+            data = f.read() if size is None else f.read(size)
+        if size is not None and len(data) < size:
+            data += bytes([padding]*(size - len(data)))
+        return data
+
+    raise ValueError(f"Don't know how to handle file suffix '{filepath.suffix}'")
+
+
+def write_image(filepath : Path, data : bytes, start_address : int=0, relative : bool=False,
+                suppressraw : bool=False) -> None:
+    """
+    Writes EEPROM contents read from `start_address` to a .bin, .hex or .json
+    file. A .json file holds the disassembly of each program slot (null for
+    erased slots), in the format saved by the user interface.
+    """
+    suffix = filepath.suffix.lower()
+    if suffix == '.bin':
+        with open(filepath, 'wb') as f:
+            f.write(data)
+    elif suffix == '.hex':
+        from eeprom.hexfile import write_hex
+        with open(filepath, 'w') as f:
+            write_hex(f, data, start_address)
+    elif suffix == '.json':
+        programs = []
+        first = start_address // FV1_PROGRAM_MAX_BYTES + 1
+        for program, data in enumerate(split_program_slots(data), start=first):
+            name = f"Program {slot_name(program)}"
+            if is_erased(data):
+                programs.append({"asm" : None, "name" : name, "slot" : program})
+                continue
+            fv1_program = FV1Program(None)
+            fv1_program.from_bytearray(bytearray(data), relative=relative, suppressraw=suppressraw)
+            # The binary read from the device is what the disassembly stands for, whatever the assembler options
+            fv1_program.set_assembled(data, program_length(data))
+            programs.append(dict(bank_entry(fv1_program, name, None), slot=program))
+        write_bank(filepath, programs, None)
+    else:
+        raise ValueError(f"Don't know how to handle file suffix '{filepath.suffix}'")
+
+
+def bank_entry(program : FV1Program, name : str, options : Optional[dict]) -> dict:
+    """
+    A program of a bank .json file: its name and source and, if it assembles
+    (with `options`), its binary, instruction count, source hash and delay
+    memory regions.
+    """
+    entry = {"name" : name, "asm" : program.asm}
+    if options is not None:
+        data, instructions, _, errors = program.assemble(**options)
+    elif program.assembled is not None:
+        data, instructions, _, errors = program.assembled[2]
+    else:
+        return entry
+    if data is not None and not len(errors):
+        entry.update({"hash" : source_hash(program.asm), "binary" : bytes(data).hex()})
+        # Left out if unknown, read_bank() then counts it from the binary
+        if instructions is not None:
+            entry["instructions"] = instructions
+        if program.delay_memory is not None:
+            entry["delay_memory"] = program.delay_memory
+    return entry
+
+
+def write_bank(filepath : Path, programs : List[Optional[dict]], options : Optional[dict]) -> None:
+    """
+    Writes a bank .json file of bank_entry() programs (None for empty slots)
+    assembled with `options` (None if the binaries were read from a device).
+    """
+    import json
+    d = {"format_version" : BANK_FORMAT_VERSION, "tool_version" : __version__, "assembler" : options,
+         "programs" : programs}
+    with open(filepath, 'w') as f:
+        json.dump(d, f, indent=2)
+
+
+@dataclass
+class BankFile:
+    """The programs of a bank .json file"""
+    # None for empty slots
+    programs : List[Optional[FV1Program]]
+    names : List[Optional[str]]
+    # The assembler options of the stored binaries (None for older files and device dumps)
+    options : Optional[dict] = None
+    # The slot each program was read from (device dumps only, None otherwise)
+    slots : List[Optional[int]] = field(default_factory=list)
+
+
+def read_bank(filepath : Path) -> BankFile:
+    """
+    Reads a bank .json file. A program may give its source as "asm" or as the
+    "path" of an .spn file (relative to the .json file). Binaries stored with
+    an unchanged source are kept, so the program isn't assembled again unless
+    its source or the assembler options differ.
+    """
+    import json
+    with open(filepath, 'r') as f:
+        d = json.load(f)
+    bank = BankFile([], [], d.get("assembler", None))
+    for entry in d.get("programs", []):
+        if not isinstance(entry, dict):
+            bank.programs.append(FV1Program(entry) if isinstance(entry, str) else None)
+            bank.names.append(None)
+            bank.slots.append(None)
+            continue
+        asm = entry.get("asm", None)
+        if asm is None and entry.get("path", None) is not None:
+            with open(filepath.parent / entry["path"], 'r') as spn:
+                asm = spn.read()
+        program = FV1Program(asm) if asm is not None else None
+        if program is not None and entry.get("binary", None) is not None and entry.get("hash", None) == source_hash(asm):
+            delay_memory = entry.get("delay_memory", None)
+            program.set_assembled(bytes.fromhex(entry["binary"]), entry.get("instructions", None), bank.options,
+                                  {name : tuple(region) for name, region in delay_memory.items()}
+                                  if delay_memory is not None else None)
+        bank.programs.append(program)
+        bank.names.append(entry.get("name", None))
+        bank.slots.append(entry.get("slot", None))
+    return bank
+
+
+def split_program_slots(data : bytes) -> List[bytes]:
+    """
+    Splits an EEPROM image into FV1_PROGRAM_MAX_BYTES program slots. A trailing
+    partial slot is padded with 0xFF (erased EEPROM).
+    """
+    slots = []
+    for offset in range(0, len(data), FV1_PROGRAM_MAX_BYTES):
+        slot = bytes(data[offset:offset + FV1_PROGRAM_MAX_BYTES])
+        if len(slot) < FV1_PROGRAM_MAX_BYTES:
+            slot += bytes([0xFF]*(FV1_PROGRAM_MAX_BYTES - len(slot)))
+        slots.append(slot)
+    return slots
+
+
+def is_erased(data : bytes, fill_byte : int=0xFF) -> bool:
+    """Returns True if `data` contains nothing but erased EEPROM bytes."""
+    return data.count(fill_byte) == len(data)
+
+
+def bank_address(bank : int) -> int:
+    """Returns the EEPROM address of bank `bank` (from 1)."""
+    return (bank - 1)*FV1_BANK_MAX_BYTES
+
+
+def num_banks(size : int) -> int:
+    """Returns the number of banks of 8 programs an EEPROM of `size` bytes holds."""
+    return max(1, -(-size // FV1_BANK_MAX_BYTES))
+
+
+def parse_slot(text : str) -> int:
+    """
+    Parses a program slot given as SLOT (1-8, in the first bank) or BANK:SLOT,
+    returning the program number counted across banks (bank 2, slot 1 is 9).
+    """
+    bank, _, slot = text.rpartition(':')
+    bank, slot = int(bank) if bank else 1, int(slot)
+    if bank < 1 or not 1 <= slot <= FV1_PROGRAMS_PER_BANK:
+        raise ValueError(f"Invalid program slot '{text}'")
+    return (bank - 1)*FV1_PROGRAMS_PER_BANK + slot
+
+
+def slot_name(program : int) -> str:
+    """Formats a program number as SLOT (first bank) or BANK:SLOT."""
+    bank, slot = divmod(program - 1, FV1_PROGRAMS_PER_BANK)
+    return f"{bank + 1}:{slot + 1}" if bank else str(slot + 1)
+
+
+def slot_address(program : int) -> int:
+    """Returns the EEPROM address of a program (numbered across banks, see parse_slot())."""
+    return (program - 1)*FV1_PROGRAM_MAX_BYTES
+
+
+def read_program(filepath : Path, program : int, padding : int=0xFF) -> bytes:
+    """
+    Reads a program from a .bin or .hex file. A file holding no more than
+    one program is used as is. A single bank image gives the program with
+    the same slot number in any bank; a multi-bank image gives the program
+    at its own address.
+    """
+    data = read_image(filepath, padding=padding)
+    if len(data) > FV1_PROGRAM_MAX_BYTES:
+        if len(data) <= FV1_BANK_MAX_BYTES:
+            program = (program - 1) % FV1_PROGRAMS_PER_BANK + 1
+        data = data[slot_address(program):slot_address(program) + FV1_PROGRAM_MAX_BYTES]
+    return split_program_slots(data)[0] if len(data) else bytes([padding]*FV1_PROGRAM_MAX_BYTES)
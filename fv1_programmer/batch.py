@@ -0,0 +1,95 @@
+import hashlib
+import json
+import logging
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Iterable, List
+
+from fv1_programmer.bank import IMAGE_FILE_SUFFIXES, read_image, split_program_slots, is_erased
+
+
+logger = logging.getLogger('batch')
+
+INDEX_FILENAME = "index.json"
+
+
+def slot_hash(data : bytes) -> str:
+    """Returns the content hash used to identify a program slot."""
+    return hashlib.sha256(data).hexdigest()
+
+
+def find_images(paths : Iterable[Path]) -> List[Path]:
+    """
+    Expands a list of files and directories into a sorted list of EEPROM image
+    files. Directories are searched recursively.
+    """
+    images = set()
+    for path in paths:
+        if path.is_dir():
+            images.update(p for p in path.rglob("*") if p.is_file() and p.suffix.lower() in IMAGE_FILE_SUFFIXES)
+        elif path.is_file():
+            images.add(path)
+        else:
+            raise ValueError(f"Invalid file path {str(path)}")
+    return sorted(images)
+
+
+def _disassemble_slot(job):
+    """Process pool entry point. Disassembles a single unique slot."""
+    from fv1_programmer.fv1 import FV1Program
+    digest, data, relative, suppressraw = job
+    program = FV1Program("")
+    warnings = program.from_bytearray(data, relative=relative, suppressraw=suppressraw)
+    return digest, program.assembly, warnings
+
+
+def batch_disassemble(paths : Iterable[Path], output_dir : Path,
+                      relative : bool=False, suppressraw : bool=False,
+                      max_workers : int=None, include_erased : bool=False) -> dict:
+    """
+    Disassembles every program slot in the given EEPROM images. Identical slots
+    are only disassembled once: each unique slot is written to
+    `output_dir/<hash>.spn` and `output_dir/index.json` maps every hash to the
+    files and slots it was found in. Returns the index.
+    """
+    index = {"programs" : {}, "files" : {}}
+    unique = {}
+
+    for image_path in find_images(paths):
+        try:
+            data = read_image(image_path)
+        except Exception as e:
+            logger.warning(f"Skipping {str(image_path)}: {e}")
+            continue
+
+        slot_hashes = []
+        for slot_number, slot in enumerate(split_program_slots(data), start=1):
+            if not include_erased and is_erased(slot):
+                slot_hashes.append(None)
+                continue
+            digest = slot_hash(slot)
+            slot_hashes.append(digest)
+            if digest not in unique:
+                unique[digest] = slot
+                index["programs"][digest] = {"listing" : f"{digest}.spn", "occurrences" : []}
+            index["programs"][digest]["occurrences"].append({"file" : str(image_path), "slot" : slot_number})
+        index["files"][str(image_path)] = slot_hashes
+
+    output_dir.mkdir(parents=True, exist_ok=True)
+    jobs = [(digest, data, relative, suppressraw) for digest, data in unique.items()]
+    chunksize = max(1, len(jobs) // (4*(max_workers or 8)))
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        for digest, listing, warnings in executor.map(_disassemble_slot, jobs, chunksize=chunksize):
+            entry = index["programs"][digest]
+            entry["warnings"] = warnings
+            first = entry["occurrences"][0]
+            with open(output_dir / entry["listing"], 'w') as f:
+                f.write(f"; {digest}\n")
+                f.write(f"; First seen in {first['file']} (slot {first['slot']}), "
+                        f"{len(entry['occurrences'])} occurrence(s)\n")
+                f.write(listing)
+
+    with open(output_dir / INDEX_FILENAME, 'w') as f:
+        json.dump(index, f, indent=2)
+
+    return index
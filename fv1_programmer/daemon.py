@@ -0,0 +1,342 @@
+import itertools
+import json
+import queue
+import threading
+import time
+from dataclasses import dataclass, field
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Optional
+
+from eeprom.eeprom import TransferProgress, OperationCancelled
+
+
+DEFAULT_PORT = 8722
+JOB_TYPES = ("program", "verify", "read")
+FINISHED_STATES = ("done", "failed", "cancelled")
+# Finished jobs kept for status queries
+MAX_FINISHED_JOBS = 1000
+
+
+@dataclass
+class Job:
+    """
+    A program, verify or read of one EEPROM region on a station. Jobs with a
+    higher `priority` run first, jobs of equal priority run in order.
+    """
+    id : int
+    station : str
+    type : str
+    address : int = 0
+    data : bytes = None
+    size : int = None
+    verify : bool = True
+    priority : int = 0
+    state : str = "queued"
+    progress : float = 0.0
+    message : str = ""
+    result : bytes = None
+    submitted : float = field(default_factory=time.time)
+    started : float = None
+    finished : float = None
+    cancel_requested : bool = False
+
+    def status(self) -> dict:
+        d = {"id" : self.id, "station" : self.station, "type" : self.type, "state" : self.state,
+             "priority" : self.priority, "address" : self.address, "progress" : round(self.progress, 3),
+             "message" : self.message, "submitted" : self.submitted, "started" : self.started,
+             "finished" : self.finished}
+        if self.result is not None:
+            d["data"] = self.result.hex()
+        return d
+
+
+class Station(object):
+    """
+    A programmer session that stays open: one EEPROM (and its adaptor) with
+    a priority queue of jobs run by a worker thread.
+    """
+    def __init__(self, name : str, eeprom, adaptor=None, on_change=None) -> None:
+        self.name = name
+        self.eeprom = eeprom
+        self.adaptor = adaptor
+        self.on_change = on_change
+        self.queue = queue.PriorityQueue()
+        self.current = None
+        self.counters = {"completed" : 0, "failed" : 0, "cancelled" : 0,
+                         "bytes_written" : 0, "bytes_read" : 0, "busy_time" : 0.0}
+        self.started = time.time()
+        self._order = itertools.count()
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def start(self) -> None:
+        if self.adaptor is not None:
+            self.adaptor.open()
+        self._thread = threading.Thread(target=self._run, name=f"station-{self.name}", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self.queue.put((float("inf"), next(self._order), None))
+        if self._thread is not None:
+            self._thread.join()
+        if self.adaptor is not None:
+            self.adaptor.close()
+
+    def submit(self, job : Job) -> None:
+        self.queue.put((-job.priority, next(self._order), job))
+
+    def cancel(self, job : Job) -> None:
+        """Cancels a queued job, or stops a running one at the next page boundary"""
+        with self._lock:
+            job.cancel_requested = True
+            if job.state != "queued":
+                return
+            job.state, job.finished = "cancelled", time.time()
+            self.counters["cancelled"] += 1
+        self._changed(job)
+
+    def _changed(self, job : Job) -> None:
+        if self.on_change is not None:
+            self.on_change(job)
+
+    def _run(self) -> None:
+        while True:
+            _, _, job = self.queue.get()
+            if job is None:
+                return
+            with self._lock:
+                if job.state == "cancelled":
+                    continue
+                self.current = job
+                job.state, job.started = "running", time.time()
+            self._changed(job)
+            try:
+                self._execute(job)
+            except OperationCancelled as e:
+                job.state, job.message = "cancelled", str(e)
+            except Exception as e:
+                job.state, job.message = "failed", str(e)
+            with self._lock:
+                job.finished = time.time()
+                self.current = None
+                self.counters["busy_time"] += job.finished - job.started
+                self.counters[{"done" : "completed"}.get(job.state, job.state)] += 1
+            self._changed(job)
+
+    def _count(self, counter : str, value) -> None:
+        with self._lock:
+            self.counters[counter] += value
+
+    def _execute(self, job : Job) -> None:
+        def update(event):
+            job.progress = event.fraction
+            self._changed(job)
+
+        progress = TransferProgress(callback=update, is_cancelled=lambda: job.cancel_requested)
+        ee = self.eeprom
+        if job.type == "program":
+            progress.expect(len(job.data)*(2 if job.verify else 1))
+            ee.write(job.address, job.data, progress)
+            self._count("bytes_written", len(job.data))
+            if job.verify:
+                verified = ee.verify(job.address, job.data, progress)
+                self._count("bytes_read", len(job.data))
+                if not verified:
+                    raise RuntimeError("Verify failed")
+            job.message = f"Wrote {len(job.data)} bytes at 0x{job.address:04x}"
+        elif job.type == "verify":
+            progress.expect(len(job.data))
+            actual = ee.read(job.address, len(job.data), progress, operation="verify")
+            self._count("bytes_read", len(job.data))
+            mismatches = sum(1 for a, b in zip(actual, job.data) if a != b)
+            if mismatches:
+                raise RuntimeError(f"{mismatches} bytes differ")
+            job.message = f"Verified {len(job.data)} bytes at 0x{job.address:04x}"
+        else:
+            size = job.size if job.size is not None else ee.size - job.address
+            progress.expect(size)
+            job.result = ee.read(job.address, size, progress)
+            self._count("bytes_read", size)
+            job.message = f"Read {size} bytes at 0x{job.address:04x}"
+        job.state = "done"
+
+    def status(self) -> dict:
+        with self._lock:
+            counters = dict(self.counters)
+            current = self.current.id if self.current is not None else None
+        elapsed = max(time.time() - self.started, 1e-6)
+        counters["jobs_per_hour"] = round(3600*counters["completed"]/elapsed, 1)
+        counters["bytes_per_second"] = round((counters["bytes_written"] + counters["bytes_read"]) /
+                                             max(counters["busy_time"], 1e-6), 1)
+        counters["busy_time"] = round(counters["busy_time"], 3)
+        return {"name" : self.name, "queued" : self.queue.qsize(), "current" : current, "counters" : counters}
+
+
+class JobServer(object):
+    """Accepts jobs for a set of stations and tracks their status"""
+    def __init__(self, stations : Dict[str, Station]) -> None:
+        self.stations = stations
+        self.jobs = {}
+        self._ids = itertools.count(1)
+        self._lock = threading.Condition()
+        for station in stations.values():
+            station.on_change = self._job_changed
+
+    def start(self) -> None:
+        [station.start() for station in self.stations.values()]
+
+    def stop(self) -> None:
+        [station.stop() for station in self.stations.values()]
+
+    def _job_changed(self, job : Job) -> None:
+        with self._lock:
+            self._lock.notify_all()
+
+    def submit(self, request : dict) -> Job:
+        """Queues a job described by a request dict, raising ValueError if it is invalid"""
+        station = request.get("station", next(iter(self.stations)) if len(self.stations) == 1 else None)
+        if station not in self.stations:
+            raise ValueError(f"Unknown station '{station}'")
+        job_type = request.get("type")
+        if job_type not in JOB_TYPES:
+            raise ValueError(f"Job type must be one of {', '.join(JOB_TYPES)}")
+        data = bytes.fromhex(request["data"]) if request.get("data") is not None else None
+        if job_type != "read" and not data:
+            raise ValueError(f"A {job_type} job needs data")
+        address = int(request.get("address", 0))
+        size = request.get("size", None)
+        end = address + (len(data) if data is not None else int(size) if size is not None else 0)
+        if address < 0 or end > self.stations[station].eeprom.size:
+            raise ValueError("Job is outside of the EEPROM")
+
+        with self._lock:
+            job = Job(next(self._ids), station, job_type, address=address, data=data,
+                      size=int(size) if size is not None else None, verify=bool(request.get("verify", True)),
+                      priority=int(request.get("priority", 0)))
+            self.jobs[job.id] = job
+            finished = [j for j in self.jobs.values() if j.state in FINISHED_STATES]
+            for old in finished[:max(0, len(finished) - MAX_FINISHED_JOBS)]:
+                del self.jobs[old.id]
+        self.stations[station].submit(job)
+        return job
+
+    def cancel(self, job_id : int) -> Optional[Job]:
+        job = self.jobs.get(job_id)
+        if job is not None and job.state not in FINISHED_STATES:
+            self.stations[job.station].cancel(job)
+        return job
+
+    def wait(self, job : Job, last_status : dict, timeout : float=None) -> dict:
+        """Waits until a job's status differs from `last_status` (or `timeout` passes) and returns it"""
+        with self._lock:
+            self._lock.wait_for(lambda: job.status() != last_status, timeout=timeout)
+            return job.status()
+
+    def serve(self, host : str="127.0.0.1", port : int=DEFAULT_PORT) -> ThreadingHTTPServer:
+        """Returns an HTTP server for the jobs API (call serve_forever() on it)"""
+        server = ThreadingHTTPServer((host, port), _RequestHandler)
+        server.daemon_threads = True
+        server.jobs = self
+        return server
+
+
+class _RequestHandler(BaseHTTPRequestHandler):
+    """
+    The jobs API:
+        POST   /jobs             submit a job, returns its status
+        GET    /jobs             status of every job
+        GET    /jobs/ID          status of a job
+        GET    /jobs/ID/events   newline delimited status updates until the job finishes
+        DELETE /jobs/ID          cancel a job
+        GET    /stations         station queues and throughput counters
+    """
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, value, code : int=200) -> None:
+        body = json.dumps(value).encode()
+        self.send_response(code)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _job(self, parts):
+        try:
+            job = self.server.jobs.jobs.get(int(parts[1]))
+        except ValueError:
+            job = None
+        if job is None:
+            self._send_json({"error" : "Unknown job"}, 404)
+        return job
+
+    def do_GET(self):
+        parts = self.path.strip("/").split("/")
+        jobs = self.server.jobs
+        if parts == ["stations"]:
+            self._send_json([station.status() for station in jobs.stations.values()])
+        elif parts == ["jobs"]:
+            self._send_json([job.status() for job in list(jobs.jobs.values())])
+        elif parts[0] == "jobs" and len(parts) == 2:
+            job = self._job(parts)
+            if job is not None:
+                self._send_json(job.status())
+        elif parts[0] == "jobs" and len(parts) == 3 and parts[2] == "events":
+            job = self._job(parts)
+            if job is None:
+                return
+            self.send_response(200)
+            self.send_header("Content-Type", "application/x-ndjson")
+            self.end_headers()
+            status = None
+            while status is None or status["state"] not in FINISHED_STATES:
+                status = jobs.wait(job, status, timeout=10.0)
+                self.wfile.write((json.dumps(status) + "\n").encode())
+                self.wfile.flush()
+        else:
+            self._send_json({"error" : "Not found"}, 404)
+
+    def do_POST(self):
+        if self.path.strip("/") != "jobs":
+            self._send_json({"error" : "Not found"}, 404)
+            return
+        try:
+            request = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))))
+            job = self.server.jobs.submit(request)
+        except (ValueError, TypeError, KeyError) as e:
+            self._send_json({"error" : str(e)}, 400)
+            return
+        self._send_json(job.status(), 201)
+
+    def do_DELETE(self):
+        parts = self.path.strip("/").split("/")
+        if parts[0] != "jobs" or len(parts) != 2:
+            self._send_json({"error" : "Not found"}, 404)
+            return
+        job = self._job(parts)
+        if job is not None:
+            self.server.jobs.cancel(job.id)
+            self._send_json(job.status())
+
+
+def submit_job(url : str, request : dict, on_status=None) -> dict:
+    """
+    Submits a job to a running server and follows its status until it
+    finishes, calling `on_status` with each update. Returns the final status.
+    """
+    import urllib.request
+    import urllib.error
+    url = url.rstrip("/")
+    post = urllib.request.Request(f"{url}/jobs", data=json.dumps(request).encode(), method="POST",
+                                  headers={"Content-Type" : "application/json"})
+    try:
+        with urllib.request.urlopen(post) as response:
+            status = json.loads(response.read())
+    except urllib.error.HTTPError as e:
+        raise ValueError(json.loads(e.read()).get("error", str(e)))
+    with urllib.request.urlopen(f"{url}/jobs/{status['id']}/events") as response:
+        for line in response:
+            status = json.loads(line)
+            if on_status is not None:
+                on_status(status)
+    return status
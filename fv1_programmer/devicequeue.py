@@ -0,0 +1,184 @@
+import itertools
+import threading
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Callable, Dict, List
+
+from eeprom.eeprom import TransferProgress, OperationCancelled
+
+
+FINISHED_STATES = ("done", "failed", "cancelled")
+
+
+@dataclass
+class DeviceOperation:
+    """
+    A read or write on a device. `run(eeprom, progress)` does the work and
+    returns its result. While queued, a later operation with the same `key`
+    (e.g. another write of the same slot) replaces this one's work and moves
+    it to the end of the queue instead of being queued as well, and its
+    progress is reported to both requests.
+    """
+    device : str
+    description : str
+    run : Callable
+    key : tuple = None
+    # Reports progress (shared by the operations of one request), created if None
+    progress : TransferProgress = None
+    # The progress of the later requests merged into this operation
+    merged_progress : List[TransferProgress] = field(default_factory=list)
+    id : int = 0
+    state : str = "queued"
+    result : object = None
+    error : Exception = None
+    # Number of later requests merged into this operation
+    coalesced : int = 0
+    cancel_requested : bool = False
+
+    @property
+    def finished(self) -> bool:
+        return self.state in FINISHED_STATES
+
+
+class DeviceQueue(object):
+    """
+    Runs device operations in the order they were submitted, one at a time
+    per device, so nothing else touches the bus in the middle of a page
+    write. `open_device(device)` returns the EEPROM for a device name (kept
+    open until its queue is empty) and `on_change(operation)` is called, from
+    the worker thread, whenever an operation changes state.
+    """
+    def __init__(self, open_device : Callable, on_change : Callable=None) -> None:
+        self.open_device = open_device
+        self.on_change = on_change
+        self._queues : Dict[str, deque] = {}
+        self._current : Dict[str, DeviceOperation] = {}
+        self._workers : Dict[str, threading.Thread] = {}
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+
+    def submit(self, operation : DeviceOperation) -> DeviceOperation:
+        """Queues an operation, returning it (or the queued operation it was merged into)"""
+        with self._lock:
+            queue = self._queues.setdefault(operation.device, deque())
+            queued = next((op for op in queue if operation.key is not None and op.key == operation.key), None)
+            if queued is not None:
+                # Run where the newest request would have, after everything submitted before it
+                queue.remove(queued)
+                queue.append(queued)
+                queued.run, queued.description = operation.run, operation.description
+                if operation.progress is not None and operation.progress is not queued.progress \
+                        and operation.progress not in queued.merged_progress:
+                    queued.merged_progress.append(operation.progress)
+                queued.coalesced += 1
+                operation = queued
+            else:
+                operation.id = next(self._ids)
+                queue.append(operation)
+                if operation.device not in self._workers:
+                    self._workers[operation.device] = threading.Thread(target=self._run, args=(operation.device,),
+                                                                       name=f"device-{operation.device}", daemon=True)
+                    self._workers[operation.device].start()
+        self._changed(operation)
+        return operation
+
+    def cancel(self, operations : List[DeviceOperation]=None,
+               progress : TransferProgress=None) -> List[DeviceOperation]:
+        """
+        Cancels queued operations and stops running ones at the next page
+        boundary (all of them if `operations` is None). If `progress` is
+        given, only the request reporting to it is cancelled: operations
+        other requests were merged into carry on for them without reporting
+        to `progress`, and are returned.
+        """
+        cancelled, detached = [], []
+        with self._lock:
+            for operation in (operations if operations is not None else self._pending()):
+                requested = progress is not None and \
+                    (operation.progress is progress or progress in operation.merged_progress)
+                if requested and operation.coalesced and not operation.finished:
+                    if operation.progress is progress:
+                        operation.progress = operation.merged_progress.pop(0) if len(operation.merged_progress) else None
+                    else:
+                        operation.merged_progress.remove(progress)
+                    operation.coalesced -= 1
+                    detached.append(operation)
+                    continue
+                operation.cancel_requested = True
+                queue = self._queues.get(operation.device, ())
+                if operation in queue:
+                    queue.remove(operation)
+                    operation.state = "cancelled"
+                    cancelled.append(operation)
+        [self._changed(operation) for operation in cancelled]
+        return detached
+
+    def pending(self) -> List[DeviceOperation]:
+        """The running and queued operations of every device"""
+        with self._lock:
+            return self._pending()
+
+    def _pending(self) -> List[DeviceOperation]:
+        return [op for op in self._current.values()] + [op for queue in self._queues.values() for op in queue]
+
+    def wait(self, timeout : float=None) -> bool:
+        """Waits until every queue is empty, returning False on timeout"""
+        for worker in list(self._workers.values()):
+            worker.join(timeout)
+        return not len(self._workers)
+
+    def _changed(self, operation : DeviceOperation) -> None:
+        if self.on_change is not None:
+            self.on_change(operation)
+
+    def _run(self, device : str) -> None:
+        eeprom = None
+        while True:
+            with self._lock:
+                queue = self._queues[device]
+                if not len(queue):
+                    del self._workers[device]
+                    return
+                operation = queue.popleft()
+                self._current[device] = operation
+                operation.state = "running"
+            self._changed(operation)
+
+            progress = _OperationProgress(operation)
+            try:
+                if eeprom is None:
+                    eeprom = self.open_device(device)
+                operation.result = operation.run(eeprom, progress)
+                operation.state = "done"
+            except OperationCancelled as e:
+                operation.error, operation.state = e, "cancelled"
+            except Exception as e:
+                operation.error, operation.state = e, "failed"
+                # Open the device again for the next operation
+                eeprom = None
+            with self._lock:
+                del self._current[device]
+            self._changed(operation)
+
+
+class _OperationProgress(TransferProgress):
+    """The progress of a running operation, reported to every request merged into it"""
+    def __init__(self, operation : DeviceOperation) -> None:
+        super().__init__(is_cancelled=lambda: operation.cancel_requested)
+        self.device_operation = operation
+
+    @property
+    def targets(self) -> List[TransferProgress]:
+        # Requests can be cancelled (and stop following) while the operation runs
+        operation = self.device_operation
+        return ([operation.progress] if operation.progress is not None else []) + list(operation.merged_progress)
+
+    def expect(self, num_bytes : int) -> None:
+        super().expect(num_bytes)
+        for target in self.targets:
+            target.expect(num_bytes)
+
+    def advance(self, operation : str, num_bytes : int) -> None:
+        super().advance(operation, num_bytes)
+        for target in self.targets:
+            target.advance(operation, num_bytes)
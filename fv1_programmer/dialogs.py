@@ -4,7 +4,7 @@ from textual import on
 from textual.reactive import reactive
 from textual.app import ComposeResult
 from textual.binding import Binding
-from textual.containers import Grid, Vertical
+from textual.containers import Grid, Horizontal, Vertical
 from textual.widgets import (
     Static,
     Button,
@@ -12,6 +12,7 @@ from textual.widgets import (
     Label,
     LoadingIndicator,
     Input,
+    ProgressBar,
 )
 
 from pathlib import Path
@@ -47,16 +48,56 @@ class YesNoScreen(ModalScreen[bool]):
 
 
 class BusyScreen(ModalScreen):
-    def __init__(self, message : str) -> None:
+    """
+    Shown while a long operation runs. If `on_cancel` is given the operation
+    reports its progress through update_progress() and can be cancelled. If
+    `on_hide` is given the screen can also be closed while the operation
+    carries on in the background.
+    """
+    def __init__(self, message : str, on_cancel=None, on_hide=None) -> None:
         self.message = message
+        self.on_cancel = on_cancel
+        self.on_hide = on_hide
         super().__init__()
 
     def compose(self) -> ComposeResult:
-        yield Grid(
-            Label(self.message),
-            LoadingIndicator(),
-            id="busyscreen"
-        )
+        if self.on_cancel is None:
+            yield Grid(
+                Label(self.message),
+                LoadingIndicator(),
+                id="busyscreen"
+            )
+        else:
+            yield Grid(
+                Label(self.message),
+                ProgressBar(total=100, show_eta=False, id="busyprogress"),
+                Label("", id="busystatus"),
+                Horizontal(
+                    Button("Cancel", variant="error", id="busycancel"),
+                    *([Button("Background", variant="primary", id="busyhide")] if self.on_hide is not None else []),
+                    id="busybuttons",
+                ),
+                id="busyscreen",
+                classes="-progress",
+            )
+
+    def update_progress(self, event) -> None:
+        """Shows an eeprom.ProgressEvent"""
+        self.query_one(ProgressBar).update(progress=100*event.fraction)
+        eta = f", {event.eta:.1f}s left" if event.eta is not None else ""
+        self.query_one("#busystatus", Label).update(f"{event.operation.capitalize()}: {event.done}/{event.total} bytes "
+                                                    f"({event.rate/1024:.1f} kB/s{eta})")
+
+    @on(Button.Pressed, "#busycancel")
+    def cancel(self):
+        self.query_one("#busycancel", Button).disabled = True
+        self.query_one("#busystatus", Label).update("Cancelling...")
+        self.on_cancel()
+
+    @on(Button.Pressed, "#busyhide")
+    def hide(self):
+        self.app.pop_screen()
+        self.on_hide()
 
 
 class FilteredDirectoryTree(DirectoryTree):
@@ -113,7 +154,7 @@ class SaveFileScreen(ModalScreen[Path]):
 
     def compose(self) -> ComposeResult:
         yield Grid(
-            Static("Please specify a filename:", id="fileselectlabel"),
+            Static("Please specify a filename (.json, or .hex/.bin for an EEPROM image):", id="fileselectlabel"),
             Input("my_programs", id="filesavefilename"),
             Button("Cancel", variant="error", id="filedialogcancel"),
             Button("Save", variant="primary", id="filedialogselect"),
@@ -1,19 +1,58 @@
-from asfv1.asfv1 import fv1parse, ASFV1Error
-from disfv1.disfv1 import fv1deparse
-from typing import Tuple
+import hashlib
+from typing import Optional, Tuple
 
+from fv1_programmer.isa import program_length
+
+
+__version__ = "0.5.2"
 
 FV1_PROGRAM_MAX_BYTES = 512
 
+
+def source_hash(asm : str) -> str:
+    """Identifies the source of a program (stored with its binary in bank files)"""
+    return hashlib.sha256(asm.encode()).hexdigest()
+
+
 class FV1Program(object):
     def __init__(self, asm) -> None:
         self.asm = asm
+        # Delay memory regions (name -> (address, length)) found by the last assemble()
+        self.delay_memory = None
+        # (source hash, assembler options, result, delay memory) of the last assemble()
+        self.assembled = None
 
-    def assemble(self, clamp=True, spinreals=False) -> Tuple[bytearray, str, str]:
+    def set_assembled(self, binary : bytes, instructions : Optional[int], options : dict=None, delay_memory : dict=None) -> None:
+        """
+        Provides the binary of the current source (e.g. from a bank file), so
+        assemble() returns it without running the assembler as long as the
+        source hasn't changed and the options match (any options if None).
+        If `instructions` is None (unknown) it is counted from the binary.
+        """
+        if instructions is None:
+            instructions = program_length(binary)
+        self.delay_memory = delay_memory
+        self.assembled = (source_hash(self.asm), options, (bytearray(binary), instructions, [], []), delay_memory)
+
+    def assemble(self, clamp=True, spinreals=False, optimize=False) -> Tuple[bytearray, str, str]:
         """
         Assembles our internal asm to a bytearray, returning any errors and warnings
-        as concatenated strings.
+        as concatenated strings. If `optimize` is set the assembled program is run
+        through the peephole optimizer.
         """
+        # Only run the assembler if the source or the options changed
+        options = {"clamp" : clamp, "spinreals" : spinreals, "optimize" : optimize}
+        digest = source_hash(self.asm)
+        if self.assembled is None or self.assembled[0] != digest or self.assembled[1] not in (None, options):
+            self.delay_memory = None
+            result = self._assemble(clamp, spinreals, optimize)
+            self.assembled = (digest, options, result, self.delay_memory)
+        self.delay_memory = self.assembled[3]
+        program, icnt, warnings, errors = self.assembled[2]
+        return bytearray(program) if program is not None else None, icnt, list(warnings), list(errors)
+
+    def _assemble(self, clamp, spinreals, optimize):
+        from asfv1.asfv1 import fv1parse, ASFV1Error
         warnings = []
         errors = []
 
@@ -39,6 +78,21 @@ class FV1Program(object):
                 errors = [f"An unknown error occurred on line {fp.sline}"]
             return None, fp.icnt, warnings, errors
 
+        # asfv1 records each MEM declaration as NAME, NAME# (end) and NAME^ (middle)
+        self.delay_memory = {name : (address, fp.symtbl[name + '#'] - address)
+                             for name, address in fp.symtbl.items()
+                             if name + '#' in fp.symtbl and name + '^' in fp.symtbl}
+
+        if optimize and fp.icnt > 0:
+            from fv1_programmer.optimizer import optimize as optimize_program
+            result = optimize_program(fp.program)
+            if not result.verified:
+                warnings.append("warning: Optimized program did not match the original, optimization skipped")
+            elif result.saved > 0:
+                warnings.append(f"info: Optimizer saved {result.saved} instructions "
+                                f"({result.instructions_before} -> {result.instructions_after})")
+            return result.program, result.instructions_after, warnings, errors
+
         return fp.program, fp.icnt, warnings, errors
 
     def from_bytearray(self, data : bytearray, relative=False, suppressraw=False) -> str:
@@ -46,6 +100,7 @@ class FV1Program(object):
         Disassembles a binary FV1 program and sets the internal asm property to
         the disassembled output. Returns any warnings in a concatenated string.
         """
+        from disfv1.disfv1 import fv1deparse
         warnings = []
 
         def warning(msg):
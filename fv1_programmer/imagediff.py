@@ -0,0 +1,92 @@
+import difflib
+from dataclasses import dataclass, field
+from typing import Dict, List
+
+from fv1_programmer.fv1 import FV1_PROGRAM_MAX_BYTES, FV1Program
+
+
+# Worst case internal write cycle time of the 24LC32A (and most other I2C EEPROMs)
+PAGE_WRITE_TIME = 0.005
+
+
+@dataclass
+class ImageDiff:
+    """The differences between the EEPROM contents and a target image"""
+    page_size : int
+    # Addresses of the pages that differ
+    pages : List[int] = field(default_factory=list)
+    # Program slots that differ (numbered across banks, see bank.parse_slot())
+    slots : List[int] = field(default_factory=list)
+    num_bytes : int = 0
+
+    @property
+    def page_ranges(self) -> List[str]:
+        """Differing pages as a list of address ranges"""
+        ranges = []
+        for page in self.pages:
+            if len(ranges) and ranges[-1][1] == page:
+                ranges[-1][1] = page + self.page_size
+            else:
+                ranges.append([page, page + self.page_size])
+        return [f"0x{start:04x}-0x{end - 1:04x}" for start, end in ranges]
+
+
+def diff_image(current : bytes, target : Dict[int, bytes], page_size : int, base : int=0) -> ImageDiff:
+    """
+    Compares the EEPROM contents `current` (read from address `base`) with
+    `target`, a map of address -> data to be written there (addresses not
+    covered by `target` are ignored). Slots are numbered across banks.
+    """
+    result = ImageDiff(page_size)
+    pages, slots = set(), set()
+    for address, data in target.items():
+        for offset, byte in enumerate(data):
+            index = address + offset - base
+            if 0 <= index < len(current) and current[index] == byte:
+                continue
+            result.num_bytes += 1
+            pages.add((address + offset) - (address + offset) % page_size)
+            slots.add((address + offset)//FV1_PROGRAM_MAX_BYTES + 1)
+    result.pages, result.slots = sorted(pages), sorted(slots)
+    return result
+
+
+def write_changed_pages(eeprom, address : int, data : bytes, current : bytes=None, verify : bool=False,
+                        progress=None) -> List[int]:
+    """
+    Writes only the pages of `data` (to be written at `address`) that differ
+    from `current`, what the EEPROM is known to hold there (read from the
+    EEPROM if None). Returns the addresses of the pages written.
+    """
+    if current is None or len(current) != len(data):
+        current = eeprom.read(address, len(data))
+    pages = diff_image(current, {address : data}, eeprom.page_size, base=address).pages
+    for page in pages:
+        # The first and last pages may extend beyond `data`
+        start, end = max(page, address), min(page + eeprom.page_size, address + len(data))
+        chunk = data[start - address:end - address]
+        eeprom.write(start, chunk, progress)
+        if verify and not eeprom.verify(start, chunk, progress):
+            raise ValueError(f"EEPROM page 0x{page:04x} failed verification!")
+    return pages
+
+
+def estimate_write_time(num_bytes : int, page_size : int, bytes_per_second : float,
+                        page_write_time : float=PAGE_WRITE_TIME) -> float:
+    """
+    Estimates the time taken to write `num_bytes` (whole pages), given the bus
+    throughput measured when reading and the EEPROM's internal write time.
+    """
+    num_pages = -(-num_bytes // page_size)
+    return num_bytes/bytes_per_second + num_pages*page_write_time
+
+
+def disassembly_diff(current : bytes, target : bytes, current_name : str="device", target_name : str="target",
+                     relative : bool=False, suppressraw : bool=False) -> List[str]:
+    """Returns a unified diff of the disassembly of two programs"""
+    listings = []
+    for data in (current, target):
+        program = FV1Program(None)
+        program.from_bytearray(bytearray(data), relative=relative, suppressraw=suppressraw)
+        listings.append(program.asm.splitlines())
+    return list(difflib.unified_diff(listings[0], listings[1], fromfile=current_name, tofile=target_name, lineterm=""))
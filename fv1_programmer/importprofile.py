@@ -0,0 +1,66 @@
+import atexit
+import builtins
+import importlib.util
+import sys
+import time
+
+
+_original_import = builtins.__import__
+# Module name -> [cumulative seconds, self seconds, nesting depth, order]
+_records = {}
+_stack = []
+_start = None
+
+
+def _resolve(name, globals, level):
+    if level == 0:
+        return name
+    package = (globals or {}).get('__package__') or ''
+    try:
+        return importlib.util.resolve_name('.'*level + name, package)
+    except (ImportError, ValueError):
+        return name
+
+
+def _profiled_import(name, globals=None, locals=None, fromlist=(), level=0):
+    module_name = _resolve(name, globals, level)
+    if module_name in sys.modules:
+        return _original_import(name, globals, locals, fromlist, level)
+
+    _stack.append(0.0)
+    start = time.perf_counter()
+    try:
+        return _original_import(name, globals, locals, fromlist, level)
+    finally:
+        elapsed = time.perf_counter() - start
+        children = _stack.pop()
+        if _stack:
+            _stack[-1] += elapsed
+        if module_name not in _records:
+            _records[module_name] = [elapsed, elapsed - children, len(_stack), len(_records)]
+
+
+def install() -> None:
+    """
+    Starts timing every module imported from now on. A report of the slowest
+    imports is printed to stderr when the program exits.
+    """
+    global _start
+    if builtins.__import__ is _profiled_import:
+        return
+    _start = time.perf_counter()
+    builtins.__import__ = _profiled_import
+    atexit.register(report)
+
+
+def report(limit : int=40, file=None) -> None:
+    """Prints the imports that took longest (cumulative time, including their own imports)."""
+    file = file if file is not None else sys.stderr
+    total = time.perf_counter() - _start if _start is not None else 0.0
+    top_level = sum(r[0] for r in _records.values() if r[2] == 0)
+    print(f"Import profile: {len(_records)} modules imported in {top_level*1000:.1f} ms "
+          f"({total*1000:.1f} ms since start)", file=file)
+    print(f"{'cumulative':>12} {'self':>10}  module", file=file)
+    slowest = sorted(_records.items(), key=lambda r: r[1][0], reverse=True)[:limit]
+    for name, (cumulative, own, depth, _) in sorted(slowest, key=lambda r: r[1][3]):
+        print(f"{cumulative*1000:9.1f} ms {own*1000:7.1f} ms  {'  '*depth}{name}", file=file)
@@ -0,0 +1,199 @@
+import struct
+from typing import Iterable, List, NamedTuple
+
+
+FV1_PROGRAM_LENGTH = 128
+FV1_DELAY_MEMORY_SIZE = 32768
+FV1_NUM_REGISTERS = 32
+
+# Special function registers
+SIN0_RATE, SIN0_RANGE, SIN1_RATE, SIN1_RANGE = 0x00, 0x01, 0x02, 0x03
+RMP0_RATE, RMP0_RANGE, RMP1_RATE, RMP1_RANGE = 0x04, 0x05, 0x06, 0x07
+POT0, POT1, POT2 = 0x10, 0x11, 0x12
+ADCL, ADCR, DACL, DACR = 0x14, 0x15, 0x16, 0x17
+ADDR_PTR = 0x18
+REG0 = 0x20
+
+REGISTER_NAMES = {
+    SIN0_RATE : "SIN0_RATE", SIN0_RANGE : "SIN0_RANGE", SIN1_RATE : "SIN1_RATE", SIN1_RANGE : "SIN1_RANGE",
+    RMP0_RATE : "RMP0_RATE", RMP0_RANGE : "RMP0_RANGE", RMP1_RATE : "RMP1_RATE", RMP1_RANGE : "RMP1_RANGE",
+    POT0 : "POT0", POT1 : "POT1", POT2 : "POT2",
+    ADCL : "ADCL", ADCR : "ADCR", DACL : "DACL", DACR : "DACR",
+    ADDR_PTR : "ADDR_PTR",
+}
+REGISTER_NAMES.update({REG0 + i : f"REG{i}" for i in range(FV1_NUM_REGISTERS)})
+
+LFO_NAMES = ["SIN0", "SIN1", "RMP0", "RMP1"]
+
+# SKP condition flags
+SKP_RUN, SKP_ZRC, SKP_ZRO, SKP_GEZ, SKP_NEG = 0x10, 0x08, 0x04, 0x02, 0x01
+
+# CHO types and flags
+CHO_RDA, CHO_SOF, CHO_RDAL = 0x00, 0x02, 0x03
+CHO_COS, CHO_REG, CHO_COMPC, CHO_COMPA, CHO_RPTR2, CHO_NA = 0x01, 0x02, 0x04, 0x08, 0x10, 0x20
+
+# Machine instruction table (mirrors asfv1/disfv1)
+# opcode: [mnemonic, (mask, left shift), ...]
+_OP_TABLE = {
+    0x00 : ['RDA', (0x7fff, 5), (0x7ff, 21)],
+    0x01 : ['RMPA', (0x7ff, 21)],
+    0x02 : ['WRA', (0x7fff, 5), (0x7ff, 21)],
+    0x03 : ['WRAP', (0x7fff, 5), (0x7ff, 21)],
+    0x04 : ['RDAX', (0x3f, 5), (0xffff, 16)],
+    0x05 : ['RDFX', (0x3f, 5), (0xffff, 16)],
+    0x06 : ['WRAX', (0x3f, 5), (0xffff, 16)],
+    0x07 : ['WRHX', (0x3f, 5), (0xffff, 16)],
+    0x08 : ['WRLX', (0x3f, 5), (0xffff, 16)],
+    0x09 : ['MAXX', (0x3f, 5), (0xffff, 16)],
+    0x0A : ['MULX', (0x3f, 5)],
+    0x0B : ['LOG', (0xffff, 16), (0x7ff, 5)],
+    0x0C : ['EXP', (0xffff, 16), (0x7ff, 5)],
+    0x0D : ['SOF', (0xffff, 16), (0x7ff, 5)],
+    0x0E : ['AND', (0xffffff, 8)],
+    0x0F : ['OR', (0xffffff, 8)],
+    0x10 : ['XOR', (0xffffff, 8)],
+    0x11 : ['SKP', (0x1f, 27), (0x3f, 21)],
+    0x12 : ['WLDS', (0x1, 29), (0x1ff, 20), (0x7fff, 5)],
+    0x13 : ['JAM', (0x3, 6)],
+    0x14 : ['CHO', (0x3, 30), (0x3, 21), (0x3f, 24), (0xffff, 5)],
+}
+_WLDR = ['WLDR', (0x3, 29), (0xffff, 13), (0x3, 5)]
+_OPCODES = {v[0] : k for k, v in _OP_TABLE.items()}
+_OPCODES['WLDR'] = 0x12
+
+
+class Instruction(NamedTuple):
+    """
+    A decoded FV-1 machine instruction. `args` holds the raw (unsigned) bit
+    fields in asfv1 operand order and `word` the 32-bit machine code.
+    """
+    mnemonic : str
+    args : tuple
+    word : int
+
+    def __str__(self) -> str:
+        return f"{self.mnemonic} {','.join(hex(a) for a in self.args)}"
+
+
+def _fields(mnemonic):
+    return _WLDR[1:] if mnemonic == 'WLDR' else _OP_TABLE[_OPCODES[mnemonic]][1:]
+
+
+def make(mnemonic : str, *args) -> Instruction:
+    """Builds an instruction from its mnemonic and raw operand fields."""
+    if mnemonic == 'RAW':
+        return Instruction('RAW', (args[0] & 0xffffffff,), args[0] & 0xffffffff)
+    word = _OPCODES[mnemonic]
+    fields = _fields(mnemonic)
+    args = tuple(a & mask for a, (mask, _) in zip(args, fields))
+    for a, (mask, shift) in zip(args, fields):
+        word |= a << shift
+    return Instruction(mnemonic, args, word)
+
+
+NOP = make('SKP', 0, 0)
+
+
+def decode(word : int) -> Instruction:
+    """Decodes a single 32-bit machine instruction."""
+    opcode = word & 0x1f
+    if opcode not in _OP_TABLE:
+        return Instruction('RAW', (word,), word)
+    if opcode == 0x12 and word & 0x40000000:
+        mnemonic, fields = _WLDR[0], _WLDR[1:]
+    else:
+        mnemonic, fields = _OP_TABLE[opcode][0], _OP_TABLE[opcode][1:]
+    return Instruction(mnemonic, tuple((word >> shift) & mask for mask, shift in fields), word)
+
+
+def decode_program(data : bytes) -> List[Instruction]:
+    """Decodes a binary program (up to 128 big-endian words)."""
+    num_words = min(len(data) // 4, FV1_PROGRAM_LENGTH)
+    return [decode(w) for w in struct.unpack_from(f'>{num_words}I', data)]
+
+
+def program_length(data : bytes) -> int:
+    """Returns the number of instructions of a binary program, ignoring trailing NOPs."""
+    instructions = decode_program(data)
+    length = len(instructions)
+    while length > 0 and instructions[length - 1].word == NOP.word:
+        length -= 1
+    return length
+
+
+def encode_program(instructions : Iterable[Instruction]) -> bytearray:
+    """Encodes instructions to a 512-byte program, padding with NOPs."""
+    words = [i.word for i in instructions]
+    assert len(words) <= FV1_PROGRAM_LENGTH, "Program too long"
+    words += [NOP.word]*(FV1_PROGRAM_LENGTH - len(words))
+    return bytearray(struct.pack(f'>{FV1_PROGRAM_LENGTH}I', *words))
+
+
+def signed(value : int, bits : int) -> int:
+    """Sign-extends a `bits` wide two's complement field."""
+    return value - (1 << bits) if value & (1 << (bits - 1)) else value
+
+
+def skip_target(address : int, instruction : Instruction) -> int:
+    """Returns the address a SKP instruction at `address` jumps to."""
+    return address + instruction.args[1] + 1
+
+
+def lfos_used(instruction : Instruction) -> List[int]:
+    """Returns the LFOs (0-3 for SIN0, SIN1, RMP0, RMP1) an instruction uses."""
+    m, a = instruction.mnemonic, instruction.args
+    if m == 'CHO':
+        return [a[1]]
+    if m == 'JAM':
+        return [a[0] | 0x2]
+    if m == 'WLDS':
+        return [a[0]]
+    if m == 'WLDR':
+        return [a[0] | 0x2]
+    return []
+
+
+def uses_pacc(instruction : Instruction) -> bool:
+    """Returns True if an instruction depends on the previous ACC value."""
+    m, a = instruction.mnemonic, instruction.args
+    return m in ('WRHX', 'WRLX') or (m == 'SKP' and bool(a[0] & SKP_ZRC))
+
+
+def registers_read(instruction : Instruction) -> List[int]:
+    """Returns the registers an instruction reads."""
+    m, a = instruction.mnemonic, instruction.args
+    if m in ('RDAX', 'RDFX', 'MULX'):
+        return [a[0]]
+    if m == 'MAXX':
+        return [a[0]] if a[1] != 0 else []
+    if m == 'RMPA':
+        return [ADDR_PTR]
+    return []
+
+
+def registers_written(instruction : Instruction) -> List[int]:
+    """Returns the registers an instruction writes."""
+    m, a = instruction.mnemonic, instruction.args
+    if m in ('WRAX', 'WRHX', 'WRLX'):
+        return [a[0]]
+    if m == 'WLDS':
+        return [SIN0_RATE + 2*a[0], SIN0_RANGE + 2*a[0]]
+    if m == 'WLDR':
+        return [RMP0_RATE + 2*(a[0] & 1), RMP0_RANGE + 2*(a[0] & 1)]
+    return []
+
+
+def delay_address(instruction : Instruction):
+    """
+    Returns (address, is_write) for instructions accessing a fixed delay
+    memory address (CHO RDA addresses are the base of the LFO excursion),
+    otherwise None.
+    """
+    m, a = instruction.mnemonic, instruction.args
+    if m == 'RDA':
+        return a[0], False
+    if m in ('WRA', 'WRAP'):
+        return a[0], True
+    if m == 'CHO' and a[0] == CHO_RDA:
+        return a[3] & 0x7fff, False
+    return None
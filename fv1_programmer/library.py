@@ -0,0 +1,242 @@
+import hashlib
+import json
+import logging
+import os
+import re
+import sqlite3
+import threading
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Iterable, List, Tuple
+
+from fv1_programmer.bank import read_image, split_program_slots, is_erased
+
+
+logger = logging.getLogger('library')
+
+LIBRARY_FILE_SUFFIXES = [".spn", ".json", ".hex"]
+DEFAULT_LIBRARY_DB = Path.home() / ".fv1_programmer" / "library.sqlite3"
+
+_MAX_COMMENT_LENGTH = 500
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS files (
+    path TEXT PRIMARY KEY,
+    mtime_ns INTEGER NOT NULL,
+    size INTEGER NOT NULL,
+    hash TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS programs (
+    id INTEGER PRIMARY KEY,
+    path TEXT NOT NULL REFERENCES files(path) ON DELETE CASCADE,
+    slot INTEGER,
+    name TEXT NOT NULL,
+    hash TEXT NOT NULL,
+    instructions INTEGER NOT NULL,
+    comments TEXT NOT NULL,
+    search TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS programs_path ON programs(path);
+CREATE VIRTUAL TABLE IF NOT EXISTS programs_search USING fts5(search, content='programs', content_rowid='id');
+CREATE TRIGGER IF NOT EXISTS programs_insert AFTER INSERT ON programs BEGIN
+    INSERT INTO programs_search(rowid, search) VALUES (new.id, new.search);
+END;
+CREATE TRIGGER IF NOT EXISTS programs_delete AFTER DELETE ON programs BEGIN
+    INSERT INTO programs_search(programs_search, rowid, search) VALUES ('delete', old.id, old.search);
+END;
+"""
+# Version 2 added the full text search table
+_SCHEMA_VERSION = 2
+
+
+@dataclass
+class LibraryEntry:
+    """A single program in the library. `slot` is None for .spn files."""
+    path : Path
+    slot : int
+    name : str
+    hash : str
+    instructions : int
+    comments : str
+
+
+def _leading_comments(asm : str) -> str:
+    """Returns the comment block at the top of a SpinASM source."""
+    lines = []
+    for line in asm.splitlines():
+        stripped = line.strip()
+        if stripped.startswith(";"):
+            lines.append(stripped.lstrip(";").strip())
+        elif stripped:
+            break
+    return " ".join(l for l in lines if l)[:_MAX_COMMENT_LENGTH]
+
+
+def _count_instructions(asm : str) -> int:
+    from fv1_programmer.fv1 import FV1Program
+    _, num_instructions, _, _ = FV1Program(asm).assemble()
+    return num_instructions
+
+
+def _scan_file(path : Path, data : bytes) -> List[Tuple[int, str, str, int, str]]:
+    """
+    Extracts (slot, name, hash, instructions, comments) for every program in a
+    library file.
+    """
+    suffix = path.suffix.lower()
+    programs = []
+    if suffix == ".spn":
+        asm = data.decode(errors="replace")
+        programs.append((None, path.stem, hashlib.sha256(data).hexdigest(),
+                         _count_instructions(asm), _leading_comments(asm)))
+    elif suffix == ".json":
+        d = json.loads(data)
+        for i, prog in enumerate(d.get("programs", []), start=1):
+            if prog is None:
+                continue
+            asm = prog if isinstance(prog, str) else prog.get("asm", None)
+            if asm is None:
+                continue
+            name = prog.get("name", f"Program {i}") if isinstance(prog, dict) else f"Program {i}"
+            programs.append((i, name, hashlib.sha256(asm.encode()).hexdigest(),
+                             _count_instructions(asm), _leading_comments(asm)))
+    elif suffix == ".hex":
+        from fv1_programmer.fv1 import FV1Program
+        for i, slot in enumerate(split_program_slots(read_image(path)), start=1):
+            if is_erased(slot):
+                continue
+            warnings = FV1Program("").from_bytearray(slot)
+            counts = [int(m.group(1)) for m in (re.match(r"info: Read (\d+) instructions\.", w) for w in warnings) if m]
+            num_instructions = counts[0] if counts else 0
+            programs.append((i, f"{path.stem} {i}", hashlib.sha256(slot).hexdigest(), num_instructions, ""))
+    return programs
+
+
+class ProgramLibrary(object):
+    """
+    A persistent index of the .spn, .json and .hex programs found below a set
+    of root directories. Refreshing only re-reads files whose size or
+    modification time changed, and searches never touch the indexed files.
+    """
+    def __init__(self, db_path : Path=DEFAULT_LIBRARY_DB) -> None:
+        self.db_path = Path(db_path)
+        self._search_conn = threading.local()
+
+    @property
+    def exists(self) -> bool:
+        return self.db_path.is_file()
+
+    def _connect(self) -> sqlite3.Connection:
+        # Connections are not shared between threads, so the index can be
+        # refreshed by a worker while the UI thread searches it
+        if not self.exists:
+            logger.info(f"Creating the program library index {self.db_path}")
+            self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        conn = sqlite3.connect(str(self.db_path), timeout=10)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA foreign_keys=ON")
+        conn.executescript(_SCHEMA)
+        if conn.execute("PRAGMA user_version").fetchone()[0] < _SCHEMA_VERSION:
+            # Index the programs of an older index
+            with conn:
+                conn.execute("INSERT INTO programs_search(programs_search) VALUES ('rebuild')")
+                conn.execute(f"PRAGMA user_version={_SCHEMA_VERSION}")
+        return conn
+
+    @staticmethod
+    def _walk(roots : Iterable[Path]) -> Iterable[Path]:
+        for root in roots:
+            for dirpath, dirnames, filenames in os.walk(root):
+                dirnames[:] = [d for d in dirnames if not d.startswith(".")]
+                for filename in filenames:
+                    if Path(filename).suffix.lower() in LIBRARY_FILE_SUFFIXES and not filename.startswith("."):
+                        yield Path(dirpath, filename).resolve()
+
+    def refresh(self, roots : Iterable[Path], is_cancelled=lambda: False) -> Tuple[int, int]:
+        """
+        Brings the index up to date with the files below `roots`. Returns the
+        number of (re)indexed and removed files.
+        """
+        conn = self._connect()
+        try:
+            known = {row[0] : (row[1], row[2]) for row in conn.execute("SELECT path, mtime_ns, size FROM files")}
+            seen = set()
+            indexed = 0
+            for path in self._walk(roots):
+                if is_cancelled():
+                    return indexed, 0
+                key = str(path)
+                seen.add(key)
+                try:
+                    st = path.stat()
+                except OSError:
+                    continue
+                if known.get(key) == (st.st_mtime_ns, st.st_size):
+                    continue
+
+                try:
+                    data = path.read_bytes()
+                    digest = hashlib.sha256(data).hexdigest()
+                    programs = _scan_file(path, data)
+                except Exception as e:
+                    logger.debug(f"Not indexing {key}: {e}")
+                    programs = []
+                    digest = ""
+
+                with conn:
+                    conn.execute("DELETE FROM programs WHERE path = ?", (key,))
+                    conn.execute("INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?)",
+                                 (key, st.st_mtime_ns, st.st_size, digest))
+                    conn.executemany("INSERT INTO programs (path, slot, name, hash, instructions, comments, search) "
+                                     "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                                     [(key, slot, name, h, icnt, comments, f"{name} {path.name} {comments}".lower())
+                                      for slot, name, h, icnt, comments in programs])
+                indexed += 1
+
+            # Anything below one of our roots that we did not see is gone
+            resolved_roots = [Path(r).resolve() for r in roots]
+            removed = [(p,) for p in known if p not in seen and any(r in Path(p).parents for r in resolved_roots)]
+            with conn:
+                conn.executemany("DELETE FROM files WHERE path = ?", removed)
+            return indexed, len(removed)
+        finally:
+            conn.close()
+
+    def search(self, query : str, limit : int=20) -> List[LibraryEntry]:
+        """
+        Returns up to `limit` programs whose name, file name or comments have
+        a word starting with each word of `query`, best matches first.
+        """
+        words = query.lower().split()
+        if not words:
+            return []
+        # Each word is quoted so it can't be taken for FTS5 query syntax
+        match = " AND ".join('"' + w.replace('"', '""') + '"*' for w in words)
+        conn = getattr(self._search_conn, "conn", None)
+        if conn is None:
+            conn = self._search_conn.conn = self._connect()
+        rows = conn.execute("SELECT path, slot, name, hash, instructions, comments FROM programs "
+                            "WHERE id IN (SELECT rowid FROM programs_search WHERE programs_search MATCH ?) "
+                            "ORDER BY instr(lower(name), ?) = 0, length(name) LIMIT ?",
+                            (match, words[0], limit)).fetchall()
+        return [LibraryEntry(Path(path), slot, name, h, icnt, comments) for path, slot, name, h, icnt, comments in rows]
+
+    @staticmethod
+    def load(entry : LibraryEntry, relative : bool=False, suppressraw : bool=False) -> str:
+        """Reads the source of a library program from disk."""
+        suffix = entry.path.suffix.lower()
+        if suffix == ".spn":
+            with open(entry.path, 'r') as f:
+                return f.read()
+        elif suffix == ".json":
+            with open(entry.path, 'r') as f:
+                prog = json.load(f)["programs"][entry.slot - 1]
+            return prog if isinstance(prog, str) else prog["asm"]
+        elif suffix == ".hex":
+            from fv1_programmer.fv1 import FV1Program
+            program = FV1Program("")
+            program.from_bytearray(split_program_slots(read_image(entry.path))[entry.slot - 1],
+                                   relative=relative, suppressraw=suppressraw)
+            return program.assembly
+
+        raise ValueError(f"Don't know how to handle file suffix '{entry.path.suffix}'")
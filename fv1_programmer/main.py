@@ -3,10 +3,21 @@ from pathlib import Path
 import sys
 
 
+def __slot_argument(text):
+    from fv1_programmer.bank import parse_slot
+    try:
+        return parse_slot(text)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"invalid slot '{text}' (expected SLOT or BANK:SLOT)")
+
+
 def parse_command_line_arguments():
     parser = argparse.ArgumentParser()
     parser.add_argument('--i2c-address', default=0x50, type=lambda x: int(x, base=0),
                         help='The I2C address of the target EEPROM')
+    parser.add_argument('--targets', nargs='+', default=None, type=lambda x: int(x, base=0), metavar='ADDRESS',
+                        help='With --load-file, write the same image to the EEPROMs at each of these I2C addresses '
+                             'on the bus, interleaving page writes during each EEPROM\'s write cycle')
     parser.add_argument('--i2c-clock-speed', type=int, default=100000, choices=[47000, 100000, 400000],
                         help='The I2C clock speed to use')
     parser.add_argument('--ee-size', default=4096, type=int,
@@ -16,26 +27,152 @@ def parse_command_line_arguments():
     parser.add_argument('--pad-value', default=0xFF, type=lambda x: int(x, base=0) & 0xFF,
                         help='The padding byte value (when loading a .hex file)')
     parser.add_argument('--load-file', type=Path, default=None,
-                        help='If given, load the specified file (.hex or .bin) onto the device and exit')
+                        help='If given, load the specified file (.hex, .bin or a bank .json) onto the device and exit. '
+                             'With --slot only that program slot is written (from a program or bank image, or an .spn file). '
+                             'Programs in a .json file are written from their stored binaries unless their source changed')
     parser.add_argument('--save-file', type=Path, default=None,
-                        help='If given, read the entire contents of EEPROM, save to the specified file and exit')
+                        help='If given, read the entire contents of EEPROM (or just --slot or --bank), save to the specified file '
+                             '(.bin, .hex or .json with the disassembly of each program) and exit')
+    parser.add_argument('--verify-file', type=Path, default=None,
+                        help='If given, compare the contents of EEPROM (or just --slot) with the specified file and exit')
+    parser.add_argument('--diff', type=Path, default=None,
+                        help='If given, compare the contents of EEPROM with the specified image (.hex, .bin or .json), '
+                             'estimate the time to write it and exit without writing anything')
+    parser.add_argument('--disassemble', type=Path, nargs='?', const=Path('-'), default=None,
+                        help='If given, read and disassemble the programs on the device (or just --slot) and exit. '
+                             'Written to stdout, or to the given .spn file (--slot) or directory')
+    parser.add_argument('--watch', type=Path, default=None,
+                        help='If given, watch the .spn source files listed in the specified bank .json file (or a single '
+                             '.spn file for --slot), assembling and writing each program slot when its source changes. '
+                             'The programs are placed from --bank (or the bank of --slot)')
+    parser.add_argument('--serve', nargs='?', const='127.0.0.1', default=None, metavar='HOST[:PORT]',
+                        help='If given, run a programming server that keeps the programmers open and runs '
+                             'jobs submitted over HTTP (defaults to 127.0.0.1:8722, give 0.0.0.0 as the host to '
+                             'accept jobs from other computers)')
+    parser.add_argument('--stations', type=int, default=1,
+                        help='The number of programmers (stations) used by --serve')
+    parser.add_argument('--emulate', action="store_true", default=False,
+                        help='Use emulated EEPROMs instead of physical ones')
+    parser.add_argument('--server', type=str, default=None, metavar='URL',
+                        help='Send --load-file, --verify-file and --save-file to a running --serve '
+                             'server (e.g. http://127.0.0.1:8722) instead of opening the programmer')
+    parser.add_argument('--station', type=str, default=None,
+                        help='The station to use on --server')
+    parser.add_argument('--priority', type=int, default=0,
+                        help='The priority of jobs sent to --server (higher runs first)')
+    parser.add_argument('--record-trace', type=Path, default=None,
+                        help='Record every I2C transaction to the specified trace file')
+    parser.add_argument('--replay-trace', type=Path, default=None,
+                        help='Play back the specified trace file instead of using a physical programmer')
+    parser.add_argument('--replay-speedup', type=float, default=0.0,
+                        help='How much faster than recorded to replay a trace (0 replays as fast as possible)')
+    parser.add_argument('--batch-disassemble', type=Path, nargs='+', default=None,
+                        help='If given, disassemble every program slot of the specified .bin/.hex files (or directories of them) and exit')
+    parser.add_argument('--variants', type=Path, default=None, metavar='SPEC',
+                        help='If given, assemble every variant of the templates in the specified sweep spec (.json), '
+                             'group them into banks in --output-dir with a report and exit')
+    parser.add_argument('--round-trip', type=Path, nargs='*', default=None, metavar='FILE',
+                        help='If given, disassemble and reassemble every program slot of the specified .bin/.hex files '
+                             '(the bundled test banks if none) with each combination of options, report the '
+                             'programs per second and any mismatches and exit')
+    parser.add_argument('--round-trip-report', type=Path, default=None,
+                        help='Append the --round-trip results to the specified JSON lines file')
+    parser.add_argument('--analyze', type=Path, nargs='+', default=None,
+                        help='If given, report the resource usage of the specified programs (.spn, .json, .bin or .hex) and exit')
+    parser.add_argument('--output-dir', type=Path, default=Path('disassembly'),
+                        help='The output directory for batch operations')
+    parser.add_argument('--jobs', type=int, default=None,
+                        help='The number of worker processes for batch operations (defaults to the number of CPUs)')
+    parser.add_argument('--disfv1-relative', action="store_true", default=False,
+                        help='Use relative SKP targets when disassembling')
+    parser.add_argument('--disfv1-suppressraw', action="store_true", default=False,
+                        help='Convert invalid statements to NOP when disassembling')
+    parser.add_argument('--library', type=Path, action='append', default=None,
+                        help='A directory of .spn, .json and .hex programs to index for the command palette '
+                             '(may be given more than once). The index is updated when the palette is opened')
+    parser.add_argument('--library-db', type=Path, default=None,
+                        help='The program library index file (defaults to ~/.fv1_programmer/library.sqlite3)')
+    parser.add_argument('--render', type=Path, default=None,
+                        help='If given, simulate the specified program (.spn, or a slot of a .bin/.hex image) '
+                             'over --input-wav, write the result to --output-wav and exit')
+    parser.add_argument('--slot', type=__slot_argument, default=None, metavar='[BANK:]SLOT',
+                        help='The program slot (1-8) to use, optionally in another bank of 8 programs on larger '
+                             'EEPROMs (e.g. 2:3). Only that slot is read or written on the device')
+    parser.add_argument('--bank', type=int, default=None,
+                        help='The bank of 8 programs to use on larger EEPROMs (only that bank is read or written '
+                             'on the device, and opened in the user interface)')
+    parser.add_argument('--sparse', action="store_true", default=False,
+                        help='When loading a file, read the device first and only write the program slots that differ')
+    parser.add_argument('--input-wav', type=Path, default=None,
+                        help='The mono or stereo WAV file to render through the simulator')
+    parser.add_argument('--output-wav', type=Path, default=None,
+                        help='The stereo WAV file written by the simulator')
+    parser.add_argument('--pot0', type=float, default=0.5,
+                        help='The simulated POT0 position (0.0 to 1.0)')
+    parser.add_argument('--pot1', type=float, default=0.5,
+                        help='The simulated POT1 position (0.0 to 1.0)')
+    parser.add_argument('--pot2', type=float, default=0.5,
+                        help='The simulated POT2 position (0.0 to 1.0)')
+    parser.add_argument('--tail', type=float, default=0.0,
+                        help='Seconds of silence to render after the end of the input')
+    parser.add_argument('--asfv1-noclamp', action="store_true", default=False,
+                        help='Do not clamp out of range values when assembling')
+    parser.add_argument('--asfv1-spinreals', action="store_true", default=False,
+                        help='Read literals 2 and 1 as 2.0 and 1.0 when assembling')
+    parser.add_argument('--optimize', action="store_true", default=False,
+                        help='Peephole optimize programs after assembling them')
     parser.add_argument('--verify', action="store_true", default=True,
                         help='Verify the EEPROM contents after loading a .hex file')
+    parser.add_argument('--profile', type=Path, nargs='?', const=Path('fv1_programmer_profile.txt'), default=None,
+                        help='Profile operations, printing a summary and appending a report to the given file '
+                             '(defaults to fv1_programmer_profile.txt)')
+    parser.add_argument('--import-profile', action="store_true", default=False,
+                        help='Report the time taken to import each module on exit')
     parser.add_argument('--debug', action="store_true", default=False,
                         help='Log debug messages')
     parser.add_argument('--sim', type=Path, default=None,
                         help='If specified, use the given file to emulate an EEPROM instead of a physical one')
     args = parser.parse_args()
 
+    if args.render is not None and (args.input_wav is None or args.output_wav is None):
+        parser.error("--render requires --input-wav and --output-wav")
+
+    if args.bank is not None and args.bank < 1:
+        parser.error("--bank must be 1 or more")
+
+    if args.save_file is not None and args.save_file.suffix.lower() not in ('.bin', '.hex', '.json'):
+        parser.error("--save-file must be a .bin, .hex or .json file")
+
+    if args.targets is not None and (args.sim is not None or args.sparse):
+        parser.error("--targets can't be used with --sim or --sparse")
+
     return args
 
 
-def __get_adapter(args):
+def __get_adapter(args, devnum=None):
     if args.sim:
         return None
 
-    from adaptor.mcp2221 import MCP2221I2CAdaptor
-    return MCP2221I2CAdaptor(args.i2c_address, i2c_clock_speed=args.i2c_clock_speed)
+    if args.replay_trace:
+        from adaptor.trace import ReplayAdaptor
+        adaptor = ReplayAdaptor(args.replay_trace, speedup=args.replay_speedup,
+                                i2c_address=args.i2c_address, i2c_clock_speed=args.i2c_clock_speed)
+    elif args.emulate:
+        from adaptor.emulated import EmulatedEEPROMAdaptor
+        adaptor = EmulatedEEPROMAdaptor(args.i2c_address, i2c_clock_speed=args.i2c_clock_speed,
+                                        size=args.ee_size, page_size=args.ee_page_size, addresses=args.targets)
+    else:
+        from adaptor.mcp2221 import MCP2221I2CAdaptor
+        adaptor = MCP2221I2CAdaptor(args.i2c_address, i2c_clock_speed=args.i2c_clock_speed, devnum=devnum)
+
+    if args.record_trace:
+        from adaptor.trace import TracingAdaptor
+        trace_path = args.record_trace
+        if devnum is not None:
+            # One trace per programmer
+            trace_path = trace_path.with_name(f"{trace_path.stem}-{devnum + 1}{trace_path.suffix}")
+        adaptor = TracingAdaptor(adaptor, trace_path)
+    return adaptor
 
 
 def __get_eeprom(args, adaptor):
@@ -47,33 +184,663 @@ def __get_eeprom(args, adaptor):
     return I2CEEPROM(adaptor, args.ee_size, page_size_in_bytes=args.ee_page_size)
 
 
-def save_file(args):
+def __print_progress(event):
+    eta = f", {event.eta:.1f}s left" if event.eta is not None else ""
+    print(f"\r{event.operation.capitalize():>6}: {100*event.fraction:5.1f}% "
+          f"({event.done}/{event.total} bytes, {event.rate/1024:.1f} kB/s{eta})    ", end="", flush=True)
+
+
+def __get_progress():
+    """Progress reporting to the console. Ctrl+C cancels at the next page boundary."""
+    import signal
+    import threading
+    from eeprom.eeprom import TransferProgress
+    cancelled = threading.Event()
+    signal.signal(signal.SIGINT, lambda signum, frame: cancelled.set())
+    return TransferProgress(callback=__print_progress, is_cancelled=cancelled.is_set)
+
+
+def __open_eeprom(args):
     adaptor = __get_adapter(args)
     if adaptor is not None:
         adaptor.open()
-    ee = __get_eeprom(args, adaptor)
-    ee.save_file(args.save_file)
-    print(f"EEPROM content saved to '{str(args.save_file)}'")
+    return __get_eeprom(args, adaptor)
+
+
+def __slot_region(args, ee):
+    """Returns the (address, size) of the EEPROM region selected by --slot or --bank (or all of it)"""
+    from fv1_programmer.bank import slot_address, bank_address, FV1_BANK_MAX_BYTES
+    from fv1_programmer.fv1 import FV1_PROGRAM_MAX_BYTES
+    if args.slot is not None:
+        address, size = slot_address(args.slot), FV1_PROGRAM_MAX_BYTES
+    elif args.bank is not None:
+        address, size = bank_address(args.bank), FV1_BANK_MAX_BYTES
+    else:
+        return 0, ee.size
+    if address + size > ee.size:
+        raise ValueError(f"{'Program ' + __where(args) if args.slot is not None else 'Bank ' + str(args.bank)} "
+                         f"is outside of the {ee.size} byte EEPROM")
+    return address, size
+
+
+def __where(args):
+    """Describes the region selected by --slot or --bank"""
+    from fv1_programmer.bank import slot_name
+    if args.slot is not None:
+        return slot_name(args.slot)
+    return f"bank {args.bank}" if args.bank is not None else "EEPROM"
+
+
+def __read_slot_program(args, filepath):
+    """Reads the --slot program from an image file, or assembles it from an .spn file"""
+    from fv1_programmer.bank import read_program
+    if filepath.suffix.lower() == '.spn':
+        from fv1_programmer.fv1 import FV1Program
+        with open(filepath, 'r') as f:
+            data, _, _, errors = FV1Program(f.read()).assemble(clamp=not args.asfv1_noclamp,
+                                                               spinreals=args.asfv1_spinreals,
+                                                               optimize=args.optimize)
+        if len(errors):
+            raise ValueError("\n".join(errors))
+        return bytes(data)
+    return read_program(filepath, args.slot, padding=args.pad_value)
+
+
+def __read_target_image(args, filepath, size):
+    """
+    The data --load-file/--verify-file write or compare: the --slot program,
+    the --bank (from a single or multi-bank image) or the whole image.
+    """
+    from fv1_programmer.bank import read_image, bank_address, FV1_BANK_MAX_BYTES
+    if args.slot is not None:
+        return __read_slot_program(args, filepath)
+    data = read_image(filepath, padding=args.pad_value)
+    if args.bank is not None and len(data) > FV1_BANK_MAX_BYTES:
+        data = data[bank_address(args.bank):bank_address(args.bank) + FV1_BANK_MAX_BYTES]
+    data = data[:size]
+    return data + bytes([args.pad_value]*(size - len(data)))
+
+
+def __assemble_options(args):
+    return {"clamp" : not args.asfv1_noclamp, "spinreals" : args.asfv1_spinreals, "optimize" : args.optimize}
+
+
+def __bank_file_programs(args, filepath):
+    """
+    Returns the (address -> data) of the programs in a bank .json file, placed
+    in --bank (or the bank of --slot, which selects one program), and the
+    slots that had to be assembled. Programs of a device dump keep their
+    place in the bank (and their bank if neither is given). Binaries stored in
+    the file are used if their source is unchanged, other programs are
+    assembled with the options stored in the file (or given on the command
+    line for older files).
+    """
+    from fv1_programmer.bank import read_bank, slot_address, slot_name, FV1_PROGRAMS_PER_BANK
+    bank = read_bank(filepath)
+    options = bank.options if bank.options is not None else __assemble_options(args)
+    dumped = [slot for slot in bank.slots if slot is not None]
+    # The first slot of the bank the file was read from
+    base = (min(dumped) - 1) // FV1_PROGRAMS_PER_BANK*FV1_PROGRAMS_PER_BANK + 1 if len(dumped) else 1
+    if args.slot is not None:
+        first = (args.slot - 1) // FV1_PROGRAMS_PER_BANK*FV1_PROGRAMS_PER_BANK + 1
+    else:
+        first = (args.bank - 1)*FV1_PROGRAMS_PER_BANK + 1 if args.bank is not None else base
+    programs, assembled = {}, []
+    for index, (program, dumped_slot) in enumerate(zip(bank.programs, bank.slots)):
+        slot = first + (dumped_slot - base if dumped_slot is not None else index)
+        if program is None or (args.slot is not None and slot != args.slot):
+            continue
+        stored = program.assembled
+        data, _, _, errors = program.assemble(**options)
+        if len(errors):
+            raise ValueError(f"Program {slot_name(slot)} failed to assemble:\n" + "\n".join(errors))
+        if program.assembled is not stored:
+            assembled.append(slot)
+        if len(data):
+            programs[slot_address(slot)] = bytes(data)
+    if args.slot is not None and not len(programs):
+        raise ValueError(f"There is no program for slot {slot_name(args.slot)} in the file")
+    return programs, assembled
+
+
+def __changed_slots(ee, address, data, progress):
+    """Reads a region of the EEPROM and returns the (address, data) of the program slots that differ from `data`"""
+    from fv1_programmer.fv1 import FV1_PROGRAM_MAX_BYTES
+    current = ee.read(address, len(data), progress)
+    return [(address + offset, data[offset:offset + FV1_PROGRAM_MAX_BYTES])
+            for offset in range(0, len(data), FV1_PROGRAM_MAX_BYTES)
+            if current[offset:offset + FV1_PROGRAM_MAX_BYTES] != data[offset:offset + FV1_PROGRAM_MAX_BYTES]]
+
+
+def __run_remote_job(args, request):
+    """Runs a job on a --serve server, printing its progress. Returns the final status."""
+    from fv1_programmer.daemon import submit_job
+    if args.station is not None:
+        request["station"] = args.station
+    request["priority"] = args.priority
+
+    def print_status(status):
+        print(f"\r{status['type'].capitalize()} job {status['id']} on {status['station']}: {status['state']} "
+              f"{100*status['progress']:5.1f}%    ", end="", flush=True)
+
+    try:
+        status = submit_job(args.server, request, print_status)
+    except (OSError, ValueError) as e:
+        print(f"Job failed: {e}")
+        return None
+    print()
+    if status["state"] != "done":
+        print(f"Job {status['state']}: {status['message']}")
+        return None
+    return status
+
+
+def __remote(args):
+    from fv1_programmer.bank import slot_address, bank_address, write_image, FV1_BANK_MAX_BYTES
+    from fv1_programmer.fv1 import FV1_PROGRAM_MAX_BYTES
+    if args.slot is not None:
+        address, size = slot_address(args.slot), FV1_PROGRAM_MAX_BYTES
+    elif args.bank is not None:
+        address, size = bank_address(args.bank), FV1_BANK_MAX_BYTES
+    else:
+        address, size = 0, args.ee_size
+
+    if args.save_file is not None:
+        status = __run_remote_job(args, {"type" : "read", "address" : address, "size" : size})
+        if status is None:
+            return 1
+        try:
+            write_image(args.save_file, bytes.fromhex(status["data"]), address, relative=args.disfv1_relative,
+                        suppressraw=args.disfv1_suppressraw)
+        except ValueError as e:
+            print(e)
+            return 1
+        print(f"Saved to '{str(args.save_file)}'")
+        return 0
+
+    filepath = args.load_file if args.load_file is not None else args.verify_file
+    try:
+        data = __read_target_image(args, filepath, size)
+    except (OSError, ValueError) as e:
+        print(f"Unable to read '{str(filepath)}':\n{e}")
+        return 1
+    request = {"type" : "program" if args.load_file is not None else "verify", "address" : address,
+               "data" : data.hex(), "verify" : args.verify}
+    return 0 if __run_remote_job(args, request) is not None else 1
+
+
+def serve(args):
+    from fv1_programmer.daemon import JobServer, Station, DEFAULT_PORT
+    host, _, port = args.serve.partition(':')
+    # Only listen on other interfaces when asked to (":PORT" is still local)
+    host = host or '127.0.0.1'
+    stations = {}
+    for i in range(1, args.stations + 1):
+        adaptor = __get_adapter(args, devnum=i - 1 if args.stations > 1 else None)
+        stations[f"station{i}"] = Station(f"station{i}", __get_eeprom(args, adaptor), adaptor)
+    jobs = JobServer(stations)
+    jobs.start()
+    server = jobs.serve(host, int(port) if port else DEFAULT_PORT)
+    print(f"Serving {len(stations)} station(s) on http://{server.server_address[0]}:{server.server_address[1]}, "
+          f"press Ctrl+C to stop")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    server.server_close()
+    jobs.stop()
+    return 0
+
+
+def save_file(args):
+    from eeprom.eeprom import OperationCancelled
+    from fv1_programmer.bank import write_image
+    ee = __open_eeprom(args)
+    try:
+        address, size = __slot_region(args, ee)
+        progress = __get_progress()
+        progress.expect(size)
+        data = ee.read(address, size, progress)
+        write_image(args.save_file, data, address, relative=args.disfv1_relative,
+                    suppressraw=args.disfv1_suppressraw)
+    except OperationCancelled as e:
+        print(f"\n{str(e)}, nothing was saved")
+        return 1
+    except ValueError as e:
+        print(e)
+        return 1
+    what = f"Program {__where(args)}" if args.slot is not None else f"Bank {args.bank}" if args.bank else "EEPROM content"
+    print(f"\n{what} saved to '{str(args.save_file)}'")
     return 0
 
 
 def load_file(args):
+    from eeprom.eeprom import OperationCancelled
+    from fv1_programmer.bank import slot_name
+    from fv1_programmer.fv1 import FV1_PROGRAM_MAX_BYTES
+    ee = __open_eeprom(args)
+    where = f" to program {__where(args)}" if args.slot is not None else f" to {__where(args)}" if args.bank else ""
+    print(f"Loading{where}{' (and verifying):' if args.verify else ':'} {str(args.load_file)}")
+    is_bank_file = args.load_file.suffix.lower() == '.json'
+    try:
+        if args.slot is None and args.bank is None and not args.sparse and not is_bank_file:
+            ee.load_file(args.load_file, padding=args.pad_value, verify=args.verify, progress=__get_progress())
+        else:
+            try:
+                address, size = __slot_region(args, ee)
+                if is_bank_file:
+                    # Only the slots that hold a program are written from a .json file
+                    programs, assembled = __bank_file_programs(args, args.load_file)
+                    if any(a + len(d) > ee.size for a, d in programs.items()):
+                        raise ValueError(f"The programs don't fit in the {ee.size} byte EEPROM")
+                    if len(assembled):
+                        print(f"Assembled program{'s' if len(assembled) > 1 else ''} "
+                              f"{', '.join(slot_name(s) for s in assembled)} (no up to date binary in the file)")
+                    regions = list(programs.items())
+                else:
+                    regions = [(address, __read_target_image(args, args.load_file, size))]
+            except (OSError, ValueError) as e:
+                print(f"Unable to load '{str(args.load_file)}':\n{e}")
+                return 1
+            progress = __get_progress()
+            if args.sparse:
+                # Only write the program slots that differ from what's on the device
+                num_slots = sum(-(-len(d) // FV1_PROGRAM_MAX_BYTES) for _, d in regions)
+                progress.expect(sum(len(d) for _, d in regions))
+                regions = [changed for a, d in regions for changed in __changed_slots(ee, a, d, progress)]
+                print(f"\n{len(regions)} of {num_slots} program slots differ")
+            progress.expect(sum(len(d) for _, d in regions)*(2 if args.verify else 1))
+            for region_address, region_data in regions:
+                ee.write(region_address, region_data, progress)
+            if args.verify and not all(ee.verify(a, d, progress) for a, d in regions):
+                print(f"\nVerify failed")
+                return 1
+    except OperationCancelled as e:
+        if args.slot is None and args.bank is None and not args.sparse and not is_bank_file:
+            written = min(e.event.done, e.event.total//2 if args.verify else e.event.total)
+            print(f"\n{str(e)}. The first {written} bytes of the EEPROM have been written, the rest are unchanged.")
+        else:
+            print(f"\n{str(e)}. {__where(args).capitalize()} may have been partially written.")
+        return 1
+    print()
+    return 0
+
+
+def load_targets(args):
+    import time
+    from eeprom.eeprom import OperationCancelled
+    from eeprom.interleaved import InterleavedI2CEEPROMs
+    targets = ", ".join(f"0x{address:02x}" for address in args.targets)
     adaptor = __get_adapter(args)
-    if adaptor is not None:
-        adaptor.open()
-    ee = __get_eeprom(args, adaptor)
-    print(f"Loading{' (and verifying):' if args.verify else ':'} {str(args.load_file)}")
-    ee.load_file(args.load_file, padding=args.pad_value, verify=args.verify)
+    adaptor.open()
+    group = InterleavedI2CEEPROMs(adaptor, args.targets, args.ee_size, page_size_in_bytes=args.ee_page_size)
+    try:
+        address, size = __slot_region(args, group)
+        data = __read_target_image(args, args.load_file, size)
+    except (OSError, ValueError) as e:
+        print(f"Unable to load '{str(args.load_file)}':\n{e}")
+        return 1
+
+    print(f"Loading{' (and verifying)' if args.verify else ''} {str(args.load_file)} to the EEPROMs at {targets}")
+    progress = __get_progress()
+    progress.expect(len(data)*len(args.targets)*(2 if args.verify else 1))
+    start = time.perf_counter()
+    try:
+        group.write(address, data, progress)
+        failed = group.verify(address, data, progress) if args.verify else []
+    except OperationCancelled as e:
+        print(f"\n{str(e)}. The EEPROMs may have been partially written.")
+        return 1
+    print(f"\nWrote {len(data)} bytes to {len(args.targets)} EEPROMs in {time.perf_counter() - start:.1f}s")
+    if len(failed):
+        print(f"Verify failed for the EEPROMs at {', '.join(f'0x{a:02x}' for a in failed)}")
+        return 1
+    return 0
+
+
+def verify_file(args):
+    from eeprom.eeprom import OperationCancelled
+    ee = __open_eeprom(args)
+    try:
+        address, size = __slot_region(args, ee)
+        expected = __read_target_image(args, args.verify_file, size)
+    except (OSError, ValueError) as e:
+        print(f"Unable to read '{str(args.verify_file)}':\n{e}")
+        return 1
+
+    progress = __get_progress()
+    progress.expect(size)
+    try:
+        actual = ee.read(address, size, progress, operation="verify")
+    except OperationCancelled as e:
+        print(f"\n{str(e)}")
+        return 1
+    print()
+    mismatches = [address + i for i, (a, b) in enumerate(zip(actual, expected)) if a != b]
+    if len(mismatches):
+        print(f"{len(mismatches)} bytes differ from '{str(args.verify_file)}', "
+              f"the first at address 0x{mismatches[0]:04x}")
+        return 1
+    what = f"Program {__where(args)}" if args.slot is not None else f"Bank {args.bank}" if args.bank else "EEPROM content"
+    print(f"{what} matches '{str(args.verify_file)}'")
     return 0
 
+
+def diff(args):
+    import time
+    from eeprom.eeprom import OperationCancelled
+    from fv1_programmer.bank import slot_address, slot_name
+    from fv1_programmer.fv1 import FV1_PROGRAM_MAX_BYTES
+    from fv1_programmer.imagediff import diff_image, estimate_write_time, disassembly_diff
+
+    ee = __open_eeprom(args)
+    try:
+        if args.diff.suffix.lower() == '.json':
+            # Only the slots that hold a program are written from a .json file
+            target, _ = __bank_file_programs(args, args.diff)
+        else:
+            address, size = __slot_region(args, ee)
+            target = {address : __read_target_image(args, args.diff, size)}
+        if not len(target):
+            raise ValueError("Nothing to compare")
+    except (OSError, ValueError) as e:
+        print(f"Unable to read '{str(args.diff)}':\n{e}")
+        return 1
+
+    # Only read the part of the EEPROM the target covers
+    start_address = min(target)
+    end_address = max(a + len(d) for a, d in target.items())
+    if end_address > ee.size:
+        print(f"'{str(args.diff)}' doesn't fit in the {ee.size} byte EEPROM")
+        return 1
+    size = end_address - start_address
+    progress = __get_progress()
+    progress.expect(size)
+    start = time.perf_counter()
+    try:
+        current = ee.read(start_address, size, progress)
+    except OperationCancelled as e:
+        print(f"\n{str(e)}")
+        return 1
+    read_time = time.perf_counter() - start
+    bytes_per_second = size/max(read_time, 1e-6)
+    print(f"\nRead {size} bytes in {read_time:.2f}s ({bytes_per_second/1024:.1f} kB/s)")
+
+    result = diff_image(current, target, ee.page_size, base=start_address)
+    if not len(result.pages):
+        print(f"The device already matches '{str(args.diff)}'")
+        return 0
+
+    num_pages = -(-size // ee.page_size)
+    print(f"{result.num_bytes} bytes in {len(result.pages)} of {num_pages} pages differ: {', '.join(result.page_ranges)}")
+    for slot in result.slots:
+        address = slot_address(slot)
+        region = next((a, d) for a, d in target.items() if a <= address < a + len(d))
+        target_program = region[1][address - region[0]:address - region[0] + FV1_PROGRAM_MAX_BYTES]
+        current_program = current[address - start_address:address - start_address + FV1_PROGRAM_MAX_BYTES]
+        print(f"\nProgram {slot_name(slot)} differs:")
+        [print(line) for line in disassembly_diff(current_program, target_program,
+                                                  target_name=str(args.diff), relative=args.disfv1_relative,
+                                                  suppressraw=args.disfv1_suppressraw)]
+
+    def estimate(num_bytes):
+        write_time = estimate_write_time(num_bytes, ee.page_size, bytes_per_second)
+        verify_time = num_bytes/bytes_per_second if args.verify else 0.0
+        return f"{write_time + verify_time:.1f}s (write {write_time:.1f}s, verify {verify_time:.1f}s)"
+
+    changed = ', '.join(slot_name(s) for s in result.slots)
+    print(f"\nEstimated time to write program{'s' if len(result.slots) > 1 else ''} {changed}: "
+          f"{estimate(len(result.slots)*FV1_PROGRAM_MAX_BYTES)}")
+    print(f"Estimated time to write the whole image: {estimate(sum(len(d) for d in target.values()))}")
+    return 0
+
+
+def disassemble(args):
+    from eeprom.eeprom import OperationCancelled
+    from fv1_programmer.bank import split_program_slots, is_erased, slot_name
+    from fv1_programmer.fv1 import FV1Program, FV1_PROGRAM_MAX_BYTES
+    ee = __open_eeprom(args)
+    try:
+        address, size = __slot_region(args, ee)
+    except ValueError as e:
+        print(e)
+        return 1
+    to_stdout = args.disassemble == Path('-')
+    # Keep progress output out of the listing
+    progress = __get_progress() if not to_stdout else None
+    if progress is not None:
+        progress.expect(size)
+    try:
+        data = ee.read(address, size, progress)
+    except OperationCancelled as e:
+        print(f"\n{str(e)}")
+        return 1
+    if not to_stdout:
+        print()
+
+    for slot, program_data in enumerate(split_program_slots(data), start=address // FV1_PROGRAM_MAX_BYTES + 1):
+        if args.slot is None and is_erased(program_data):
+            continue
+        program = FV1Program(None)
+        program.from_bytearray(bytearray(program_data), relative=args.disfv1_relative,
+                               suppressraw=args.disfv1_suppressraw)
+        if to_stdout:
+            if args.slot is None:
+                print(f"; Program {slot_name(slot)}")
+            print(program.asm)
+        else:
+            out_path = args.disassemble if args.slot is not None else \
+                       args.disassemble / f"program{slot_name(slot).replace(':', '-')}.spn"
+            out_path.parent.mkdir(parents=True, exist_ok=True)
+            with open(out_path, 'w') as f:
+                f.write(program.asm)
+            print(f"Program {slot_name(slot)} disassembled to '{str(out_path)}'")
+    return 0
+
+
+def watch(args):
+    from fv1_programmer.bank import slot_name
+    from fv1_programmer.watch import ProgramWatcher, read_manifest
+    try:
+        sources = read_manifest(args.watch, args.slot, args.bank)
+    except (OSError, ValueError) as e:
+        print(f"Unable to watch '{str(args.watch)}': {e}")
+        return 1
+
+    ee = __open_eeprom(args)
+    watcher = ProgramWatcher(sources, ee, clamp=not args.asfv1_noclamp, spinreals=args.asfv1_spinreals,
+                             optimize=args.optimize, verify=args.verify)
+
+    def report(result):
+        if len(result.errors):
+            print(f"Program {slot_name(result.slot)} ({result.path.name}): failed to assemble")
+            [print(f"  {e}") for e in result.errors]
+        elif not result.verified:
+            print(f"Program {slot_name(result.slot)} ({result.path.name}): verify FAILED")
+        elif result.written:
+            print(f"Program {slot_name(result.slot)} ({result.path.name}): {result.instructions} instructions written "
+                  f"in {result.elapsed:.2f}s{' (cached)' if result.cached else ''}")
+        else:
+            print(f"Program {slot_name(result.slot)} ({result.path.name}): unchanged on device")
+
+    print(f"Watching {len(sources)} program(s) from '{str(args.watch)}', press Ctrl+C to stop")
+    try:
+        watcher.run(report)
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+def batch_disassemble(args):
+    from fv1_programmer.batch import batch_disassemble, INDEX_FILENAME
+    index = batch_disassemble(args.batch_disassemble, args.output_dir,
+                              relative=args.disfv1_relative,
+                              suppressraw=args.disfv1_suppressraw,
+                              max_workers=args.jobs)
+    num_slots = sum(len(p["occurrences"]) for p in index["programs"].values())
+    print(f"Disassembled {len(index['programs'])} unique programs ({num_slots} slots in {len(index['files'])} files) "
+          f"to '{str(args.output_dir)}', index in '{INDEX_FILENAME}'")
+    return 0
+
+
+def variants(args):
+    from fv1_programmer.variants import generate_variants, REPORT_FILENAME
+    try:
+        results = generate_variants(args.variants, args.output_dir, __assemble_options(args), max_workers=args.jobs)
+    except (OSError, ValueError, KeyError) as e:
+        print(f"Unable to generate variants from '{str(args.variants)}':\n{e}")
+        return 1
+    for variant in results:
+        if variant.status != "ok":
+            print(f"{variant.name}: {'failed to assemble' if variant.status == 'failed' else 'exceeds limits'}")
+            [print(f"  {reason}") for reason in variant.reasons]
+    ok = [v for v in results if v.status == "ok"]
+    banks = max([v.bank for v in ok], default=0)
+    print(f"{len(ok)} of {len(results)} variants assembled into {banks} banks in '{str(args.output_dir)}', "
+          f"report in '{REPORT_FILENAME}'")
+    return 0
+
+
+def round_trip(args):
+    from fv1_programmer.roundtrip import run_round_trips, write_report, DEFAULT_CORPUS
+    paths = args.round_trip if len(args.round_trip) else DEFAULT_CORPUS
+    try:
+        results = run_round_trips(paths)
+    except (OSError, ValueError) as e:
+        print(f"Unable to read the corpus:\n{e}")
+        return 1
+    for result in results:
+        print(result.summary())
+        [print(f"  {mismatch}") for mismatch in result.mismatches[:5]]
+    if args.round_trip_report is not None:
+        write_report(args.round_trip_report, paths, results)
+        print(f"Results appended to '{str(args.round_trip_report)}'")
+    return 1 if any(len(r.mismatches) for r in results) else 0
+
+
+def analyze(args):
+    from fv1_programmer.analysis import analyze
+    from fv1_programmer.bank import read_image, read_bank, split_program_slots, is_erased, slot_name
+    from fv1_programmer.fv1 import FV1Program
+
+    def analyze_program(name, program):
+        data, _, warnings, errors = program.assemble(clamp=not args.asfv1_noclamp, spinreals=args.asfv1_spinreals,
+                                                     optimize=args.optimize)
+        if len(errors):
+            print(f"{name}: failed to assemble")
+            [print(f"  {e}") for e in errors]
+            return 1
+        [print(w) for w in warnings if w.startswith("info: Optimizer")]
+        print(f"{name}:\n{analyze(data, program.delay_memory).report()}\n")
+        return 0
+
+    num_errors = 0
+    for path in args.analyze:
+        suffix = path.suffix.lower()
+        if suffix == '.spn':
+            with open(path, 'r') as f:
+                num_errors += analyze_program(str(path), FV1Program(f.read()))
+        elif suffix == '.json':
+            bank = read_bank(path)
+            for index, (program, dumped_slot) in enumerate(zip(bank.programs, bank.slots)):
+                slot = dumped_slot if dumped_slot is not None else index + 1
+                if program is None or (args.slot is not None and slot != args.slot):
+                    continue
+                num_errors += analyze_program(f"{path} (slot {slot_name(slot)})", program)
+        else:
+            for slot, data in enumerate(split_program_slots(read_image(path)), start=1):
+                if (args.slot is not None and slot != args.slot) or is_erased(data):
+                    continue
+                print(f"{path} (slot {slot_name(slot)}):\n{analyze(data).report()}\n")
+    return 1 if num_errors else 0
+
+
+def render(args):
+    import time
+    from fv1_programmer.simulator import FV1Simulator, render_wav
+    pots = (args.pot0, args.pot1, args.pot2)
+    if args.render.suffix.lower() == '.spn':
+        with open(args.render, 'r') as f:
+            simulator = FV1Simulator.from_asm(f.read(), clamp=not args.asfv1_noclamp,
+                                              spinreals=args.asfv1_spinreals, optimize=args.optimize, pots=pots)
+    else:
+        from fv1_programmer.bank import read_program
+        slot = args.slot if args.slot is not None else 1
+        simulator = FV1Simulator(read_program(args.render, slot), pots=pots)
+
+    start = time.perf_counter()
+    frames = render_wav(simulator, args.input_wav, args.output_wav, tail_seconds=args.tail)
+    print(f"Rendered {frames} frames to '{str(args.output_wav)}' in {time.perf_counter() - start:.2f}s")
+    return 0
+
+
+def __run_operation(args, operation):
+    """Runs a CLI operation, profiling it if --profile was given"""
+    if args.profile is None:
+        return operation(args)
+
+    from fv1_programmer.profiling import Profile
+    profile = Profile(operation.__name__)
+    try:
+        with profile:
+            return operation(args)
+    finally:
+        profile.write_report(args.profile)
+        print(profile.summary())
+        print(f"Profile report written to '{str(args.profile)}'")
+
+
 def run():
+    import multiprocessing
+    multiprocessing.freeze_support()
+    # Checked before parsing so everything imported from here on is covered
+    if '--import-profile' in sys.argv:
+        from fv1_programmer.importprofile import install
+        install()
+
     args = parse_command_line_arguments()
 
+    if args.watch is not None:
+        sys.exit(__run_operation(args, watch))
+
+    if args.batch_disassemble is not None:
+        sys.exit(__run_operation(args, batch_disassemble))
+
+    if args.variants is not None:
+        sys.exit(__run_operation(args, variants))
+
+    if args.round_trip is not None:
+        sys.exit(__run_operation(args, round_trip))
+
+    if args.analyze is not None:
+        sys.exit(__run_operation(args, analyze))
+
+    if args.render is not None:
+        sys.exit(__run_operation(args, render))
+
+    if args.serve is not None:
+        sys.exit(__run_operation(args, serve))
+
+    if args.server is not None and (args.save_file or args.load_file or args.verify_file) is not None:
+        sys.exit(__run_operation(args, __remote))
+
     if args.save_file is not None:
-        sys.exit(save_file(args))
+        sys.exit(__run_operation(args, save_file))
+
+    if args.load_file is not None and args.targets is not None:
+        sys.exit(__run_operation(args, load_targets))
 
     if args.load_file is not None:
-        sys.exit(load_file(args))
+        sys.exit(__run_operation(args, load_file))
+
+    if args.verify_file is not None:
+        sys.exit(__run_operation(args, verify_file))
+
+    if args.disassemble is not None:
+        sys.exit(__run_operation(args, disassemble))
+
+    if args.diff is not None:
+        sys.exit(__run_operation(args, diff))
 
     from fv1_programmer.tui import FV1App
     app = FV1App(args)
@@ -0,0 +1,203 @@
+import random
+from dataclasses import dataclass, field
+from typing import List, Optional
+
+from fv1_programmer.isa import (
+    Instruction, NOP, REG0, FV1_NUM_REGISTERS, REGISTER_NAMES, make, decode_program, encode_program, signed,
+    skip_target, uses_pacc, registers_read,
+)
+
+
+DEFAULT_VERIFY_SAMPLES = 2048
+
+_ONE = 0x4000
+# Instructions that only change ACC (no register, memory, LR or LFO side effects)
+_PURE = ('SOF', 'AND', 'OR', 'XOR', 'LOG', 'EXP', 'RDAX', 'RDFX', 'MAXX', 'MULX')
+
+
+@dataclass
+class OptimizationResult:
+    """The outcome of optimizing an assembled program"""
+    program : bytearray
+    instructions_before : int
+    instructions_after : int
+    rewrites : List[str] = field(default_factory=list)
+    verified : bool = True
+
+    @property
+    def saved(self) -> int:
+        return self.instructions_before - self.instructions_after
+
+
+def _sof(c : int, d : int) -> Instruction:
+    return make('SOF', c & 0xffff, d & 0x7ff)
+
+
+def _is_general_register(r : int) -> bool:
+    return REG0 <= r < REG0 + FV1_NUM_REGISTERS
+
+
+def _constant(inst : Instruction) -> Optional[int]:
+    """Returns the ACC value left by an instruction that ignores ACC, otherwise None"""
+    if inst.mnemonic == 'AND' and inst.args[0] == 0:
+        return 0
+    if inst.mnemonic == 'SOF' and inst.args[0] == 0:
+        return signed(inst.args[1], 11) << 13
+    return None
+
+
+def _overwrites_acc(inst : Instruction) -> bool:
+    """Returns True if an instruction's result does not depend on the incoming ACC"""
+    return _constant(inst) is not None or (inst.mnemonic == 'RDFX' and inst.args[1] == 0)
+
+
+def _is_identity(inst : Instruction) -> bool:
+    """Returns True if an instruction leaves the machine state unchanged"""
+    m, a = inst.mnemonic, inst.args
+    return ((m == 'SOF' and a == (_ONE, 0)) or
+            (m == 'RDAX' and a[1] == 0) or
+            (m in ('OR', 'XOR') and a[0] == 0) or
+            (m == 'AND' and a[0] == 0xffffff) or
+            (m == 'SKP' and a[1] == 0))
+
+
+def _power_of_two(c : int) -> Optional[int]:
+    """Returns n if an S1.14 coefficient is exactly 2^-n (n >= 0)"""
+    if c <= 0 or c > _ONE or c & (c - 1):
+        return None
+    return 14 - c.bit_length() + 1
+
+
+def _remove(instructions : List[Instruction], i : int) -> None:
+    """Removes instruction `i`, moving the targets of SKPs that jump over it"""
+    for j in range(i):
+        inst = instructions[j]
+        if inst.mnemonic == 'SKP' and skip_target(j, inst) > i:
+            instructions[j] = make('SKP', inst.args[0], inst.args[1] - 1)
+    del instructions[i]
+
+
+def _pacc_safe(instructions : List[Instruction], i : int, span : int) -> bool:
+    """Checks no instruction within `span` after `i` depends on PACC"""
+    return not any(uses_pacc(inst) for inst in instructions[i + 1:i + 1 + span])
+
+
+def _rewrite(instructions : List[Instruction]) -> Optional[str]:
+    """
+    Applies the first available rewrite, returning a description of it (or
+    None if there is nothing left to do). Every rewrite gives bit-identical
+    results, including fixed-point truncation and saturation.
+    """
+    targets = {skip_target(j, inst) for j, inst in enumerate(instructions)
+               if inst.mnemonic == 'SKP' and inst.args[1]}
+    reads = {r for inst in instructions for r in registers_read(inst)}
+    has_wrap = any(inst.mnemonic == 'WRAP' for inst in instructions)
+
+    for i, inst in enumerate(instructions):
+        m, a = inst.mnemonic, inst.args
+        following = instructions[i + 1] if i + 1 < len(instructions) else None
+
+        if _is_identity(inst) and _pacc_safe(instructions, i, 1):
+            _remove(instructions, i)
+            return f"{i}: removed {m} with no effect"
+
+        # Dead register writes
+        if m == 'WRAX' and _is_general_register(a[0]) and a[0] not in reads:
+            if a[1] == _ONE and _pacc_safe(instructions, i, 1):
+                _remove(instructions, i)
+                return f"{i}: removed write to unused register {REGISTER_NAMES[a[0]]}"
+            if a[1] != _ONE:
+                instructions[i] = _sof(signed(a[1], 16), 0)
+                return f"{i}: replaced write to unused register {REGISTER_NAMES[a[0]]} with SOF"
+
+        if following is None:
+            continue
+
+        # ACC results that are immediately overwritten
+        if m in _PURE and _overwrites_acc(following) and _pacc_safe(instructions, i, 2):
+            _remove(instructions, i)
+            return f"{i}: removed {m} whose result is never used"
+
+        if i + 1 in targets or not _pacc_safe(instructions, i + 1, 1):
+            continue
+
+        # Store followed by a load of the same location: WRAX REG,0 + RDAX REG,C -> WRAX REG,C
+        if (m == 'WRAX' and a[1] == 0 and following.mnemonic == 'RDAX' and following.args[0] == a[0]
+                and _is_general_register(a[0])):
+            instructions[i] = make('WRAX', a[0], following.args[1])
+            _remove(instructions, i + 1)
+            return f"{i}: merged WRAX/RDAX of {REGISTER_NAMES[a[0]]}"
+        if (m == 'WRA' and a[1] == 0 and following.mnemonic == 'RDA' and following.args[0] == a[0]
+                and not has_wrap):
+            instructions[i] = make('WRA', a[0], following.args[1])
+            _remove(instructions, i + 1)
+            return f"{i}: merged WRA/RDA of address {a[0]}"
+
+        # Constant ACC followed by SOF
+        k = _constant(inst)
+        if k is not None and following.mnemonic == 'SOF':
+            c, d = signed(following.args[0], 16), signed(following.args[1], 11)
+            value = min(max(((k * c) >> 14) + (d << 13), -(1 << 23)), (1 << 23) - 1)
+            if value % (1 << 13) == 0:
+                instructions[i] = _sof(0, value >> 13)
+                _remove(instructions, i + 1)
+                return f"{i}: folded constant SOF"
+
+        # Consecutive scale by powers of two: SOF 2^-n,D1 + SOF 2^-m,D2
+        if m == 'SOF' and following.mnemonic == 'SOF':
+            n, n2 = _power_of_two(signed(a[0], 16)), _power_of_two(signed(following.args[0], 16))
+            d1, d2 = signed(a[1], 11) << 13, signed(following.args[1], 11) << 13
+            if n is None or n2 is None or n + n2 > 14 or d1 % (1 << n2):
+                continue
+            # The intermediate ACC must not saturate
+            if (-(1 << 23) >> n) + d1 < -(1 << 23) or (((1 << 23) - 1) >> n) + d1 > (1 << 23) - 1:
+                continue
+            d = (d1 >> n2) + d2
+            if d % (1 << 13) or not -1024 <= d >> 13 <= 1023:
+                continue
+            instructions[i] = _sof(_ONE >> (n + n2), d >> 13)
+            _remove(instructions, i + 1)
+            return f"{i}: folded consecutive SOFs"
+
+    return None
+
+
+def _verify(original : bytes, optimized : bytes, samples : int) -> bool:
+    """Runs both programs through the simulator and compares their outputs"""
+    from fv1_programmer.simulator import FV1Simulator
+    rng = random.Random(0)
+    left = [rng.randint(-(1 << 23), (1 << 23) - 1) >> rng.randint(0, 12) for _ in range(samples)]
+    right = [rng.randint(-(1 << 23), (1 << 23) - 1) >> rng.randint(0, 12) for _ in range(samples)]
+    # Include an impulse, full scale values and silence
+    left[:4], right[:4] = [(1 << 23) - 1, -(1 << 23), 0, 0], [-(1 << 23), (1 << 23) - 1, 0, 0]
+    left[samples//2:samples//2 + 64] = [0]*64
+    for pots in ((0.0, 0.0, 0.0), (0.5, 0.5, 0.5), (1.0, 1.0, 1.0), (rng.random(), rng.random(), rng.random())):
+        expected = FV1Simulator(original, pots=pots).process(left, right)
+        if FV1Simulator(optimized, pots=pots).process(left, right) != expected:
+            return False
+    return True
+
+
+def optimize(program : bytes, verify_samples : int=DEFAULT_VERIFY_SAMPLES) -> OptimizationResult:
+    """
+    Peephole optimizes an assembled program. The optimized program is checked
+    against the original by simulating both, and the original is returned
+    unchanged if their outputs differ.
+    """
+    instructions = decode_program(program)
+    while len(instructions) and instructions[-1].word == NOP.word:
+        instructions.pop()
+    before = len(instructions)
+    if any(inst.mnemonic == 'RAW' for inst in instructions):
+        return OptimizationResult(bytearray(program), before, before)
+
+    rewrites = []
+    while (rewrite := _rewrite(instructions)) is not None:
+        rewrites.append(rewrite)
+    if not len(rewrites):
+        return OptimizationResult(bytearray(program), before, before)
+
+    optimized = encode_program(instructions)
+    if verify_samples and not _verify(program, optimized, verify_samples):
+        return OptimizationResult(bytearray(program), before, before, rewrites, verified=False)
+    return OptimizationResult(optimized, before, len(instructions), rewrites)
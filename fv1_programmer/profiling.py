@@ -0,0 +1,90 @@
+import cProfile
+import io
+import pstats
+import time
+from pathlib import Path
+from typing import Dict
+
+
+DEFAULT_PROFILE_REPORT = Path("fv1_programmer_profile.txt")
+
+# Time spent in a function is counted against the first category whose
+# packages appear in the function's file path
+_CATEGORIES = (
+    ("parsing", ("hexfile.py", "intelhex", "asfv1", "disfv1")),
+    ("bus I/O", ("EasyMCP2221", "hid", "usb", "adaptor", "eeprom")),
+    ("UI", ("textual", "rich")),
+)
+OTHER = "other"
+
+
+def _category(filename : str) -> str:
+    parts = filename.replace("\\", "/").split("/")
+    for name, packages in _CATEGORIES:
+        if any(package in parts for package in packages):
+            return name
+    return OTHER
+
+
+class Profile(object):
+    """
+    Profiles the code run inside a `with` block (on the current thread) and
+    splits its wall time into parsing (Intel HEX, asfv1 and disfv1), bus I/O,
+    UI and everything else.
+    """
+    def __init__(self, name : str) -> None:
+        self.name = name
+        self.profiler = cProfile.Profile()
+        self.enabled = False
+        self.wall_time = 0.0
+        self.categories = {}
+
+    def __enter__(self):
+        self._start = time.perf_counter()
+        try:
+            self.profiler.enable()
+            self.enabled = True
+        except ValueError:
+            # Another profiler is already running
+            self.enabled = False
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback) -> bool:
+        if self.enabled:
+            self.profiler.disable()
+        self.wall_time = time.perf_counter() - self._start
+        self.categories = self._split()
+        return False
+
+    def _split(self) -> Dict[str, float]:
+        totals = {name : 0.0 for name, _ in _CATEGORIES}
+        if self.enabled:
+            for (filename, _, _), (_, _, own_time, _, callers) in pstats.Stats(self.profiler).stats.items():
+                if filename == '~' and len(callers):
+                    # Built-in functions (sleeps, USB reads...) count against whoever called them
+                    for (caller_filename, _, _), (_, _, caller_time, _) in callers.items():
+                        if _category(caller_filename) in totals:
+                            totals[_category(caller_filename)] += caller_time
+                elif _category(filename) in totals:
+                    totals[_category(filename)] += own_time
+        totals[OTHER] = max(self.wall_time - sum(totals.values()), 0.0)
+        return totals
+
+    def summary(self) -> str:
+        if not self.enabled:
+            return f"{self.name}: {self.wall_time:.3f}s (not profiled, another profiler was active)"
+        split = ", ".join(f"{name} {seconds:.3f}s" for name, seconds in self.categories.items())
+        return f"{self.name}: {self.wall_time:.3f}s ({split})"
+
+    def report(self, limit : int=30) -> str:
+        """The summary followed by the functions with the highest cumulative time"""
+        out = io.StringIO()
+        out.write(f"{self.summary()}\n")
+        if self.enabled:
+            pstats.Stats(self.profiler, stream=out).sort_stats(pstats.SortKey.CUMULATIVE).print_stats(limit)
+        return out.getvalue()
+
+    def write_report(self, filepath : Path, limit : int=30) -> None:
+        """Appends the report to `filepath`"""
+        with open(filepath, 'a') as f:
+            f.write(f"==== {time.strftime('%Y-%m-%d %H:%M:%S')} {self.report(limit)}\n")
@@ -0,0 +1,169 @@
+import itertools
+import re
+import time
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Iterable, List, Tuple
+
+from fv1_programmer.bank import read_image, split_program_slots, is_erased
+from fv1_programmer.fv1 import FV1Program
+
+
+# The real banks bundled with the tests, used when no corpus is given
+DEFAULT_CORPUS = [Path(__file__).parent.parent / "tests" / name for name in ("delays.hex", "reverbs.hex")]
+
+OPTION_NAMES = ("clamp", "spinreals", "relative")
+# Each direction is timed this many times and the best is kept
+DEFAULT_REPEAT = 3
+
+# An integer 1 or 2 operand (not part of a name, a real or a hex value)
+_INTEGER_ONE_OR_TWO = re.compile(r"(?<![\w.])(-?[12])(?![\w.])")
+
+
+@dataclass
+class RoundTripResult:
+    """Disassembling and reassembling every program of a corpus with one combination of options"""
+    clamp : bool
+    spinreals : bool
+    relative : bool
+    programs : int = 0
+    # Best time of all repeats for each direction
+    disassemble_seconds : float = 0.0
+    assemble_seconds : float = 0.0
+    # "file slot N: reason" for each program that didn't reassemble to the same bytes
+    mismatches : List[str] = field(default_factory=list)
+    # The same for programs that only differ where a coefficient of 1.0 or 2.0
+    # was disassembled as an integer (see is_known_difference())
+    known_mismatches : List[str] = field(default_factory=list)
+
+    @property
+    def options(self) -> dict:
+        return {name : getattr(self, name) for name in OPTION_NAMES}
+
+    @property
+    def disassemble_rate(self) -> float:
+        """Programs disassembled per second"""
+        return self.programs/self.disassemble_seconds if self.disassemble_seconds else 0.0
+
+    @property
+    def assemble_rate(self) -> float:
+        """Programs assembled per second"""
+        return self.programs/self.assemble_seconds if self.assemble_seconds else 0.0
+
+    def summary(self) -> str:
+        options = " ".join(f"{name}={int(value)}" for name, value in self.options.items())
+        known = f" ({len(self.known_mismatches)} known)" if len(self.known_mismatches) else ""
+        return (f"{options}: {self.programs} programs, disassemble {self.disassemble_rate:.0f}/s, "
+                f"assemble {self.assemble_rate:.0f}/s, {len(self.mismatches)} mismatches{known}")
+
+
+def corpus_programs(paths : Iterable[Path]) -> List[Tuple[str, int, bytes]]:
+    """The (file, slot, data) of every program slot that isn't erased in the .bin/.hex files"""
+    programs = []
+    for path in paths:
+        for slot, data in enumerate(split_program_slots(read_image(path)), start=1):
+            if not is_erased(data):
+                programs.append((path.name, slot, data))
+    return programs
+
+
+def is_known_difference(line : str, expected : bytes, clamp : bool) -> bool:
+    """
+    disfv1 writes the coefficients 1.0 and 2.0 as "1" and "2", which the
+    assembler reads as integers without spinreals. An instruction that
+    didn't reassemble to `expected` is a known difference if its listing
+    `line` gives `expected` back once those are written as reals.
+    """
+    # Drop the comment and any label
+    code = line.split(';')[0].split(':')[-1]
+    if _INTEGER_ONE_OR_TWO.search(code) is None:
+        return False
+    data, _, _, errors = FV1Program(_INTEGER_ONE_OR_TWO.sub(r"\1.0", code)).assemble(clamp=clamp, spinreals=False)
+    return not len(errors) and bytes(data[:4]) == expected
+
+
+def _instruction_lines(listing : str) -> List[Tuple[int, str]]:
+    """The (line number, line) of each instruction of a disassembly"""
+    return [(number, line) for number, line in enumerate(listing.splitlines(), start=1)
+            if len(line.split(';')[0].split(':')[-1].strip())]
+
+
+def _differences(listing : str, expected : bytes, actual : bytes, clamp : bool) -> Tuple[List[str], bool]:
+    """Describes the instructions that differ, and whether they are all known differences"""
+    lines = _instruction_lines(listing)
+    differences, known = [], True
+    for offset in range(0, max(len(expected), len(actual)), 4):
+        if expected[offset:offset + 4] != actual[offset:offset + 4]:
+            index = offset//4
+            differences.append(f"instruction {index} is {actual[offset:offset + 4].hex()}, "
+                               f"expected {expected[offset:offset + 4].hex()}")
+            known = known and index < len(lines) and \
+                is_known_difference(lines[index][1], expected[offset:offset + 4], clamp)
+    return differences, known
+
+
+def _is_known_error(listing : str, expected : bytes, error : str, clamp : bool) -> bool:
+    """Whether an assembler error is caused by a 1.0 or 2.0 coefficient written as an integer (e.g. out of range)"""
+    m = re.search(r"on line (\d+)", error)
+    if m is None:
+        return False
+    for index, (number, line) in enumerate(_instruction_lines(listing)):
+        if number == int(m.group(1)):
+            return is_known_difference(line, expected[4*index:4*index + 4], clamp)
+    return False
+
+
+def round_trip(programs : List[Tuple[str, int, bytes]], clamp : bool, spinreals : bool, relative : bool,
+               repeat : int=1) -> RoundTripResult:
+    """
+    Disassembles every program, assembles the listing again and compares
+    the bytes. Each direction is timed separately (best of `repeat` runs),
+    and the programs are assembled from scratch so nothing is cached.
+    """
+    result = RoundTripResult(clamp, spinreals, relative, len(programs))
+    result.disassemble_seconds = result.assemble_seconds = float("inf")
+    for _ in range(max(1, repeat)):
+        start = time.perf_counter()
+        listings = []
+        for _, _, data in programs:
+            program = FV1Program("")
+            program.from_bytearray(bytearray(data), relative=relative)
+            listings.append(program.asm)
+        result.disassemble_seconds = min(result.disassemble_seconds, time.perf_counter() - start)
+
+        start = time.perf_counter()
+        assembled = [FV1Program(listing).assemble(clamp=clamp, spinreals=spinreals) for listing in listings]
+        result.assemble_seconds = min(result.assemble_seconds, time.perf_counter() - start)
+
+    for (name, slot, data), listing, (binary, _, _, errors) in zip(programs, listings, assembled):
+        if len(errors):
+            known = _is_known_error(listing, data, errors[0], clamp)
+            (result.known_mismatches if known else result.mismatches).append(f"{name} slot {slot}: {errors[0]}")
+        elif bytes(binary) != data:
+            differences, known = _differences(listing, data, bytes(binary), clamp)
+            mismatch = f"{name} slot {slot}: {differences[0]}" + \
+                (f" and {len(differences) - 1} more" if len(differences) > 1 else "")
+            (result.known_mismatches if known else result.mismatches).append(mismatch)
+    return result
+
+
+def run_round_trips(paths : Iterable[Path], repeat : int=DEFAULT_REPEAT) -> List[RoundTripResult]:
+    """Round trips a corpus with every combination of the clamp, spinreals and relative options"""
+    programs = corpus_programs(paths)
+    if not len(programs):
+        raise ValueError("The corpus has no programs")
+    return [round_trip(programs, *options, repeat=repeat)
+            for options in itertools.product((True, False), repeat=len(OPTION_NAMES))]
+
+
+def write_report(filepath : Path, paths : Iterable[Path], results : List[RoundTripResult]) -> None:
+    """Appends the results of a run to a JSON lines file, to follow speed and consistency over time"""
+    import json
+    from fv1_programmer.fv1 import __version__
+    record = {"time" : time.strftime("%Y-%m-%d %H:%M:%S"), "tool_version" : __version__,
+              "corpus" : [str(path) for path in paths],
+              "results" : [dict(r.options, programs=r.programs, disassemble_rate=round(r.disassemble_rate, 1),
+                                assemble_rate=round(r.assemble_rate, 1), mismatches=r.mismatches,
+                                known_mismatches=r.known_mismatches) for r in results]}
+    with open(filepath, 'a') as f:
+        f.write(json.dumps(record) + "\n")
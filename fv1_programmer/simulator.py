@@ -0,0 +1,502 @@
+import math
+import wave
+from array import array
+from pathlib import Path
+from typing import List, Tuple
+
+from fv1_programmer.isa import (
+    FV1_PROGRAM_LENGTH, FV1_DELAY_MEMORY_SIZE, Instruction, NOP, decode_program, signed, skip_target,
+    lfos_used, uses_pacc,
+    POT0, ADCL, ADCR, DACL, DACR, ADDR_PTR,
+    SKP_RUN, SKP_ZRC, SKP_ZRO, SKP_GEZ, SKP_NEG,
+    CHO_RDA, CHO_SOF, CHO_RDAL, CHO_COS, CHO_COMPC, CHO_COMPA, CHO_RPTR2, CHO_NA,
+)
+
+
+DEFAULT_BLOCK_SIZE = 4096
+
+_ACC_MIN = -(1 << 23)
+_ACC_MAX = (1 << 23) - 1
+_RAMP_RANGES = {0 : 4096, 1 : 2048, 2 : 1024, 3 : 512}
+
+_SAT = ["if acc > 8388607: acc = 8388607", "elif acc < -8388608: acc = -8388608"]
+
+# The (lowest, highest) values ACC can hold at a point of the program.
+# Registers, delay memory, LR and PACC can hold any 24-bit value.
+_FULL = (_ACC_MIN, _ACC_MAX)
+_ZERO = (0, 0)
+# Rounds of range analysis before assuming ACC can hold anything when a sample starts
+_RANGE_PASSES = 4
+
+
+def _log(acc, c, d):
+    """LOG: C * log2(|ACC|)/16 + D, with the log result clamped to S4.19"""
+    a = abs(acc)
+    l = max(math.log2(a / 8388608.0) / 16.0, -1.0) if a else -1.0
+    return ((int(l * 8388608.0) * c) >> 14) + d
+
+
+def _exp(acc, c, d):
+    """EXP: C * 2^(ACC*16) + D"""
+    x = acc * 16.0 / 8388608.0
+    v = _ACC_MAX if x >= 0 else int(2.0**x * 8388608.0)
+    return ((v * c) >> 14) + d
+
+
+def _hull(*ranges : tuple) -> tuple:
+    return min(r[0] for r in ranges), max(r[1] for r in ranges)
+
+
+def _times(x : tuple, c : int, bits : int) -> tuple:
+    """The range of (x * C) >> bits"""
+    low, high = (x[0] * c) >> bits, (x[1] * c) >> bits
+    return min(low, high), max(low, high)
+
+
+def _plus(x : tuple, y : tuple) -> tuple:
+    return x[0] + y[0], x[1] + y[1]
+
+
+def _saturate(acc : tuple) -> Tuple[List[str], tuple]:
+    """Saturates ACC, unless its range shows it cannot overflow"""
+    if acc[0] >= _ACC_MIN and acc[1] <= _ACC_MAX:
+        return [], acc
+    return _SAT, (max(acc[0], _ACC_MIN), min(acc[1], _ACC_MAX))
+
+
+class _State(object):
+    """The complete machine state carried from one sample (block) to the next"""
+    def __init__(self) -> None:
+        self.acc = 0
+        self.pacc = 0
+        self.lr = 0
+        self.ptr = 0
+        self.first = True
+        self.regs = [0]*64
+        self.mem = [0]*FV1_DELAY_MEMORY_SIZE
+        self.phase = [0.0, 0.0]
+        self.ramp = [0, 0]
+
+
+def _cho_lines(inst : Instruction, lfos : dict) -> List[str]:
+    """Generates the code for a CHO instruction"""
+    chotype, lfo, flags, arg = inst.args
+    lines = []
+    if lfo < 2:
+        # Sine LFO: the value is an offset in 1/512ths of a sample
+        v = f"cv{lfo}" if flags & CHO_COS else f"sv{lfo}"
+        lfos[lfo] |= 2 if flags & CHO_COS else 1
+        lines.append(f"v = {'-' if flags & CHO_COMPA else ''}{v}")
+        xfade = "8388607"
+    else:
+        # Ramp LFO: the value is a position in [0, 1) of the ramp range
+        k = lfo - 2
+        lfos[lfo] |= 1
+        pos = f"((rp{k} + 4194304) & 8388607)" if flags & CHO_RPTR2 else f"rp{k}"
+        if flags & CHO_COMPA:
+            pos = f"(8388607 - {pos})"
+        lines.append(f"pos = {pos}")
+        lines.append(f"v = (pos * (r{5 + 2*k} >> 8)) >> 14")
+        xfade = "(min(pos, 8388608 - pos) << 1)"
+
+    if flags & CHO_NA:
+        coef, shift = (f"(8388608 - {xfade})" if flags & CHO_COMPC else xfade), 23
+    else:
+        coef, shift = ("(512 - (v & 511))" if flags & CHO_COMPC else "(v & 511)"), 9
+
+    if chotype == CHO_RDA:
+        addr = arg & 0x7fff
+        if flags & CHO_NA:
+            lines.append(f"lr = mem[{_address(addr)}]")
+        else:
+            lines.append(f"lr = mem[(p + {addr} + (v >> 9)) & 32767]")
+        lines.append(f"acc += (lr * {coef}) >> {shift}")
+    elif chotype == CHO_SOF:
+        lines.append(f"acc = ((acc * {coef}) >> {shift}) + {signed(arg, 16) << 8}")
+    elif chotype == CHO_RDAL:
+        lines.append(f"acc = {xfade if flags & CHO_NA else ('v' if lfo < 2 else 'pos')}")
+    else:
+        return []
+    return lines
+
+
+def _scale(c : int, bits : int, acc : tuple) -> Tuple[List[str], tuple]:
+    """Generates ACC = ACC * C for a coefficient with `bits` fractional bits"""
+    if c == 0:
+        return ["acc = 0"], _ZERO
+    if c == 1 << bits or acc == _ZERO:
+        return [], acc
+    sat, acc = _saturate(_times(acc, c, bits))
+    return [f"acc = (acc * {c}) >> {bits}"] + sat, acc
+
+
+def _mac(x : str, c : int, bits : int, acc : tuple) -> Tuple[List[str], tuple]:
+    """Generates ACC = ACC + x * C, where x can hold any 24-bit value"""
+    if c == 0:
+        return [], acc
+    term = x if c == 1 << bits else f"({x} * {c}) >> {bits}"
+    line = f"acc = {term}" if acc == _ZERO else f"acc += {term}"
+    sat, acc = _saturate(_plus(acc, _times(_FULL, c, bits)))
+    return [line] + sat, acc
+
+
+def _address(addr : int) -> str:
+    """The delay memory index `addr` words after the pointer, which is kept in [-32768, -1]"""
+    return f"p + {addr}" if addr else "p"
+
+
+def _instruction_lines(inst : Instruction, lfos : dict, acc : tuple) -> Tuple[List[str], tuple]:
+    """
+    Generates the code for a single (non-SKP) instruction. `acc` is the range
+    of ACC before the instruction, and the range after it is returned with
+    the code.
+    """
+    m, a = inst.mnemonic, inst.args
+    if m in ('RDAX', 'RDFX', 'WRAX', 'WRHX', 'WRLX', 'MAXX'):
+        r, c = f"r{a[0]}", signed(a[1], 16)
+        if m == 'RDAX':
+            return _mac(r, c, 14, acc)
+        if m == 'RDFX':
+            if c == 0:
+                return [f"acc = {r}"], _FULL
+            # A coefficient in [0, 1.0] interpolates between ACC and REG
+            return [f"acc = (((acc - {r}) * {c}) >> 14) + {r}"] + ([] if 0 <= c <= 1 << 14 else _SAT), _FULL
+        if m == 'WRAX':
+            lines, acc = _scale(c, 14, acc)
+            return [f"{r} = acc"] + lines, acc
+        if m == 'WRHX':
+            sat, acc = _saturate(_plus(_times(acc, c, 14), _FULL))
+            return [f"{r} = acc", f"acc = ((acc * {c}) >> 14) + pacc"] + sat, acc
+        if m == 'WRLX':
+            return [f"{r} = acc", f"acc = (((pacc - acc) * {c}) >> 14) + pacc"] + _SAT, _FULL
+        high = max(-acc[0], acc[1], *(abs(v) for v in _times(_FULL, c, 14)))
+        sat, acc = _saturate((0, high))
+        return [f"acc = max(abs(acc), abs(({r} * {c}) >> 14))"] + sat, acc
+    if m == 'MULX':
+        products = [(x * y) >> 23 for x in acc for y in _FULL]
+        sat, acc = _saturate((min(products), max(products)))
+        return [f"acc = (acc * r{a[0]}) >> 23"] + sat, acc
+    if m in ('SOF', 'LOG', 'EXP'):
+        c, d = signed(a[0], 16), signed(a[1], 11) << 13
+        if m == 'SOF':
+            if d == 0:
+                return _scale(c, 14, acc)
+            sat, acc = _saturate(_plus(_times(acc, c, 14), (d, d)))
+            return [f"acc = ((acc * {c}) >> 14) + {d}"] + sat, acc
+        return [f"acc = _{m.lower()}(acc, {c}, {d})"] + _SAT, _FULL
+    if m == 'AND':
+        if a[0] == 0:
+            return ["acc = 0"], _ZERO
+        return [f"acc = ((acc & {a[0]}) ^ 8388608) - 8388608"], _FULL
+    if m in ('OR', 'XOR'):
+        op = '|' if m == 'OR' else '^'
+        return [f"acc = (((acc {op} {a[0]}) & 16777215) ^ 8388608) - 8388608"], _FULL
+    if m in ('RDA', 'WRA', 'WRAP'):
+        addr, c = a[0], signed(a[1], 11)
+        if m == 'RDA':
+            lines, acc = _mac("lr", c, 9, acc)
+            return [f"lr = mem[{_address(addr)}]"] + lines, acc
+        if m == 'WRA':
+            lines, acc = _scale(c, 9, acc)
+            return [f"mem[{_address(addr)}] = acc"] + lines, acc
+        sat, acc = _saturate(_plus(_times(acc, c, 9), _FULL))
+        return [f"mem[{_address(addr)}] = acc", f"acc = ((acc * {c}) >> 9) + lr"] + sat, acc
+    if m == 'RMPA':
+        lines, acc = _mac("lr", signed(a[0], 11), 9, acc)
+        return [f"lr = mem[(p + (r{ADDR_PTR} >> 8)) & 32767]"] + lines, acc
+    if m == 'WLDS':
+        return [f"r{2*a[0]} = {a[1] << 14}", f"r{2*a[0] + 1} = {a[2] << 8}"], acc
+    if m == 'WLDR':
+        k = a[0] & 1
+        return [f"r{4 + 2*k} = {signed(a[1], 16) << 8}", f"r{5 + 2*k} = {_RAMP_RANGES[a[2]] << 8}"], acc
+    if m == 'JAM':
+        return [f"rp{a[0] & 1} = 0"], acc
+    if m == 'CHO':
+        return _cho_lines(inst, lfos) + _SAT, _FULL
+    # RAW words (undefined opcodes) are treated as NOPs
+    return [], acc
+
+
+def _skip_condition(flags : int) -> str:
+    conditions = []
+    if flags & SKP_RUN:
+        conditions.append("not first")
+    if flags & SKP_ZRC:
+        conditions.append("(acc < 0) != (pacc < 0)")
+    if flags & SKP_ZRO:
+        conditions.append("acc == 0")
+    if flags & SKP_GEZ:
+        conditions.append("acc >= 0")
+    if flags & SKP_NEG:
+        conditions.append("acc < 0")
+    return " and ".join(conditions)
+
+
+def _program_body(instructions : List[Instruction], acc : tuple) -> Tuple[List[str], tuple, dict]:
+    """
+    Generates the code for one pass over the program, given the range of ACC
+    when a sample starts. Returns the code, the range of ACC at the end of
+    the pass and the LFO values the program reads.
+    """
+    # PACC at instruction i is ACC before instruction i-1
+    pacc_needed = {i for i, inst in enumerate(instructions) if uses_pacc(inst)}
+    save_pacc_before = {(i - 1) % FV1_PROGRAM_LENGTH for i in pacc_needed}
+
+    skips = [i for i, inst in enumerate(instructions) if inst.mnemonic == 'SKP' and inst.word != NOP.word]
+    block_starts = {0}
+    for i in skips:
+        block_starts.add(i + 1)
+        block_starts.add(skip_target(i, instructions[i]))
+    block_starts = sorted(b for b in block_starts if b < FV1_PROGRAM_LENGTH)
+
+    # LFO bit 0 = sine/ramp value used, bit 1 = cosine used
+    lfos = {0 : 0, 1 : 0, 2 : 0, 3 : 0}
+    # The range of ACC at each skip target, over every SKP that jumps there
+    skipped = {}
+
+    body = ["t = 0"] if skips else []
+    for b, start in enumerate(block_starts):
+        end = block_starts[b + 1] if b + 1 < len(block_starts) else FV1_PROGRAM_LENGTH
+        if start in skipped:
+            acc = _hull(acc, skipped.pop(start))
+        lines = []
+        for i in range(start, end):
+            inst = instructions[i]
+            if i in save_pacc_before:
+                lines.append("pacc = acc")
+            if inst.mnemonic == 'SKP':
+                if inst.word == NOP.word:
+                    continue
+                target = skip_target(i, inst)
+                target_block = min(target, FV1_PROGRAM_LENGTH)
+                skipped[target_block] = _hull(acc, skipped.get(target_block, acc))
+                taken = [f"t = {target}"]
+                if target % FV1_PROGRAM_LENGTH in pacc_needed and target > i + 1:
+                    taken.append("pacc = acc")
+                condition = _skip_condition(inst.args[0])
+                if condition:
+                    lines.append(f"if {condition}:")
+                    lines += ["    " + l for l in taken]
+                else:
+                    lines += taken
+            else:
+                code, acc = _instruction_lines(inst, lfos, acc)
+                lines += code
+        if not lines:
+            continue
+        if skips and start > 0:
+            body.append(f"if t <= {start}:")
+            body += ["    " + l for l in lines]
+        else:
+            body += lines
+
+    if FV1_PROGRAM_LENGTH in skipped:
+        acc = _hull(acc, skipped[FV1_PROGRAM_LENGTH])
+    return body, acc, lfos
+
+
+def compile_program(instructions : List[Instruction]):
+    """
+    Compiles a decoded program into a Python function that runs it over a
+    block of samples. The whole program is unrolled into straight-line code
+    operating on local variables. Forward SKPs split the program into
+    blocks, each guarded by a single comparison against the current skip
+    target.
+
+    Arithmetic follows the FV-1: ACC and registers are 24-bit (S.23)
+    integers that saturate after every operation, coefficients are applied
+    with their native fixed-point widths and truncated, and PACC holds the
+    ACC value from before the previous instruction. Delay memory holds full
+    24-bit words.
+
+    Saturation is only generated where the range of ACC (worked out from
+    the coefficients, with registers and delay memory holding any 24-bit
+    value) can leave 24 bits, and delay memory is indexed with a negative
+    pointer so fixed addresses need no masking. Even so, a full 128
+    instruction reverb takes 0.25-0.6 s of CPU per second of 32 kHz stereo
+    audio on a laptop (2-4x faster than real time, 15-36 s per minute), and
+    simple delays 0.05-0.15 s: every sample depends on the previous one, so
+    the program cannot be vectorised across a block and the cost is the
+    interpreter running each instruction.
+    """
+    instructions = list(instructions) + [NOP]*(FV1_PROGRAM_LENGTH - len(instructions))
+    used_lfos = set(l for inst in instructions for l in lfos_used(inst))
+
+    # ACC carries over from the previous sample. Starting from its reset
+    # value, widen its range until a pass over the program stays within it.
+    acc = _ZERO
+    for _ in range(_RANGE_PASSES):
+        body, end, lfos = _program_body(instructions, acc)
+        if end[0] >= acc[0] and end[1] <= acc[1]:
+            break
+        acc = _hull(acc, end)
+    else:
+        body, _, lfos = _program_body(instructions, _FULL)
+
+    # Registers referenced by the program live in local variables
+    registers = {POT0, POT0 + 1, POT0 + 2, ADCL, ADCR, DACL, DACR}
+    for inst in instructions:
+        if inst.mnemonic in ('RDAX', 'RDFX', 'WRAX', 'WRHX', 'WRLX', 'MAXX', 'MULX'):
+            registers.add(inst.args[0])
+        elif inst.mnemonic == 'RMPA':
+            registers.add(ADDR_PTR)
+    if used_lfos:
+        registers.update(range(0, 8))
+
+    lfo_update = []
+    for k in (0, 1):
+        if k in used_lfos:
+            lfo_update += [f"ph{k} += r{2*k} * 4.656612873077393e-10",
+                           f"if ph{k} > 6.283185307179586: ph{k} -= 6.283185307179586",
+                           f"sv{k} = int(sin(ph{k}) * r{2*k + 1})"]
+            if lfos[k] & 2:
+                lfo_update.append(f"cv{k} = int(cos(ph{k}) * r{2*k + 1})")
+    for k in (0, 1):
+        if k + 2 in used_lfos:
+            lfo_update.append(f"rp{k} = (rp{k} + ((r{4 + 2*k} >> 8) << 9) // max(r{5 + 2*k} >> 8, 1)) & 8388607")
+
+    src = ["def _run(state, inl, inr, outl, outr):",
+           "    acc = state.acc",
+           "    pacc = state.pacc",
+           "    lr = state.lr",
+           # A negative index wraps around the end of delay memory
+           "    p = state.ptr - 32768",
+           "    first = state.first",
+           "    mem = state.mem",
+           "    regs = state.regs",
+           "    ph0, ph1 = state.phase",
+           "    rp0, rp1 = state.ramp",
+           "    sv0 = sv1 = cv0 = cv1 = 0"]
+    src += [f"    r{r} = regs[{r}]" for r in sorted(registers)]
+    src += [f"    for n, (r{ADCL}, r{ADCR}) in enumerate(zip(inl, inr)):"]
+    src += ["        " + l for l in lfo_update + body]
+    src += [f"        outl[n] = r{DACL}",
+            f"        outr[n] = r{DACR}",
+            "        p = p - 1 if p > -32768 else -1",
+            "        first = False",
+            "    state.acc = acc",
+            "    state.pacc = pacc",
+            "    state.lr = lr",
+            "    state.ptr = p + 32768",
+            "    state.first = first",
+            "    state.phase = [ph0, ph1]",
+            "    state.ramp = [rp0, rp1]"]
+    src += [f"    regs[{r}] = r{r}" for r in sorted(registers)]
+
+    namespace = {"sin" : math.sin, "cos" : math.cos, "_log" : _log, "_exp" : _exp}
+    exec(compile("\n".join(src), "<fv1 program>", "exec"), namespace)
+    return namespace["_run"]
+
+
+class FV1Simulator(object):
+    """
+    An offline FV-1 simulator. Audio is processed in blocks of 24-bit (S.23)
+    integer samples through a compiled version of the program.
+    """
+    def __init__(self, program : bytes, pots : Tuple[float, float, float]=(0.5, 0.5, 0.5)) -> None:
+        self.instructions = decode_program(program)
+        self._run = compile_program(self.instructions)
+        self.pots = tuple(pots)
+        self.reset()
+
+    @classmethod
+    def from_asm(cls, asm : str, clamp=True, spinreals=False, optimize=False, **kwargs):
+        """Assembles SpinASM source and returns a simulator for it."""
+        from fv1_programmer.fv1 import FV1Program
+        program, _, _, errors = FV1Program(asm).assemble(clamp=clamp, spinreals=spinreals, optimize=optimize)
+        if program is None or len(errors):
+            raise ValueError("\n".join(errors) if len(errors) else "Failed to assemble program")
+        return cls(program, **kwargs)
+
+    def reset(self) -> None:
+        """Resets the simulator as if the pedal was power cycled."""
+        self.state = _State()
+
+    def process(self, left : List[int], right : List[int]) -> Tuple[List[int], List[int]]:
+        """Runs the program over a block of 24-bit input samples."""
+        for i, pot in enumerate(self.pots):
+            self.state.regs[POT0 + i] = min(max(int(pot*(1 << 23)), 0), _ACC_MAX)
+        out_left = [0]*len(left)
+        out_right = [0]*len(right)
+        self._run(self.state, left, right, out_left, out_right)
+        return out_left, out_right
+
+
+def _decode_frames(data : bytes, sample_width : int) -> List[int]:
+    """Converts little-endian PCM to a list of S.23 integers"""
+    if sample_width == 2:
+        samples = array('h')
+        samples.frombytes(data)
+        return [s << 8 for s in samples]
+    elif sample_width == 3:
+        padded = bytearray(len(data) // 3 * 4)
+        padded[1::4] = data[0::3]
+        padded[2::4] = data[1::3]
+        padded[3::4] = data[2::3]
+        samples = array('i')
+        samples.frombytes(bytes(padded))
+        return [s >> 8 for s in samples]
+    elif sample_width == 4:
+        samples = array('i')
+        samples.frombytes(data)
+        return [s >> 8 for s in samples]
+    raise ValueError(f"Unsupported WAV sample width {sample_width*8} bits")
+
+
+def _encode_frames(samples : List[int], sample_width : int) -> bytes:
+    """Converts a list of S.23 integers to little-endian PCM"""
+    if sample_width == 2:
+        return array('h', [s >> 8 for s in samples]).tobytes()
+    padded = array('i', [s << 8 for s in samples]).tobytes()
+    if sample_width == 4:
+        return padded
+    data = bytearray(len(samples)*3)
+    data[0::3] = padded[1::4]
+    data[1::3] = padded[2::4]
+    data[2::3] = padded[3::4]
+    return bytes(data)
+
+
+def render_wav(simulator : FV1Simulator, input_path : Path, output_path : Path,
+               block_size : int=DEFAULT_BLOCK_SIZE, tail_seconds : float=0.0) -> int:
+    """
+    Streams a mono or stereo PCM WAV file through the simulator, writing a
+    stereo WAV with the same sample rate and width. Returns the number of
+    frames written.
+    """
+    with wave.open(str(input_path), 'rb') as wav_in, wave.open(str(output_path), 'wb') as wav_out:
+        channels = wav_in.getnchannels()
+        width = wav_in.getsampwidth()
+        rate = wav_in.getframerate()
+        if channels not in (1, 2):
+            raise ValueError("Only mono and stereo WAV files are supported")
+        wav_out.setnchannels(2)
+        wav_out.setsampwidth(width)
+        wav_out.setframerate(rate)
+
+        frames = 0
+        tail = int(tail_seconds*rate)
+        while True:
+            data = wav_in.readframes(block_size)
+            if not data:
+                if tail <= 0:
+                    break
+                # Let reverbs and delays ring out
+                n = min(tail, block_size)
+                tail -= n
+                left = right = [0]*n
+            else:
+                samples = _decode_frames(data, width)
+                if channels == 2:
+                    left, right = samples[0::2], samples[1::2]
+                else:
+                    left = right = samples
+
+            out_left, out_right = simulator.process(left, right)
+            interleaved = [0]*(2*len(out_left))
+            interleaved[0::2] = out_left
+            interleaved[1::2] = out_right
+            wav_out.writeframes(_encode_frames(interleaved, width))
+            frames += len(out_left)
+
+    return frames
@@ -1,9 +1,12 @@
 from __future__ import annotations
 import logging
-import json
 import re
 import os
 import shlex
+import time
+from collections import deque
+from contextlib import contextmanager
+from dataclasses import dataclass, field
 
 from rich.console import RenderableType
 
@@ -17,6 +20,7 @@ from textual.containers import Container, Horizontal, VerticalScroll
 from textual.screen import Screen
 from textual.worker import get_current_worker
 from textual.message import Message
+from textual.geometry import Size
 from textual.widget import Widget
 from textual.widgets import (
     Footer,
@@ -27,33 +31,53 @@ from textual.widgets import (
     TabPane,
     Switch,
     TextArea,
-    ContentSwitcher,
     Markdown,
 )
 
 from functools import partial
-from typing import Iterable, Tuple
+from typing import Iterable, Tuple, TYPE_CHECKING
 from pathlib import Path
-import pyperclip
-from fv1_programmer.fv1 import FV1Program, FV1_PROGRAM_MAX_BYTES
+from fv1_programmer.fv1 import FV1Program, FV1_PROGRAM_MAX_BYTES, __version__, source_hash
+from fv1_programmer.bank import (bank_address, num_banks, write_image, read_bank, write_bank, bank_entry,
+                                  IMAGE_FILE_SUFFIXES, FV1_BANK_MAX_BYTES)
 from fv1_programmer.dialogs import *
 
+# Everything else is imported when it's first used, to keep startup quick
+if TYPE_CHECKING:
+    from eeprom.eeprom import TransferProgress, ProgressEvent
+    from fv1_programmer.devicequeue import DeviceQueue, DeviceOperation
 
-__version__ = "0.5.2"
 
 _title = "FV1 Programmer"
 MIN_PROGRAM_NUM = 1
 MAX_PROGRAM_NUM = 8
+LIBRARY_REFRESH_INTERVAL = 30.0
+# Console log lines retained, and how often new lines are written to it
+LOG_MAX_LINES = 2000
+LOG_FLUSH_INTERVAL = 1/30
+# Live sync writes a slot once editing pauses for this long, with at most this many syncs queued
+LIVE_SYNC_DELAY = 0.5
+LIVE_SYNC_MAX_PENDING = 2
+# Files read (and assembled) at once when several are dropped
+LOAD_FILE_WORKERS = 8
 
 class FV1AppCommands(Provider):
     """A command provider to open a Python file in the current working directory."""
 
     async def startup(self) -> None:
         """Called once when the command palette is opened"""
+        # Pick up any library changes in the background while the user types
+        self.screen.refresh_library(min_interval=LIBRARY_REFRESH_INTERVAL)
         self.discovery_commands = [
             ("Rename current program", self.screen.action_rename_program_slot, "Provide your own name for this program slot"),
             ("New program", self.screen.action_new, "Create a new, empty program in current slot (Ctr+N)"),
             ("Delete current program", self.screen.action_delete,"Delete any program in current slot"),
+            ("Analyze current program", self.screen.action_analyze_program, "Log instruction, delay memory, register and LFO usage"),
+            ("Filter log to current program", self.screen.action_filter_log_to_program, "Only show log messages for the program in the current slot"),
+            ("Show all log messages", self.screen.action_show_all_log, "Remove any log filter"),
+            ("Write all programs", partial(self.screen.action_write_eeprom, force=True), "Write every program, even those that haven't changed since they were last written or read"),
+            ("Show device queue", self.screen.action_show_device_queue, "Log the queued EEPROM reads and writes"),
+            ("Cancel device operations", self.screen.cancel_eeprom_operation, "Cancel every queued EEPROM read and write"),
         ]
 
     async def discover(self,) -> Hits:
@@ -79,31 +103,39 @@ class FV1AppCommands(Provider):
                     help=f"Swap this slot with slot {i}",
                 )
 
+        # Bank selection on EEPROMs holding more than one bank of programs
+        for bank in range(1, num_banks(app.cmdline_args.ee_size) + 1):
+            command = f"Use bank {bank}"
+            score = matcher.match(command)
+            if score > 0:
+                yield Hit(
+                    score,
+                    matcher.highlight(command),
+                    partial(self.screen.use_bank, bank),
+                    help=f"Read and write the programs in bank {bank} of the EEPROM",
+                )
 
-class FV1ProgramPane(Widget):
-    program : reactive[FV1Program | None] = reactive(None)
-
-    def compose(self) -> ComposeResult:
-        with ContentSwitcher(initial="empty-slot"):
-            with VerticalScroll(id="empty-slot"):
-                yield Markdown()
-            yield TextArea.code_editor("", id="text-area-slot")
+        # Programs from the library index
+        for entry in (app.library.search(query) if app.library is not None else []):
+            command = f"Load {entry.name}"
+            score = matcher.match(command)
+            source = f"{entry.path}" if entry.slot is None else f"{entry.path} (slot {entry.slot})"
+            yield Hit(
+                max(score, 0.1),
+                matcher.highlight(command),
+                partial(self.screen.load_library_program, entry),
+                help=f"{source}, {entry.instructions} instructions. {entry.comments}",
+            )
 
-    def watch_program(self, new_program: FV1Program):
-        if new_program is not None:
-            self.query_one(ContentSwitcher).current = "text-area-slot"
-            self.query_one(TextArea).text = new_program.assembly
-        else:
-            self.query_one(ContentSwitcher).current = "empty-slot"
 
-    def on_mount(self) -> None:
-        self.query_one(Markdown).update("""# Empty Program Slot
+EMPTY_SLOT_HELP = """# Empty Program Slot
 This is an empty program slot that will be ignored when downloading to the Easy Spin pedal (unless you add a program). <br>
 
 To add a program to this slot, you can do one of the following:
 
 - Click [here](#new-program) or press Ctrl+N to [create a new program for editing](#new-program)
 - Drag and drop an appropriate file onto this window (SpinASM .spn file, Audiofab fv1_programmer .json)
+- Drag and drop several .spn files at once to fill the empty slots from this one
 
 ## Useful Information
 
@@ -117,45 +149,112 @@ Spin Semiconductor: http://www.spinsemi.com/products.html \n
 SpinCAD Designer: https://holy-city-audio.gitbook.io/spincad-designer \n
 Mark Stratman's FV-1 Programs Directory: https://mstratman.github.io/fv1-programs/ \n
 Textual documentation for the editor keybindings: https://textual.textualize.io/widgets/text_area/#bindings \n
-""")
+"""
+
+
+class ProgramEditor(TextArea):
+    """
+    The program code editor. TextArea only sizes its content on resize, so
+    do it on mount as well for editors mounted after the screen is laid out.
+    """
+    def on_mount(self) -> None:
+        width, height = self.document.get_size(self.indent_width)
+        self.virtual_size = Size(width + self.gutter_width + 1, height)
 
-    @on(Markdown.LinkClicked)
-    def on_click(self, event):
-        if event.href == "#new-program":
-            self.program = FV1Program("")
-        elif event.href == "#command-palette":
-            self.app.main_screen.action_command_palette()
+
+class FV1ProgramPane(Widget):
+    """
+    A program slot. The editor is only created once the slot's tab has been
+    shown and it has a program, empty slots share the help view in ProgramTabs.
+    """
+    program : reactive[FV1Program | None] = reactive(None)
+
+    def __init__(self, *args, **kwargs) -> None:
+        super().__init__(*args, **kwargs)
+        self.activated = False
+
+    @property
+    def editor(self) -> TextArea | None:
+        editors = self.query(TextArea)
+        return editors.first() if len(editors) else None
+
+    def activate(self) -> None:
+        """Called when the slot's tab is shown"""
+        self.activated = True
+        self.update_editor()
+
+    def update_editor(self) -> None:
+        editor = self.editor
+        if self.program is None:
+            if editor is not None:
+                editor.display = False
+        elif editor is None:
+            if self.activated:
+                self.mount(ProgramEditor.code_editor(self.program.assembly, id="text-area-slot"))
+        else:
+            editor.display = True
+            if editor.text != self.program.assembly:
+                editor.text = self.program.assembly
+
+    def focus_editor(self) -> None:
+        """Focuses the editor once it has been mounted (it isn't until the slot has been shown)"""
+        def focus() -> None:
+            if self.editor is not None:
+                self.editor.focus()
+        self.call_after_refresh(focus)
+
+    def watch_program(self, new_program: FV1Program):
+        # Show the editor area before mounting the editor so it is laid out with a size
+        self.screen.query_one(ProgramTabs).update_help()
+        self.update_editor()
 
     @on(TextArea.Changed)
     def on_changed(self, event):
-        self.program.asm = self.query_one(TextArea).text
-        self.query_one(TextArea).focus()
+        # Text set from the program (loading a file, reading the pedal) already matches its source
+        edited = event.text_area.text != self.program.asm
+        self.program.asm = event.text_area.text
+        event.text_area.focus()
+        if edited:
+            self.screen.schedule_live_sync(int(self.id.split("prog")[1]))
+
+
+class EmptySlotHelp(VerticalScroll):
+    def compose(self) -> ComposeResult:
+        yield Markdown(EMPTY_SLOT_HELP)
 
 
 class ProgramTabs(Widget):
     def compose(self) -> ComposeResult:  
         with TabbedContent():
-            with TabPane("Program 1", id="prog1"):
-                yield FV1ProgramPane(id="fv1prog1")
-            with TabPane("Program 2", id="prog2"):
-                yield FV1ProgramPane(id="fv1prog2")
-            with TabPane("Program 3", id="prog3"):
-                yield FV1ProgramPane(id="fv1prog3")
-            with TabPane("Program 4", id="prog4"):
-                yield FV1ProgramPane(id="fv1prog4")
-            with TabPane("Program 5", id="prog5"):
-                yield FV1ProgramPane(id="fv1prog5")
-            with TabPane("Program 6", id="prog6"):
-                yield FV1ProgramPane(id="fv1prog6")
-            with TabPane("Program 7", id="prog7"):
-                yield FV1ProgramPane(id="fv1prog7")
-            with TabPane("Program 8", id="prog8"):
-                yield FV1ProgramPane(id="fv1prog8")
-
-    # @on(TabbedContent.TabActivated)
-    # def on_tab_changed(self, event):
-    #     self.app.logger.info(event.pane.query_one(TextArea))
-    #     event.pane.query_one(TextArea).focus()
+            for i in range(MIN_PROGRAM_NUM, MAX_PROGRAM_NUM + 1):
+                with TabPane(f"Program {i}", id=f"prog{i}"):
+                    yield FV1ProgramPane(id=f"fv1prog{i}")
+        yield EmptySlotHelp(id="empty-slot")
+
+    @property
+    def active_pane(self) -> FV1ProgramPane | None:
+        active = self.query_one(TabbedContent).active
+        return self.query_one(f"#fv1{active}", FV1ProgramPane) if active else None
+
+    def update_help(self) -> None:
+        """Shows the shared help view in place of the editor when the active slot is empty"""
+        pane = self.active_pane
+        empty = pane is None or pane.program is None
+        self.query_one(TabbedContent).set_class(empty, "-empty")
+        self.query_one(EmptySlotHelp).display = empty
+
+    @on(TabbedContent.TabActivated)
+    def on_tab_activated(self, event : TabbedContent.TabActivated) -> None:
+        self.update_help()
+        self.active_pane.activate()
+
+    @on(Markdown.LinkClicked)
+    def on_click(self, event):
+        if event.href == "#new-program":
+            self.active_pane.program = FV1Program("")
+        elif event.href == "#command-palette":
+            self.app.main_screen.action_command_palette()
+
 
 class Title(Static):
     pass
@@ -187,19 +286,63 @@ class Sidebar(Container):
         with VerticalScroll():
             yield Title("Settings")
             yield OptionSwitch("setting_verify_writes", "Verify Writes")
+            yield OptionSwitch("setting_live_sync", "Live Sync Edits to Pedal")
             yield OptionSwitch("setting_asfv1_clamp", "Clamp Values (asfv1)")
             yield OptionSwitch("setting_asfv1_spinreals", "Spin Reals (asfv1)")
+            yield OptionSwitch("setting_optimize", "Optimize Programs")
             yield OptionSwitch("setting_disfv1_relative", "Use Relative SKP Targets (disfv1)")
             yield OptionSwitch("setting_disfv1_suppressraw", "Convert Invalid Statements to NOP (disfv1)")
+            yield OptionSwitch("setting_profile", "Profile Operations")
+
+
+class ConsoleLogHandler(logging.Handler):
+    """
+    Collects log lines for the console log. Records can be logged from any
+    thread and are written to the RichLog in batches by MainScreen. Records
+    logged with `extra={"slot": n}` can be filtered by program slot.
+    """
+    def __init__(self, max_lines : int=LOG_MAX_LINES) -> None:
+        super().__init__()
+        # (slot, line) tuples, only the most recent max_lines are kept
+        self.history = deque(maxlen=max_lines)
+        self.pending = deque(maxlen=max_lines)
+
+    def emit(self, record : logging.LogRecord) -> None:
+        slot = getattr(record, "slot", None)
+        for line in self.format(record).rstrip().splitlines() or [""]:
+            self.history.append((slot, line))
+            self.pending.append((slot, line))
+
+    def take_pending(self) -> list:
+        self.acquire()
+        try:
+            lines = list(self.pending)
+            self.pending.clear()
+        finally:
+            self.release()
+        return lines
+
 
+@dataclass
+class DeviceRequest:
+    """The device operations queued by one read or write, by program slot"""
+    kind : str
+    device : str
+    progress : TransferProgress
+    operations : dict = field(default_factory=dict)
+    # Slots whose write was cancelled part way through
+    partial : set = field(default_factory=set)
+    # Slots cancelled for this request only, their operations carry on for later requests merged into them
+    cancelled : set = field(default_factory=set)
+    busy_screen : BusyScreen = None
 
-class ConsoleLogStream:
-    def __init__(self, log_cb) -> None:
-        self.log = log_cb
-        self.name = "Console Log"
+    @property
+    def finished(self) -> bool:
+        return all(op.finished or slot in self.cancelled for slot, op in self.operations.items())
 
-    def write(self, s):
-        self.log(str(s).rstrip())
+    def state(self, slot : int) -> str:
+        """The state of the operation of a slot, as far as this request is concerned"""
+        return "cancelled" if slot in self.cancelled else self.operations[slot].state
 
 
 class MainScreen(Screen):
@@ -220,23 +363,27 @@ class MainScreen(Screen):
 
     show_sidebar = reactive(False)
 
-    class WriteEepromResult(Message):
-        def __init__(self, programs : Iterable[dict], error=None) -> None:
-            self.programs = programs
-            self.error = error
+    class DeviceOperationChanged(Message):
+        def __init__(self, operation : DeviceOperation) -> None:
+            self.operation = operation
             super().__init__()
 
-    class ReadEepromResult(Message):
-        def __init__(self, programs : Iterable[dict], error = None) -> None:
-            self.programs = programs
-            self.error = error
+    class FilesLoaded(Message):
+        def __init__(self, results : list) -> None:
+            self.results = results
+            super().__init__()
+
+    class EepromProgress(Message):
+        def __init__(self, event : ProgressEvent) -> None:
+            self.event = event
             super().__init__()
 
     def compose(self) -> ComposeResult:
         with Container():
             yield Sidebar(classes="-hidden")
             yield Header(show_clock=True)
-            yield RichLog(id="consolelog", classes="-hidden", wrap=False, highlight=True, markup=True)
+            yield RichLog(id="consolelog", classes="-hidden", wrap=False, highlight=True, markup=True,
+                          max_lines=LOG_MAX_LINES)
             yield ProgramTabs()
             yield Footer()
 
@@ -253,18 +400,80 @@ class MainScreen(Screen):
     def console_log(self, renderable: RenderableType) -> None:
         self.query_one(RichLog).write(renderable)
 
+    def flush_console_log(self) -> None:
+        """Writes any new log lines to the console log in one go"""
+        lines = [line for slot, line in self.console_log_handler.take_pending()
+                 if self.log_slot_filter is None or slot == self.log_slot_filter]
+        if len(lines):
+            self.console_log("\n".join(lines))
+
+    def filter_console_log(self, slot : int | None) -> None:
+        """Only shows log messages for program `slot` (or everything if None)"""
+        self.log_slot_filter = slot
+        console = self.query_one(RichLog)
+        console.clear()
+        console.border_title = f"Program {slot} only" if slot is not None else None
+        self.console_log_handler.take_pending()
+        lines = [line for s, line in self.console_log_handler.history if slot is None or s == slot]
+        if len(lines):
+            self.console_log("\n".join(lines))
+
+    def action_filter_log_to_program(self) -> None:
+        self.filter_console_log(int(self.query_one(TabbedContent).active.split("prog")[1]))
+
+    def action_show_all_log(self) -> None:
+        self.filter_console_log(None)
+
     def on_mount(self) -> None:
-        sh = logging.StreamHandler(stream=ConsoleLogStream(self.console_log))
-        sh.setLevel(logging.INFO)
-        self.app.logger.addHandler(sh)
+        self.log_slot_filter = None
+        self.console_log_handler = ConsoleLogHandler()
+        self.console_log_handler.setLevel(logging.INFO)
+        self.app.logger.addHandler(self.console_log_handler)
+        self.set_interval(LOG_FLUSH_INTERVAL, self.flush_console_log)
         self.app.logger.info(f"FV1 Programmer version {__version__}")
+        self._library_refreshed = None
+        self._device_queue = None
+        self.device_requests = []
+        self.device_progress = None
+        # Live sync timers by slot
+        self.live_sync_timers = {}
+        # (device, address) -> (data known to be on the device, (source hash, assembler options) it came from)
+        self.synced = {}
+        # Slots that dropped files are being loaded into
+        self.loading_slots = set()
+        self.show_bank()
+
+    def show_bank(self) -> None:
+        """
+        Shows the bank being read and written (if the EEPROM has more than one)
+        and the queued device operations in the header
+        """
+        status = []
+        if num_banks(self.app.cmdline_args.ee_size) > 1:
+            status.append(f"Bank {self.app.setting_bank}")
+        pending = self.pending_device_operations()
+        if len(pending):
+            done = f" {100*self.device_progress.fraction:.0f}%" if self.device_progress is not None else ""
+            queued = f", {len(pending) - 1} queued" if len(pending) > 1 else ""
+            status.append(f"{pending[0].description}{done}{queued}")
+        self.sub_title = " | ".join(status)
+
+    def use_bank(self, bank : int) -> None:
+        """Reads and writes bank `bank` of the EEPROM from now on"""
+        self.app.setting_bank = bank
+        self.show_bank()
+        self.app.logger.info(f"Using bank {bank} (EEPROM address 0x{bank_address(bank):04x})")
 
     def action_request_quit(self,) -> None:
         def check_quit(should_quit : bool) -> None:
             if should_quit:
+                if self._device_queue is not None:
+                    self._device_queue.cancel()
                 self.app.do_exit()
 
-        self.app.push_screen(YesNoScreen("Are you sure you want to quit?",
+        pending = len(self.pending_device_operations())
+        message = f"{pending} device operations are still queued.\n" if pending else ""
+        self.app.push_screen(YesNoScreen(f"{message}Are you sure you want to quit?",
                                          yes_variant="error"), check_quit)
 
     def action_command_palette(self) -> None:
@@ -301,19 +510,17 @@ class MainScreen(Screen):
         self.app.push_screen(RenameSlotScreen(), handle_program_rename)
 
     def load_json_file(self, path : Path) -> None:
-        with open(str(path), 'r') as f:
-            d = json.load(f)
-            programs = d.get("programs", [None]*8)
-            for i in range(MIN_PROGRAM_NUM, MAX_PROGRAM_NUM + 1):
-                program_pane = self.query_one(f"#fv1prog{i}", FV1ProgramPane)
-                if programs[i - 1] is not None:
-                    if isinstance(programs[i - 1], str):
-                        program_pane.program = FV1Program(programs[i - 1])
-                        self.rename_program_slot(i, f"Program {i}")
-                    else:
-                        self.rename_program_slot(i, programs[i - 1].get("name", f"Program {i}"))
-                        prog = programs[i - 1].get("asm", None)
-                        program_pane.program = FV1Program(prog) if prog is not None else prog
+        bank = read_bank(path)
+        for index in range(min(MAX_PROGRAM_NUM, len(bank.programs))):
+            # Programs dumped from a device go back to their place in the bank
+            i = (bank.slots[index] - 1) % MAX_PROGRAM_NUM + 1 if bank.slots[index] is not None else index + 1
+            program_pane = self.query_one(f"#fv1prog{i}", FV1ProgramPane)
+            if bank.programs[index] is not None or bank.names[index] is not None:
+                self.rename_program_slot(i, bank.names[index] or f"Program {i}")
+                program_pane.program = bank.programs[index]
+        if bank.options is not None and bank.options != self.assemble_options:
+            self.app.logger.info(f"{path} was assembled with different options ({bank.options}), "
+                                 f"its programs will be assembled again")
 
         self.app.show_toast(f"Loaded programs from {path}")
 
@@ -324,6 +531,121 @@ class MainScreen(Screen):
             self.rename_program_slot(slot_number, path.stem)
         self.app.show_toast(f"Loaded {path}")
 
+    def load_spn_files(self, paths : Iterable[Path]) -> None:
+        """
+        Loads several .spn files (in name order) into consecutive empty slots
+        from the current one. If there aren't enough, asks to replace the
+        programs in the slots from the current one instead.
+        """
+        paths = sorted(paths, key=lambda p: p.name.lower())
+        start = int(self.query_one(TabbedContent).active.split("prog")[1])
+        slots = list(range(start, MAX_PROGRAM_NUM + 1))
+        empty = [i for i in slots if self.query_one(f"#fv1prog{i}", FV1ProgramPane).program is None
+                 and i not in self.loading_slots]
+
+        def load(targets):
+            if len(paths) > len(targets):
+                self.app.logger.warning(f"No slot for {', '.join(p.name for p in paths[len(targets):])}")
+            targets = list(zip(targets, paths))
+            self.loading_slots.update(slot for slot, _ in targets)
+            self.load_spn_files_worker(targets, self.assemble_options)
+
+        # Slots still loading earlier files are never replaced
+        free = [i for i in slots if i not in self.loading_slots]
+        if len(empty) >= min(len(paths), len(free)):
+            load(empty)
+        else:
+            targets = free[:len(paths)]
+            def check_overwrite(should_overwrite : bool) -> None:
+                if should_overwrite:
+                    # Files may have started loading while the question was shown
+                    load([i for i in targets if i not in self.loading_slots])
+            self.app.push_screen(YesNoScreen(f"There are only {len(empty)} empty slots from slot {start}.\n"
+                                             f"Replace the programs in slots {', '.join(str(i) for i in targets)}?"),
+                                 check_overwrite)
+
+    @work(thread=True, group="load_files")
+    def load_spn_files_worker(self, targets : Iterable[Tuple[int, Path]], options : dict) -> None:
+        """Reads and assembles (caching the result in each program) the files for each slot"""
+        from concurrent.futures import ThreadPoolExecutor
+        def load(target):
+            slot, path = target
+            try:
+                with open(path, 'r') as f:
+                    program = FV1Program(f.read())
+            except (OSError, UnicodeDecodeError) as e:
+                return slot, path, None, str(e)
+            program.assemble(**options)
+            return slot, path, program, None
+
+        with self.profiled("Load files"):
+            with ThreadPoolExecutor(max_workers=LOAD_FILE_WORKERS) as executor:
+                results = list(executor.map(load, targets))
+        self.post_message(self.FilesLoaded(results))
+
+    def on_main_screen_files_loaded(self, message : MainScreen.FilesLoaded) -> None:
+        """Shows the programs loaded by load_spn_files() in one go"""
+        loaded, failed = [], []
+        with self.app.batch_update():
+            for slot, path, program, error in message.results:
+                self.loading_slots.discard(slot)
+                if program is None:
+                    self.app.logger.error(f"Failed to load {path}: {error}")
+                    failed.append(path.name)
+                    continue
+                self.query_one(f"#fv1prog{slot}", FV1ProgramPane).program = program
+                self.rename_program_slot(slot, path.stem)
+                loaded.append(slot)
+                _, _, _, errors = program.assemble(**self.assemble_options)
+                if len(errors):
+                    self.app.logger.warning(f"Program {slot} ({path.name}) doesn't assemble, "
+                                            f"assemble it (Ctrl+B) for details", extra={"slot" : slot})
+        if len(failed):
+            self.app.show_toast(f"Failed to load {', '.join(failed)}. See log for details.", severity="error")
+        if len(loaded):
+            self.app.show_toast(f"Loaded {len(loaded)} programs into slots {loaded}")
+
+    def load_library_program(self, entry) -> None:
+        """Loads a program from the library index into the current slot"""
+        try:
+            asm = self.app.library.load(entry,
+                                        relative=self.app.setting_disfv1_relative,
+                                        suppressraw=self.app.setting_disfv1_suppressraw)
+        except Exception as e:
+            self.app.logger.error(f"Failed to load {entry.path}: {e}")
+            self.app.show_toast(f"Failed to load {entry.name}. See log for details.", severity="error")
+            return
+
+        active_tab_id = self.query_one(TabbedContent).active
+        active_slot = active_tab_id.split("prog")[1]
+        self.query_one(f"#fv1{active_tab_id}", FV1ProgramPane).program = FV1Program(asm)
+        self.rename_program_slot(active_slot, entry.name)
+        self.app.show_toast(f"Loaded {entry.name}")
+
+    def refresh_library(self, min_interval : float=0.0) -> None:
+        """Starts a background refresh of the program library index (if there is a library)"""
+        now = time.monotonic()
+        if self.app.library is None or \
+                (self._library_refreshed is not None and now - self._library_refreshed < min_interval):
+            return
+        self._library_refreshed = now
+        if not self.app.library.exists:
+            self.app.logger.info(f"Creating the program library index {self.app.library.db_path} for "
+                                 f"{', '.join(str(root) for root in self.app.library_roots)}")
+        self.refresh_library_worker(self.app.library_roots)
+
+    @work(exclusive=True, thread=True, group="library")
+    def refresh_library_worker(self, roots : Iterable[Path]) -> None:
+        worker = get_current_worker()
+        try:
+            indexed, removed = self.app.library.refresh(roots, is_cancelled=lambda: worker.is_cancelled)
+        except Exception as e:
+            self.app.call_from_thread(self.app.logger.warning, f"Program library refresh failed: {e}")
+        else:
+            if indexed or removed:
+                self.app.call_from_thread(self.app.logger.debug,
+                                          f"Program library: {indexed} files indexed, {removed} removed")
+
     def handle_load_file(self, path : Path) -> None:
         if path is not None and path.exists() and path.is_file():
             if path.suffix.lower() == ".json":
@@ -361,33 +683,56 @@ class MainScreen(Screen):
         
         try:
             filepaths = _extract_filepaths(event.text)
-            if filepaths and len(filepaths) > 0:
-                # To keep things simple for now, we only support
-                # dropping a single file
+            spn_files = [path for path in filepaths if path.suffix.lower() == ".spn"]
+            if len(filepaths) == 1:
                 self.handle_load_file(filepaths[0])
+            elif len(spn_files):
+                # Several programs fill consecutive slots
+                if len(spn_files) < len(filepaths):
+                    self.app.show_toast("Only .spn files are loaded when dropping several files.", severity="warning")
+                self.load_spn_files(spn_files)
 
         except ValueError:
             pass
 
-    def action_save(self) -> None:
-        d = {"programs" : []}
+    @property
+    def assemble_options(self) -> dict:
+        return {"clamp" : self.app.setting_asfv1_clamp, "spinreals" : self.app.setting_asfv1_spinreals,
+                "optimize" : self.app.setting_optimize}
 
-        for i in range(MIN_PROGRAM_NUM, MAX_PROGRAM_NUM + 1):
-            program_pane = self.query_one(f"#fv1prog{i}", FV1ProgramPane)
-            prog_d = {}
-            prog_d["asm"] = program_pane.program.asm if program_pane.program is not None else None
-            prog_d["name"] = str(self.query_one(TabbedContent).get_tab(f"prog{i}").label)
-            d["programs"].append(prog_d)
+    def action_save(self) -> None:
+        def bank_programs():
+            # Programs that assemble are stored with their binary, so loading the bank doesn't need the assembler
+            programs = []
+            for i in range(MIN_PROGRAM_NUM, MAX_PROGRAM_NUM + 1):
+                program_pane = self.query_one(f"#fv1prog{i}", FV1ProgramPane)
+                name = str(self.query_one(TabbedContent).get_tab(f"prog{i}").label)
+                if program_pane.program is None:
+                    programs.append({"asm" : None, "name" : name})
+                else:
+                    programs.append(bank_entry(program_pane.program, name, self.assemble_options))
+            return programs
 
         def handle_save_file(filename : str) -> None:
             def do_save_file(file_path):
-                with open(file_path, 'w') as f:
-                    json.dump(d, f, indent=2)
-                    self.app.show_toast(f"Programs saved to {file_path}")
+                if file_path.suffix.lower() in IMAGE_FILE_SUFFIXES:
+                    # Export the assembled programs as an EEPROM image of the current bank
+                    programs, num_errors = self.action_assemble_programs()
+                    if num_errors:
+                        return
+                    image = bytearray([self.app.cmdline_args.pad_value]*FV1_BANK_MAX_BYTES)
+                    for program in programs:
+                        offset = (program["program"] - 1)*FV1_PROGRAM_MAX_BYTES
+                        image[offset:offset + len(program["data"])] = program["data"]
+                    write_image(file_path, bytes(image), bank_address(self.app.setting_bank))
+                else:
+                    write_bank(file_path, bank_programs(), self.assemble_options)
+                self.app.show_toast(f"Programs saved to {file_path}")
 
             if filename is not None:
                 # Does filename already exist?
-                save_path = Path(Path(".") / filename if filename.endswith(".json") else f"{filename}.json")
+                save_path = Path(Path(".") / filename if Path(filename).suffix.lower() in IMAGE_FILE_SUFFIXES + [".json"]
+                                 else f"{filename}.json")
                 if save_path.exists() and save_path.is_file():
                     def check_overwrite(should_overwrite : bool) -> None:
                         if should_overwrite:
@@ -399,102 +744,323 @@ class MainScreen(Screen):
 
         self.app.push_screen(SaveFileScreen(), handle_save_file)
 
-    def action_assemble_programs(self,) -> Tuple[Iterable, int]:
-        programs = []
-        num_errors = 0
-        for i in range(MIN_PROGRAM_NUM, MAX_PROGRAM_NUM + 1):
-            program_pane = self.query_one(f"#fv1prog{i}", FV1ProgramPane)
-            if program_pane.program is not None:
-                bin_array = self.assemble_and_validate_program(program_pane.program)
-                if bin_array is not None:
-                    if len(bin_array):
-                        programs.append({"program": i, "address" : (i - 1)*FV1_PROGRAM_MAX_BYTES, "data" : bin_array})
+    def action_assemble_programs(self, slots : Iterable[int]=None) -> Tuple[Iterable, int]:
+        """Assembles the programs in `slots` (every slot if None)"""
+        from fv1_programmer.analysis import analyze
+        with self.profiled("Assemble programs"):
+            programs = []
+            num_errors = 0
+            for i in (slots if slots is not None else range(MIN_PROGRAM_NUM, MAX_PROGRAM_NUM + 1)):
+                program_pane = self.query_one(f"#fv1prog{i}", FV1ProgramPane)
+                if program_pane.program is not None:
+                    source = (source_hash(program_pane.program.asm), self.assemble_options)
+                    bin_array = self.assemble_and_validate_program(program_pane.program, i)
+                    if bin_array is not None:
+                        if len(bin_array):
+                            programs.append({"program": i, "address" : bank_address(self.app.setting_bank) + (i - 1)*FV1_PROGRAM_MAX_BYTES,
+                                             "data" : bin_array, "source" : source})
+                            analysis = analyze(bin_array, program_pane.program.delay_memory)
+                            self.app.logger.info(f"Program {i}: {analysis.summary()}", extra={"slot" : i})
+                        else:
+                            # Program assembled but there are no instructions
+                            self.app.show_toast(f"Program {i} has no instructions.")
                     else:
-                        # Program assembled but there are no instructions
-                        self.app.show_toast(f"Program {i} has no instructions.")
-                else:
-                    self.app.show_toast(f"Program {i} failed to assemble. See log for details.")
-                    num_errors += 1
+                        self.app.show_toast(f"Program {i} failed to assemble. See log for details.")
+                        num_errors += 1
 
-        if num_errors > 0:
-            self.app.show_toast("Errors while assembling.", severity="warning")
+            if num_errors > 0:
+                self.app.show_toast("Errors while assembling.", severity="warning")
 
-        if len(programs) == 0:
-            self.app.show_toast("Nothing to do!", severity="warning")
+            if len(programs) == 0:
+                self.app.show_toast("Nothing to do!", severity="warning")
 
-        if num_errors == 0 and len(programs):
-            self.app.show_toast(f"Successfully assembled {len(programs)} programs.", severity="info")
+            if num_errors == 0 and len(programs):
+                self.app.show_toast(f"Successfully assembled {len(programs)} programs.", severity="info")
 
         return programs, num_errors
 
-    def action_write_eeprom(self) -> None:
-        programs, num_errors = self.action_assemble_programs()
+    def dirty_slots(self) -> list:
+        """
+        The program slots whose source or binary has changed since they were
+        last written to or read from the device
+        """
+        device, options = self.device_name, self.assemble_options
+        dirty = []
+        for i in range(MIN_PROGRAM_NUM, MAX_PROGRAM_NUM + 1):
+            program = self.query_one(f"#fv1prog{i}", FV1ProgramPane).program
+            if program is None:
+                continue
+            key = (device, bank_address(self.app.setting_bank) + (i - 1)*FV1_PROGRAM_MAX_BYTES)
+            data, source = self.synced.get(key, (None, None))
+            if data is not None and source == (source_hash(program.asm), options):
+                continue
+            if data is not None:
+                # E.g. a program read from the device, or an edit that doesn't change the binary
+                binary, num_instructions, _, errors = program.assemble(**options)
+                if not len(errors) and num_instructions != 0 and bytes(binary) == data:
+                    continue
+            dirty.append(i)
+        return dirty
+
+    def action_write_eeprom(self, force : bool=False) -> None:
+        """Writes the programs that have changed since they were last written or read (all of them if `force`)"""
+        from fv1_programmer.devicequeue import DeviceOperation
+        slots = None
+        if not force:
+            slots = self.dirty_slots()
+            unchanged = [i for i in range(MIN_PROGRAM_NUM, MAX_PROGRAM_NUM + 1)
+                         if i not in slots and self.query_one(f"#fv1prog{i}", FV1ProgramPane).program is not None]
+            if len(unchanged) and not len(slots):
+                self.app.show_toast("The pedal already has these programs. Use \"Write all programs\" to write them anyway.")
+                return
+            if len(unchanged):
+                self.app.logger.info(f"Skipping program slots {unchanged}, they haven't changed since they were last written or read")
+        programs, num_errors = self.action_assemble_programs(slots)
 
         if num_errors == 0 and len(programs):
-            self.app.push_screen(BusyScreen("Downloading to pedal..."))
-            self.write_eeprom(programs, self.app.setting_simulate)
+            device = self.device_name
+            request = DeviceRequest("write", device, self._get_eeprom_progress())
+            verify = self.app.setting_verify_writes
+            for program in programs:
+                request.progress.expect(len(program["data"])*(2 if verify else 1))
+                operation = self.device_queue.submit(DeviceOperation(
+                    device, f"Write program {program['program']}",
+                    partial(self.write_program, request, program["program"], program["address"], program["data"],
+                            program["source"], verify),
+                    key=("write", program["address"]), progress=request.progress))
+                request.operations[program["program"]] = operation
+            self.start_device_request(request, "Downloading to pedal...")
+
+    @contextmanager
+    def profiled(self, name : str):
+        """Profiles the code in a `with` block if profiling is enabled, logging a summary when it finishes"""
+        if not self.app.setting_profile:
+            yield
+            return
+        from fv1_programmer.profiling import Profile, DEFAULT_PROFILE_REPORT
+        profile = Profile(name)
+        try:
+            with profile:
+                yield
+        finally:
+            profile.write_report(self.app.profile_report or DEFAULT_PROFILE_REPORT)
+            self.app.logger.info(f"Profile: {profile.summary()}")
 
-    def _get_eeprom(self,):
+    @property
+    def device_name(self) -> str:
+        """Names the device operations are queued for (operations on one device run in order)"""
         if self.app.setting_simulate:
+            return f"sim:{self.app.cmdline_args.sim}"
+        return f"mcp2221:0x{self.app.cmdline_args.i2c_address:02x}"
+
+    @property
+    def device_queue(self) -> DeviceQueue:
+        """Runs reads and writes one at a time per device, in the order they were requested"""
+        if self._device_queue is None:
+            from fv1_programmer.devicequeue import DeviceQueue
+            self._device_queue = DeviceQueue(self._get_eeprom,
+                                             on_change=lambda op: self.post_message(self.DeviceOperationChanged(op)))
+        return self._device_queue
+
+    def pending_device_operations(self) -> list:
+        """The running and queued device operations (without starting the queue)"""
+        return self._device_queue.pending() if self._device_queue is not None else []
+
+    def start_device_request(self, request : DeviceRequest, message : str) -> None:
+        """Shows the progress of a newly queued request, unless it's waiting behind others"""
+        self.device_requests.append(request)
+        waiting = [op for op in self.device_queue.pending() if op not in request.operations.values()]
+        if len(waiting):
+            self.app.show_toast(f"{message.rstrip('.')} after {len(waiting)} queued device operations.")
+        else:
+            request.busy_screen = BusyScreen(message, on_cancel=partial(self.cancel_eeprom_operation, request),
+                                             on_hide=lambda: self.app.show_toast("Carrying on in the background. "
+                                                                                 "Progress is shown in the header."))
+            self.app.push_screen(request.busy_screen)
+        self.show_bank()
+
+    def cancel_eeprom_operation(self, request : DeviceRequest=None) -> None:
+        """
+        Removes queued operations (of `request`, or all of them) and stops the
+        running one at the next page boundary. Operations that later requests
+        were merged into carry on for them.
+        """
+        if request is None:
+            self.device_queue.cancel()
+            return
+        detached = self.device_queue.cancel(list(request.operations.values()), request.progress)
+        request.cancelled.update(slot for slot, op in request.operations.items() if op in detached)
+        # The operations that carry on for other requests won't report this one finished
+        self.finish_device_requests()
+
+    def action_show_device_queue(self) -> None:
+        """Logs the queued device operations"""
+        pending = self.pending_device_operations()
+        if not len(pending):
+            self.app.logger.info("No device operations queued.")
+        for operation in pending:
+            coalesced = f" (merged {operation.coalesced} requests)" if operation.coalesced else ""
+            self.app.logger.info(f"{operation.state.capitalize()}: {operation.description} on {operation.device}{coalesced}")
+
+    def _get_eeprom_progress(self) -> TransferProgress:
+        """Reports the progress of EEPROM operations to the BusyScreen (at most 10 times a second)"""
+        from eeprom.eeprom import TransferProgress
+        last_update = 0.0
+
+        def report(event : ProgressEvent) -> None:
+            nonlocal last_update
+            now = time.monotonic()
+            if now - last_update >= 0.1 or event.done == event.total:
+                last_update = now
+                self.post_message(self.EepromProgress(event))
+
+        return TransferProgress(callback=report)
+
+    def on_main_screen_eeprom_progress(self, message : MainScreen.EepromProgress) -> None:
+        self.device_progress = message.event
+        if isinstance(self.app.screen, BusyScreen):
+            self.app.screen.update_progress(message.event)
+        self.show_bank()
+
+    def _get_eeprom(self, device : str):
+        """Opens the EEPROM for device name `device` (called by the device queue)"""
+        if device.startswith("sim:"):
             from eeprom.eeprom import DummyEEPROM
-            return DummyEEPROM(Path(self.app.cmdline_args.sim), self.app.cmdline_args.ee_size)
+            return DummyEEPROM(Path(device[len("sim:"):]), self.app.cmdline_args.ee_size)
         else:
             from adaptor.mcp2221 import MCP2221I2CAdaptor
             from eeprom.eeprom import I2CEEPROM
-            adaptor = MCP2221I2CAdaptor(self.app.cmdline_args.i2c_address,
+            adaptor = MCP2221I2CAdaptor(int(device.split(":")[1], 16),
                                         i2c_clock_speed=self.app.cmdline_args.i2c_clock_speed)
             adaptor.open()
             return I2CEEPROM(adaptor, self.app.cmdline_args.ee_size,
                              page_size_in_bytes=self.app.cmdline_args.ee_page_size)
 
-    @work(exclusive=True, thread=True)
-    def write_eeprom(self, programs : Iterable[dict], simulate : bool) -> None:
-        worker = get_current_worker()
-        eeprom = None
-        error = None
-        try:
-            eeprom = self._get_eeprom()
-
-            if eeprom is not None:
-                for program in programs:
-                    addr = program["address"]
-                    data = program["data"]
-                    eeprom.write_bytes(addr, data)
+    def write_program(self, request : DeviceRequest, slot : int, address : int, data : bytes, source : tuple,
+                      verify : bool, eeprom, progress : TransferProgress) -> None:
+        """Writes (and verifies) one program slot, run by the device queue"""
+        from eeprom.eeprom import OperationCancelled
+        written = progress.done
+        self.synced.pop((request.device, address), None)
+        with self.profiled(f"Write program {slot}"):
+            try:
+                eeprom.write(address, data, progress)
+            except OperationCancelled:
+                # Writes stop on a page boundary, so the slot is either untouched or cut short
+                if progress.done > written:
+                    request.partial.add(slot)
+                raise
+            if verify and not eeprom.verify(address, data, progress):
+                raise ValueError(f"Program {slot} failed verification!")
+        self.synced[(request.device, address)] = (bytes(data), source)
+
+    def schedule_live_sync(self, slot : int) -> None:
+        """Syncs `slot` to the pedal once editing pauses (if live sync is on)"""
+        if not self.app.setting_live_sync:
+            return
+        timer = self.live_sync_timers.pop(slot, None)
+        if timer is not None:
+            timer.stop()
+        self.live_sync_timers[slot] = self.set_timer(LIVE_SYNC_DELAY, partial(self.live_sync, slot))
+
+    def live_sync(self, slot : int) -> None:
+        """Queues a write of the pages of `slot` that changed, if its program assembles cleanly"""
+        from fv1_programmer.devicequeue import DeviceOperation
+        self.live_sync_timers.pop(slot, None)
+        program = self.query_one(f"#fv1prog{slot}", FV1ProgramPane).program
+        if not self.app.setting_live_sync or program is None:
+            return
+        # Wait for a sync to finish rather than flooding the bus (queued syncs of the same slot are merged)
+        address = bank_address(self.app.setting_bank) + (slot - 1)*FV1_PROGRAM_MAX_BYTES
+        syncs = [op for op in self.pending_device_operations() if op.key is not None and op.key[0] == "sync"]
+        if len(syncs) >= LIVE_SYNC_MAX_PENDING and not any(op.key == ("sync", address) and op.state == "queued"
+                                                           for op in syncs):
+            self.schedule_live_sync(slot)
+            return
 
-                # Read back all the data and verify
-                if self.app.setting_verify_writes:
-                    for program in programs:
-                        addr = program["address"]
-                        data = program["data"]
-                        read_data = eeprom.read_bytes(addr, len(data))
-                        if read_data != data:
-                            error = ValueError("EEPROM write failed verification!")
-                            break
-        except Exception as e:
-            if not worker.is_cancelled:
-                self.post_message(self.WriteEepromResult(programs, error=e))
-        else:
-            if not worker.is_cancelled:
-                self.post_message(self.WriteEepromResult(programs, error=error))
-
-    def on_main_screen_write_eeprom_result(self, message : MainScreen.WriteEepromResult) -> None:
-        """Called when a write eeprom operation is finished."""
-        self.app.pop_screen()
-        if message.error is not None:
-            self.app.logger.error(str(message.error))
+        data, num_instructions, _, errors = program.assemble(**self.assemble_options)
+        if len(errors) or num_instructions == 0:
+            # Most likely still being edited, errors are shown when it's assembled
+            self.app.logger.debug(f"Live sync of program {slot} skipped, it doesn't assemble")
+            return
+        device = self.device_name
+        self.device_queue.submit(DeviceOperation(
+            device, f"Sync program {slot}",
+            partial(self.sync_program, device, address, bytes(data), (source_hash(program.asm), self.assemble_options),
+                    self.app.setting_verify_writes),
+            key=("sync", address)))
+
+    def sync_program(self, device : str, address : int, data : bytes, source : tuple, verify : bool,
+                     eeprom, progress : TransferProgress) -> int:
+        """Writes the pages of a program that differ from what's on the device, run by the device queue"""
+        from fv1_programmer.imagediff import write_changed_pages
+        current, _ = self.synced.pop((device, address), (None, None))
+        with self.profiled("Live sync"):
+            pages = write_changed_pages(eeprom, address, data, current, verify=verify, progress=progress)
+        self.synced[(device, address)] = (data, source)
+        return len(pages)
+
+    def live_sync_finished(self, operation : DeviceOperation) -> None:
+        slot = (operation.key[1] % FV1_BANK_MAX_BYTES)//FV1_PROGRAM_MAX_BYTES + 1
+        if operation.state == "failed":
+            self.app.logger.error(f"Live sync of program {slot} failed: {operation.error}", extra={"slot" : slot})
+            self.app.show_toast(f"Live sync of program {slot} failed! See log for details.", severity="error")
+        elif operation.state == "done" and operation.result:
+            self.app.logger.info(f"Live sync: wrote {operation.result} changed pages of program {slot}",
+                                 extra={"slot" : slot})
+
+    def on_main_screen_device_operation_changed(self, message : MainScreen.DeviceOperationChanged) -> None:
+        """Updates the queue status and handles the requests that have finished"""
+        operation = message.operation
+        if not len(self.device_queue.pending()) or operation.state == "running":
+            self.device_progress = None
+        self.show_bank()
+        if operation.key is not None and operation.key[0] == "sync" and operation.finished:
+            self.live_sync_finished(operation)
+        self.finish_device_requests()
+
+    def finish_device_requests(self) -> None:
+        """Handles the requests whose operations have all finished"""
+        for request in [r for r in self.device_requests if r.finished]:
+            self.device_requests.remove(request)
+            if request.busy_screen is not None and self.app.screen is request.busy_screen:
+                self.app.pop_screen()
+            if request.kind == "write":
+                self.write_eeprom_finished(request)
+            else:
+                self.read_eeprom_finished(request)
+
+    def write_eeprom_finished(self, request : DeviceRequest) -> None:
+        """Called when every slot of a write has been written, cancelled or failed"""
+        slots = request.operations
+        complete = [slot for slot in slots if request.state(slot) == "done"]
+        failed = [slot for slot in slots if request.state(slot) == "failed"]
+        for slot in failed:
+            self.app.logger.error(str(slots[slot].error), extra={"slot" : slot})
+        if any(request.state(slot) == "cancelled" for slot in slots):
+            self.app.logger.warning(f"EEPROM write cancelled. Program slots written: {complete if len(complete) else 'none'}")
+            for slot in sorted(request.partial):
+                self.app.logger.warning(f"Program slot {slot} was only partially written and should be written again.")
+            self.app.show_toast("EEPROM write cancelled. See log for details.", title="Cancelled", severity="warning")
+        elif len(failed):
             self.app.show_toast("EEPROM write failed! See log for details.", title="Error", severity="error")
         else:
-            # total_bytes = sum([len(w["data"]) for w in message.programs])
-            self.app.show_toast(f"Wrote to program slots {[w['program'] for w in message.programs]}{' (simulation)' if self.app.setting_simulate else ''}")
+            self.app.show_toast(f"Wrote to program slots {complete}{' (simulation)' if self.app.setting_simulate else ''}")
             if self.app.setting_verify_writes:
                 self.app.logger.info("All programs verified successfully.")
 
     def action_read_eeprom(self) -> None:
         def do_read_eeprom():
-            self.app.push_screen(BusyScreen("Reading from pedal..."))
-            self.read_eeprom(self.app.setting_simulate,
-                             self.app.setting_disfv1_relative,
-                             self.app.setting_disfv1_suppressraw)
+            from fv1_programmer.devicequeue import DeviceOperation
+            request = DeviceRequest("read", self.device_name, self._get_eeprom_progress())
+            request.progress.expect(FV1_BANK_MAX_BYTES)
+            address = bank_address(self.app.setting_bank)
+            request.operations[None] = self.device_queue.submit(DeviceOperation(
+                request.device, f"Read bank {self.app.setting_bank}",
+                partial(self.read_programs, request.device, address, self.app.setting_disfv1_relative,
+                        self.app.setting_disfv1_suppressraw),
+                key=("read", address), progress=request.progress))
+            self.start_device_request(request, "Reading from pedal...")
 
         num_programs = 0
         for i in range(MIN_PROGRAM_NUM, MAX_PROGRAM_NUM + 1):
@@ -512,48 +1078,42 @@ class MainScreen(Screen):
         else:
             do_read_eeprom()
 
-    @work(exclusive=True, thread=True)
-    def read_eeprom(self, simulate : bool, relative : bool, suppressraw : bool) -> None:
-        worker = get_current_worker()
-        eeprom = None
-        try:
-            eeprom = self._get_eeprom()
-
-            if eeprom is not None:
-                programs = []
-                program_data = eeprom.read_bytes(0, FV1_PROGRAM_MAX_BYTES*8)
-                for offset in range(0, 8*FV1_PROGRAM_MAX_BYTES, FV1_PROGRAM_MAX_BYTES):
-                    program = FV1Program("")
-                    warnings = program.from_bytearray(program_data[offset:offset + FV1_PROGRAM_MAX_BYTES],
-                                                    relative=relative, suppressraw=suppressraw)
-                    programs.append({"program" : program, "warnings" : warnings})
-
-        except Exception as e:
-            if not worker.is_cancelled:
-                self.post_message(self.ReadEepromResult({}, error=e))
-        else:
-            if not worker.is_cancelled:
-                self.post_message(self.ReadEepromResult(programs))
-
-    def on_main_screen_read_eeprom_result(self, message : MainScreen.ReadEepromResult) -> None:
+    def read_programs(self, device : str, address : int, relative : bool, suppressraw : bool, eeprom,
+                      progress : TransferProgress) -> list:
+        """Reads and disassembles a bank of programs, run by the device queue"""
+        with self.profiled("Read EEPROM"):
+            program_data = eeprom.read(address, FV1_BANK_MAX_BYTES, progress)
+        programs = []
+        for offset in range(0, FV1_BANK_MAX_BYTES, FV1_PROGRAM_MAX_BYTES):
+            self.synced[(device, address + offset)] = (bytes(program_data[offset:offset + FV1_PROGRAM_MAX_BYTES]), None)
+            program = FV1Program("")
+            warnings = program.from_bytearray(program_data[offset:offset + FV1_PROGRAM_MAX_BYTES],
+                                              relative=relative, suppressraw=suppressraw)
+            programs.append({"program" : program, "warnings" : warnings})
+        return programs
+
+    def read_eeprom_finished(self, request : DeviceRequest) -> None:
         """Called when a read eeprom operation is finished."""
-        self.app.pop_screen()
-        if message.error is not None:
-            self.app.logger.error(str(message.error))
+        operation = request.operations[None]
+        if request.state(None) == "cancelled":
+            self.app.show_toast("EEPROM read cancelled, programs unchanged.", title="Cancelled", severity="warning")
+            return
+        if operation.state == "failed":
+            self.app.logger.error(str(operation.error))
             self.app.show_toast("EEPROM read failed! See log for details.", title="Error", severity="error")
             return
 
         were_warnings = False
         for i in range(MIN_PROGRAM_NUM, MAX_PROGRAM_NUM + 1):
             program_pane = self.query_one(f"#fv1prog{i}", FV1ProgramPane)
-            program_pane.program = message.programs[i - 1]["program"]
-            warnings = message.programs[i - 1]["warnings"]
+            program_pane.program = operation.result[i - 1]["program"]
+            warnings = operation.result[i - 1]["warnings"]
             if warnings is not None:
                 for warning in warnings:
-                    self.app.logger.info(warning)
+                    self.app.logger.info(warning, extra={"slot" : i})
                     m = re.match(r"info: Read (\d+) instructions\.", warning)
                     # Only worry about real warnings
-                    if m.group(0) != warning:
+                    if m is None or m.group(0) != warning:
                         were_warnings = True
 
         if were_warnings:
@@ -578,6 +1138,29 @@ class MainScreen(Screen):
         else:
             do_delete_program()
 
+    def action_analyze_program(self) -> None:
+        """Logs the resource usage of the program in the current slot"""
+        active_tab_id = self.query_one(TabbedContent).active
+        active_slot = active_tab_id.split("prog")[1]
+        active_program_pane = self.query_one(f"#fv1{active_tab_id}", FV1ProgramPane)
+        if active_program_pane.program is None:
+            self.app.show_toast("Nothing to analyze!", severity="warning")
+            return
+
+        bin_array = self.assemble_and_validate_program(active_program_pane.program, int(active_slot))
+        if bin_array is None:
+            self.app.show_toast(f"Program {active_slot} failed to assemble. See log for details.")
+            return
+
+        from fv1_programmer.analysis import analyze
+        analysis = analyze(bin_array, active_program_pane.program.delay_memory)
+        self.app.logger.info(f"Program {active_slot} resource usage:\n{analysis.report()}", extra={"slot" : int(active_slot)})
+        if len(analysis.issues):
+            self.app.show_toast(f"Program {active_slot} has {len(analysis.issues)} warnings. See log for details.",
+                                severity="warning")
+        else:
+            self.app.show_toast(f"Program {active_slot}: {analysis.summary()}")
+
     def action_new(self) -> None:
         active_tab_id = self.query_one(TabbedContent).active
         active_slot = active_tab_id.split("prog")[1]
@@ -586,7 +1169,7 @@ class MainScreen(Screen):
         def do_new_program():
             active_program_pane.program = FV1Program("")
             self.rename_program_slot(active_slot, f"Program {active_slot}")
-            active_program_pane.query_one(TextArea).focus()
+            active_program_pane.focus_editor()
 
         if active_program_pane.program is not None:
             def check_overwrite(should_overwrite : bool) -> None:
@@ -596,20 +1179,19 @@ class MainScreen(Screen):
         else:
             do_new_program()
 
-    def assemble_and_validate_program(self, program) -> bytearray:
-        bin_array, num_instructions, warnings, errors = program.assemble(clamp=self.app.setting_asfv1_clamp,
-                                                                         spinreals=self.app.setting_asfv1_spinreals)
-        [self.app.logger.info(w) for w in warnings]
-        [self.app.logger.info(e) for e in errors]
+    def assemble_and_validate_program(self, program, slot : int=None) -> bytearray:
+        bin_array, num_instructions, warnings, errors = program.assemble(**self.assemble_options)
+        [self.app.logger.info(w, extra={"slot" : slot}) for w in warnings]
+        [self.app.logger.info(e, extra={"slot" : slot}) for e in errors]
         if len(errors) == 0:
-            if num_instructions > 0:
+            # An unknown count (None) means the binary isn't known to be empty
+            if num_instructions is None or num_instructions > 0:
                 return bin_array
             else:
                 return []
         return None
 
 
-from dataclasses import dataclass
 @dataclass
 class Args:
     """Class emulating command line arguments to allow running via `textual run --dev`"""
@@ -621,6 +1203,11 @@ class Args:
     verify:bool
     debug:bool
     sim:Path
+    library:list = None
+    library_db:Path = None
+    optimize:bool = False
+    profile:Path = None
+    bank:int = None
 
 
 class FV1App(App[None]):
@@ -644,14 +1231,35 @@ class FV1App(App[None]):
                                      False,
                                      Path('backup.bin'))
 
+        # Program library used by the command palette, only kept for the directories given with --library
+        self.library_roots = self.cmdline_args.library or []
+        self.library = None
+        if len(self.library_roots):
+            from fv1_programmer.library import ProgramLibrary, DEFAULT_LIBRARY_DB
+            self.library = ProgramLibrary(self.cmdline_args.library_db or DEFAULT_LIBRARY_DB)
+
         # Whether to use a programmer or just simulate
         self.setting_simulate = self.cmdline_args.sim is not None
         self.setting_verify_writes = self.cmdline_args.verify
 
+        # Write each program to the pedal as it's edited
+        self.setting_live_sync = False
+
         # asfv1 options
         self.setting_asfv1_clamp = True
         self.setting_asfv1_spinreals = True
 
+        # Peephole optimize assembled programs
+        self.setting_optimize = self.cmdline_args.optimize
+
+        # Profile assembling and EEPROM operations
+        self.setting_profile = self.cmdline_args.profile is not None
+        # (the default report file if None)
+        self.profile_report = self.cmdline_args.profile
+
+        # The bank of 8 programs read and written on larger EEPROMs
+        self.setting_bank = self.cmdline_args.bank or 1
+
         # disfv1 options
         self.setting_disfv1_relative = False
         self.setting_disfv1_suppressraw = False
@@ -670,8 +1278,9 @@ class FV1App(App[None]):
     # and make it behave like Copy
     def exit(self, result = None) -> None:
         active_program_pane = self.query_one(f"#fv1{self.query_one(TabbedContent).active}", FV1ProgramPane)
-        if active_program_pane.program is not None:
-            pyperclip.copy(active_program_pane.query_one(TextArea).selected_text)
+        if active_program_pane.program is not None and active_program_pane.editor is not None:
+            import pyperclip
+            pyperclip.copy(active_program_pane.editor.selected_text)
         #     self.show_toast("Current program copied to clipboard")
 
     def do_exit(self, result = None) -> None:
@@ -0,0 +1,218 @@
+import hashlib
+import itertools
+import json
+import logging
+import re
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Dict, Iterator, List
+
+from fv1_programmer.bank import FV1_PROGRAMS_PER_BANK, bank_entry, write_bank
+from fv1_programmer.fv1 import FV1Program
+from fv1_programmer.isa import FV1_PROGRAM_LENGTH, FV1_DELAY_MEMORY_SIZE
+
+
+logger = logging.getLogger('variants')
+
+REPORT_FILENAME = "variants.json"
+CACHE_FILENAME = "variants_cache.json"
+
+_PLACEHOLDER = re.compile(r"\{\{\s*(\w+)\s*\}\}")
+# "name EQU value", "EQU name value" and the same for MEM (value is then the length)
+_DIRECTIVE = re.compile(r"^(\s*)(?:(\w+)(\s+)(equ|mem)(\s+)|(equ|mem)(\s+)(\w+)(\s+))([^\s;]+)", re.IGNORECASE)
+
+
+@dataclass
+class Variant:
+    """One expansion of a sweep spec and what happened when it was assembled"""
+    name : str
+    template : str
+    parameters : Dict[str, object]
+    asm : str = None
+    hash : str = None
+    # "ok", "failed" (didn't assemble) or "limits" (exceeded the FV-1's resources)
+    status : str = None
+    instructions : int = 0
+    binary : bytes = None
+    summary : str = ""
+    reasons : List[str] = field(default_factory=list)
+    warnings : List[str] = field(default_factory=list)
+    bank : int = None
+    slot : int = None
+
+
+def render_template(asm : str, parameters : Dict[str, object]) -> str:
+    """
+    Substitutes parameters into a SpinASM template. A parameter replaces the
+    value of an EQU of the same name, the length of a MEM of the same name
+    and any {{name}} placeholder (e.g. a coefficient). Every placeholder must
+    have a parameter and every parameter must be used.
+    """
+    used = set()
+    # SpinASM names aren't case sensitive
+    names = {name.lower() : name for name in parameters}
+
+    def value(name):
+        if name.lower() not in names:
+            raise ValueError(f"No value for template parameter '{name}'")
+        used.add(names[name.lower()])
+        return str(parameters[names[name.lower()]])
+
+    lines = []
+    for line in _PLACEHOLDER.sub(lambda m: value(m.group(1)), asm).splitlines(keepends=True):
+        m = _DIRECTIVE.match(line)
+        if m is not None and (m.group(2) or m.group(8)).lower() in names:
+            line = line[:m.start(10)] + value(m.group(2) or m.group(8)) + line[m.end(10):]
+        lines.append(line)
+    unused = set(parameters) - used
+    if len(unused):
+        raise ValueError(f"Parameters {', '.join(sorted(unused))} are not used by the template")
+    return "".join(lines)
+
+
+def _sweep_values(name : str, values) -> list:
+    """A parameter's values: a list, a single value or {"start", "stop", "step"} (stop included)"""
+    if isinstance(values, dict):
+        try:
+            start, stop, step = values["start"], values["stop"], values["step"]
+        except KeyError as e:
+            raise ValueError(f"Range of parameter '{name}' has no {e}")
+        if step == 0 or (stop - start)/step < 0:
+            raise ValueError(f"Range of parameter '{name}' is empty")
+        count = int(round((stop - start)/step, 9)) + 1
+        return [start + i*step if isinstance(step, int) and isinstance(start, int)
+                else round(start + i*step, 12) for i in range(count)]
+    return list(values) if isinstance(values, list) else [values]
+
+
+def expand_spec(spec_path : Path) -> Iterator[Variant]:
+    """
+    Expands a sweep spec .json file into every combination of its parameter
+    values. The spec is a template, or a list of them under "templates":
+
+        {"template" : "reverb.spn",
+         "name" : "Reverb {decay} {predelay}",
+         "parameters" : {"decay" : [0.5, 0.6], "predelay" : {"start" : 1000, "stop" : 4000, "step" : 1000}}}
+
+    Template paths are relative to the spec and names are Python format
+    strings of the parameters (the template name and parameters by default).
+    """
+    with open(spec_path, 'r') as f:
+        spec = json.load(f)
+    for entry in spec.get("templates", [spec]):
+        template_path = spec_path.parent / entry["template"]
+        with open(template_path, 'r') as f:
+            template = f.read()
+        sweeps = {name : _sweep_values(name, values) for name, values in entry.get("parameters", {}).items()}
+        for combination in itertools.product(*sweeps.values()):
+            parameters = dict(zip(sweeps, combination))
+            default_name = " ".join([template_path.stem] + [f"{k}={v}" for k, v in parameters.items()])
+            variant = Variant(entry.get("name", default_name).format(**parameters), entry["template"], parameters)
+            variant.asm = render_template(template, parameters)
+            yield variant
+
+
+def variant_hash(asm : str, options : dict) -> str:
+    """Identifies the result of assembling `asm` with `options`"""
+    return hashlib.sha256(json.dumps([asm, options], sort_keys=True).encode()).hexdigest()
+
+
+def _assemble_variant(job):
+    """Process pool entry point. Assembles a variant and checks it against the FV-1's limits."""
+    from fv1_programmer.analysis import analyze
+    digest, asm, options = job
+    program = FV1Program(asm)
+    data, instructions, warnings, errors = program.assemble(**options)
+    result = {"instructions" : instructions, "binary" : None, "summary" : "", "reasons" : [],
+              "warnings" : [w for w in warnings if not w.startswith("info:")]}
+    if any("Max program exceeded" in e for e in errors):
+        result["status"] = "limits"
+        result["reasons"] = [f"More than {FV1_PROGRAM_LENGTH} instructions"]
+    elif any("Delay exhausted" in e or "Delay memory exhausted" in e for e in errors):
+        result["status"] = "limits"
+        result["reasons"] = [f"Needs more than {FV1_DELAY_MEMORY_SIZE} delay memory words"]
+    elif len(errors):
+        result["status"] = "failed"
+        result["reasons"] = [e for e in errors if "assembly aborted" not in e]
+    else:
+        analysis = analyze(data, program.delay_memory)
+        result["summary"] = analysis.summary()
+        result["warnings"] += analysis.issues
+        # Values out of range are clamped by the assembler, MEM lengths without a warning
+        for line in asm.splitlines():
+            m = _DIRECTIVE.match(line)
+            if m is not None and (m.group(4) or m.group(6)).lower() == "mem" and m.group(10).isdigit() \
+                    and int(m.group(10)) >= FV1_DELAY_MEMORY_SIZE:
+                result["reasons"].append(f"MEM {m.group(2) or m.group(8)} length {m.group(10)} clamped to "
+                                         f"{FV1_DELAY_MEMORY_SIZE - 1}")
+        result["reasons"] += [w for w in warnings if "clamped" in w]
+        result["status"] = "limits" if len(result["reasons"]) else "ok"
+        result["binary"] = bytes(data).hex()
+    return digest, result
+
+
+def generate_variants(spec_path : Path, output_dir : Path, options : dict, max_workers : int=None) -> List[Variant]:
+    """
+    Expands a sweep spec (see expand_spec()) and assembles every variant in
+    parallel. Identical sources are only assembled once, and results are
+    cached by content hash in `output_dir/variants_cache.json` so a run only
+    assembles what changed since the last one. Variants that assemble within
+    the FV-1's limits are grouped in order into bank_NNN.json files (which
+    store their binaries) and `output_dir/variants.json` reports every
+    variant. Returns the variants.
+    """
+    variants = list(expand_spec(spec_path))
+    output_dir.mkdir(parents=True, exist_ok=True)
+    cache = {}
+    if (output_dir / CACHE_FILENAME).is_file():
+        try:
+            with open(output_dir / CACHE_FILENAME, 'r') as f:
+                cache = json.load(f)
+        except ValueError as e:
+            logger.warning(f"Ignoring the variant cache: {e}")
+
+    jobs = {}
+    for variant in variants:
+        variant.hash = variant_hash(variant.asm, options)
+        if variant.hash not in cache:
+            jobs[variant.hash] = (variant.hash, variant.asm, options)
+    if len(jobs):
+        chunksize = max(1, len(jobs) // (4*(max_workers or 8)))
+        with ProcessPoolExecutor(max_workers=max_workers) as executor:
+            for digest, result in executor.map(_assemble_variant, jobs.values(), chunksize=chunksize):
+                cache[digest] = result
+    with open(output_dir / CACHE_FILENAME, 'w') as f:
+        json.dump(cache, f)
+
+    slots = []
+    for variant in variants:
+        result = cache[variant.hash]
+        variant.status, variant.instructions = result["status"], result["instructions"]
+        variant.summary, variant.reasons, variant.warnings = result["summary"], result["reasons"], result["warnings"]
+        if variant.status == "ok":
+            variant.binary = bytes.fromhex(result["binary"])
+            variant.bank, variant.slot = divmod(len(slots), FV1_PROGRAMS_PER_BANK)
+            variant.bank, variant.slot = variant.bank + 1, variant.slot + 1
+            slots.append(variant)
+
+    for bank, first in enumerate(range(0, len(slots), FV1_PROGRAMS_PER_BANK), start=1):
+        programs = []
+        for variant in slots[first:first + FV1_PROGRAMS_PER_BANK]:
+            program = FV1Program(variant.asm)
+            program.set_assembled(variant.binary, variant.instructions, options)
+            programs.append(bank_entry(program, variant.name, options))
+        write_bank(output_dir / bank_filename(bank), programs, options)
+
+    report = [{"name" : v.name, "template" : v.template, "parameters" : v.parameters, "hash" : v.hash,
+               "status" : v.status, "instructions" : v.instructions, "summary" : v.summary, "reasons" : v.reasons,
+               "warnings" : v.warnings, "bank" : bank_filename(v.bank) if v.bank is not None else None,
+               "slot" : v.slot} for v in variants]
+    with open(output_dir / REPORT_FILENAME, 'w') as f:
+        json.dump({"spec" : str(spec_path), "assembler" : options, "variants" : report}, f, indent=2)
+
+    return variants
+
+
+def bank_filename(bank : int) -> str:
+    return f"bank_{bank:03d}.json"
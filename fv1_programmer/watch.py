@@ -0,0 +1,126 @@
+import json
+import time
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Dict, List
+
+from fv1_programmer.bank import slot_name, FV1_PROGRAMS_PER_BANK
+from fv1_programmer.fv1 import FV1_PROGRAM_MAX_BYTES, FV1Program, source_hash
+
+
+WATCH_INTERVAL = 0.2
+
+
+def read_manifest(path : Path, slot : int=None, bank : int=None) -> Dict[int, Path]:
+    """
+    Returns the .spn source file of each program slot (numbered across banks,
+    so a .json file listing more than 8 programs covers several banks). `path`
+    is either a bank .json file whose programs give their source file as
+    "path" (relative to the .json file), or a single .spn file for `slot`
+    (defaults to the first slot). The programs start at `bank` (or the bank
+    of `slot`, which selects one program), the first bank by default.
+    """
+    if slot is not None:
+        first = (slot - 1) // FV1_PROGRAMS_PER_BANK*FV1_PROGRAMS_PER_BANK + 1
+    else:
+        first = (bank - 1)*FV1_PROGRAMS_PER_BANK + 1 if bank is not None else 1
+    if path.suffix.lower() == '.spn':
+        return {slot if slot is not None else first : path}
+
+    with open(path, 'r') as f:
+        programs = json.load(f).get("programs", [])
+    sources = {}
+    for i, program in enumerate(programs, start=first):
+        if isinstance(program, dict) and program.get("path"):
+            if slot is None or slot == i:
+                sources[i] = path.parent / program["path"]
+    if not len(sources):
+        raise ValueError(f"'{path}' does not give the source file of any program")
+    return sources
+
+
+@dataclass
+class WatchResult:
+    """What happened to a program slot after its source file changed"""
+    slot : int
+    path : Path
+    instructions : int = 0
+    written : bool = False
+    verified : bool = True
+    cached : bool = False
+    warnings : List[str] = field(default_factory=list)
+    errors : List[str] = field(default_factory=list)
+    elapsed : float = 0.0
+
+
+class ProgramWatcher(object):
+    """
+    Watches the source files of program slots. When a file changes it is
+    re-assembled (unless a program with the same source was assembled before)
+    and only that slot's region of the EEPROM is written and verified.
+    """
+    def __init__(self, sources : Dict[int, Path], eeprom, clamp=True, spinreals=False, optimize=False,
+                 verify : bool=True) -> None:
+        self.sources = sources
+        self.eeprom = eeprom
+        self.assemble_options = {"clamp" : clamp, "spinreals" : spinreals, "optimize" : optimize}
+        self.verify = verify
+        self._mtimes = {}
+        # Slot -> hash of the source last written to it
+        self._written = {}
+        # Source hash -> program (which keeps what it assembled to)
+        self._programs = {}
+
+    def poll(self) -> List[WatchResult]:
+        """Checks every source file once, updating the slots whose source has changed"""
+        results = []
+        for slot, path in sorted(self.sources.items()):
+            try:
+                mtime = path.stat().st_mtime_ns
+            except OSError:
+                continue
+            if self._mtimes.get(slot) == mtime:
+                continue
+            try:
+                with open(path, 'r') as f:
+                    asm = f.read()
+            except (OSError, UnicodeDecodeError):
+                # Removed or replaced since stat() (editors often save that way), try again on the next pass
+                continue
+            self._mtimes[slot] = mtime
+            digest = source_hash(asm)
+            if self._written.get(slot) == digest:
+                continue
+            results.append(self._update(slot, path, asm, digest))
+        return results
+
+    def _update(self, slot : int, path : Path, asm : str, digest : str) -> WatchResult:
+        start = time.perf_counter()
+        if digest not in self._programs:
+            self._programs[digest] = FV1Program(asm)
+        result = WatchResult(slot, path, cached=self._programs[digest].assembled is not None)
+        program, result.instructions, result.warnings, result.errors = \
+            self._programs[digest].assemble(**self.assemble_options)
+
+        address = (slot - 1)*FV1_PROGRAM_MAX_BYTES
+        if address + FV1_PROGRAM_MAX_BYTES > self.eeprom.size:
+            result.errors = result.errors + [f"The EEPROM is too small for program {slot_name(slot)}"]
+        elif program is not None and not len(result.errors):
+            # Nothing to write if the slot already holds this program (e.g. after a whitespace change)
+            if self.eeprom.read(address, len(program)) != bytes(program):
+                self.eeprom.write(address, program)
+                result.written = True
+                if self.verify:
+                    result.verified = self.eeprom.verify(address, program)
+            if result.verified:
+                self._written[slot] = digest
+
+        result.elapsed = time.perf_counter() - start
+        return result
+
+    def run(self, callback, interval : float=WATCH_INTERVAL, is_cancelled=None) -> None:
+        """Polls the source files every `interval` seconds, calling `callback` with each WatchResult"""
+        while is_cancelled is None or not is_cancelled():
+            for result in self.poll():
+                callback(result)
+            time.sleep(interval)
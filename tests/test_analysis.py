@@ -0,0 +1,70 @@
+import pathlib
+
+from fv1_programmer.analysis import analyze
+from fv1_programmer.bank import read_image, split_program_slots
+from fv1_programmer.fv1 import FV1Program
+
+
+def _analyze(asm):
+    program = FV1Program(asm)
+    data, _, _, errors = program.assemble(spinreals=True)
+    assert errors == []
+    return analyze(data, program.delay_memory)
+
+
+def test_resource_usage():
+    analysis = _analyze("mem dly 1000\nmem dly2 200\nrdax adcl,1.0\nwra dly,0\nrda dly#,1.0\n"
+                        "wrax reg0,1.0\nrdax reg0,0.5\nwrax dacl,0\n")
+    assert analysis.instructions == 6
+    assert analysis.delay_memory == {"DLY" : (0, 1000), "DLY2" : (1001, 200)}
+    assert analysis.delay_memory_used == 1202
+    assert analysis.registers == [0x20]
+    assert analysis.lfos == []
+    assert analysis.unreachable == []
+    assert analysis.issues == []
+
+
+def test_issues():
+    analysis = _analyze("mem dly 100\nskp 0,end\nrdax reg1,1.0\nend:\nwra dly+150,0\ncho rda,sin0,sin|reg|compc,dly\n"
+                        "wrax reg2,0\n")
+    assert analysis.unreachable == [1]
+    assert "REG1 is read but never written" in analysis.issues
+    assert "REG2 is written but never read" in analysis.issues
+    assert "Nothing is written to DACL or DACR" in analysis.issues
+    assert "SIN0 is used but never loaded with WLDS" in analysis.issues
+    assert any("WRA at 2" in issue for issue in analysis.issues)
+
+
+def test_lfo_excursion():
+    analysis = _analyze("mem dly 4000\nskp run,start\nwlds sin0,12,1000\nstart:\n"
+                        "cho rda,sin0,sin|reg|compc,dly^\ncho rda,sin0,sin,dly^+1\nwrax dacl,0\n")
+    assert analysis.lfos == ["SIN0"]
+    assert analysis.issues == []
+    analysis = _analyze("mem dly 800\nskp run,start\nwlds sin0,12,4000\nstart:\n"
+                        "cho rda,sin0,sin|reg|compc,dly^\ncho rda,sin0,sin,dly^+1\nwrax dacl,0\n")
+    assert any("may access outside of MEM region DLY" in issue for issue in analysis.issues)
+
+
+def test_disassembled_slots():
+    this_path = pathlib.Path(__file__).parent.resolve()
+    for data in split_program_slots(read_image(this_path / 'reverbs.hex')):
+        analysis = analyze(data)
+        assert 0 < analysis.instructions <= 128
+        assert analysis.delay_memory_used <= 32768
+
+
+def test_delay_memory_is_kept_with_the_binary(tmp_path):
+    from fv1_programmer.bank import bank_entry, write_bank, read_bank
+    options = {"clamp" : True, "spinreals" : True, "optimize" : False}
+    program = FV1Program("mem dly 1000\nrdax adcl,1.0\nwra dly,0\nrda dly#,1.0\nwrax dacl,0\n")
+    program.assemble(**options)
+    program.assemble(**options)
+    assert program.delay_memory == {"DLY" : (0, 1000)}
+
+    (tmp_path / "dly.spn").write_text(program.asm)
+    write_bank(tmp_path / "bank.json", [bank_entry(program, "A", options), {"path" : "dly.spn"}], options)
+    bank = read_bank(tmp_path / "bank.json")
+    assert bank.programs[0].delay_memory == {"DLY" : (0, 1000)}
+    bank.programs[0].assemble(**options)
+    assert bank.programs[0].delay_memory == {"DLY" : (0, 1000)}
+    assert bank.programs[1].asm == program.asm
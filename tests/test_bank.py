@@ -0,0 +1,97 @@
+import pytest
+
+from fv1_programmer.bank import parse_slot, slot_name, slot_address, bank_address, num_banks, read_program
+
+
+def test_slot_numbering_across_banks():
+    assert parse_slot("3") == 3
+    assert parse_slot("1:8") == 8
+    assert parse_slot("2:1") == 9
+    assert slot_name(9) == "2:1" and slot_name(3) == "3"
+    assert slot_address(parse_slot("2:3")) == bank_address(2) + 2*512
+    for text in ("0", "9", "0:1", "2:0", "x"):
+        with pytest.raises(ValueError):
+            parse_slot(text)
+
+
+def test_num_banks():
+    assert num_banks(4096) == 1
+    assert num_banks(32768) == 8
+    assert num_banks(1024) == 1
+
+
+def test_read_program_from_bank_images(tmp_path):
+    single = tmp_path / "single.bin"
+    single.write_bytes(b''.join(bytes([i])*512 for i in range(8)))
+    multi = tmp_path / "multi.bin"
+    multi.write_bytes(b''.join(bytes([i])*512 for i in range(16)))
+    # A single bank image gives the same slot in every bank
+    assert read_program(single, parse_slot("2:3")) == bytes([2])*512
+    assert read_program(multi, parse_slot("2:3")) == bytes([10])*512
+    assert read_program(multi, parse_slot("3:1")) == bytes([0xFF])*512
+
+
+def test_bank_file_stores_binaries(tmp_path, monkeypatch):
+    from fv1_programmer.bank import bank_entry, write_bank, read_bank
+    from fv1_programmer.fv1 import FV1Program
+    options = {"clamp" : True, "spinreals" : True, "optimize" : False}
+    program = FV1Program("rdax adcl,1.0\nwrax dacl,0\n")
+    expected, _, _, _ = program.assemble(**options)
+    write_bank(tmp_path / "bank.json", [bank_entry(program, "A", options), {"asm" : None, "name" : "B"}], options)
+
+    def no_assembler(*args):
+        raise AssertionError("assembled")
+    monkeypatch.setattr(FV1Program, "_assemble", no_assembler)
+    bank = read_bank(tmp_path / "bank.json")
+    assert bank.names == ["A", "B"] and bank.programs[1] is None and bank.options == options
+    data, instructions, _, errors = bank.programs[0].assemble(**options)
+    assert data == expected and instructions == 2 and not errors
+
+    # A changed source or different options need the assembler
+    with pytest.raises(AssertionError):
+        bank.programs[0].assemble(clamp=True, spinreals=False)
+    bank.programs[0].asm += "nop\n"
+    with pytest.raises(AssertionError):
+        bank.programs[0].assemble(**options)
+
+
+def test_slot_dump_keeps_its_slot(tmp_path):
+    from fv1_programmer.bank import write_image, read_bank
+    from fv1_programmer.fv1 import FV1Program
+    data, _, _, _ = FV1Program("rdax adcl,1.0\nwrax dacl,0\n").assemble(clamp=True, spinreals=True)
+    write_image(tmp_path / "slot.json", bytes(data), slot_address(parse_slot("2:3")))
+    bank = read_bank(tmp_path / "slot.json")
+    assert bank.slots == [parse_slot("2:3")] and bank.names == ["Program 2:3"]
+    assert bank.programs[0].assemble(clamp=True, spinreals=True)[0] == data
+
+
+def test_slot_dump_assembles_in_the_user_interface(tmp_path, monkeypatch):
+    import asyncio
+    from fv1_programmer.bank import write_image, read_bank
+    from fv1_programmer.fv1 import FV1Program
+    from fv1_programmer.main import parse_command_line_arguments
+    from fv1_programmer.tui import FV1App
+
+    data, _, _, _ = FV1Program("rdax adcl,1.0\nwrax dacl,0\n").assemble(clamp=True, spinreals=True)
+    write_image(tmp_path / "dump.json", bytes(data) + bytes([0xFF]*512))
+    with open(tmp_path / "dump.json") as f:
+        dump = f.read()
+    assert '"instructions": 2' in dump
+    # Dumps saved before the count was stored have it as null
+    (tmp_path / "old.json").write_text(dump.replace('"instructions": 2', '"instructions": null'))
+    assert read_bank(tmp_path / "old.json").programs[0].assemble(clamp=True, spinreals=True)[1] == 2
+
+    image = tmp_path / "sim.bin"
+    image.write_bytes(bytes([0xFF]*4096))
+    monkeypatch.setattr("sys.argv", ["fv1_programmer", "--sim", str(image)])
+    app = FV1App(parse_command_line_arguments())
+
+    async def load_and_assemble():
+        async with app.run_test() as pilot:
+            await pilot.pause()
+            app.main_screen.load_json_file(tmp_path / "dump.json")
+            programs, num_errors = app.main_screen.action_assemble_programs()
+            return [p["data"] for p in programs], num_errors
+
+    programs, num_errors = asyncio.run(load_and_assemble())
+    assert programs == [data] and num_errors == 0
@@ -0,0 +1,28 @@
+import json
+import pathlib
+import shutil
+
+from fv1_programmer.batch import batch_disassemble, INDEX_FILENAME
+
+
+def test_batch_disassemble_dedup(tmp_path):
+    this_path = pathlib.Path(__file__).parent.resolve()
+    dumps = tmp_path / "dumps"
+    dumps.mkdir()
+    shutil.copy(this_path / 'delays.hex', dumps / 'pedal1.hex')
+    shutil.copy(this_path / 'delays.hex', dumps / 'pedal2.hex')
+    shutil.copy(this_path / 'reverbs.hex', dumps / 'pedal3.hex')
+
+    out = tmp_path / "out"
+    index = batch_disassemble([dumps], out, max_workers=2)
+
+    # Two identical banks and one different bank of 8 programs each
+    assert len(index["files"]) == 3
+    assert len(index["programs"]) == 16
+    for digest, entry in index["programs"].items():
+        assert (out / entry["listing"]).is_file()
+    assert index["files"][str(dumps / 'pedal1.hex')] == index["files"][str(dumps / 'pedal2.hex')]
+    assert all(len(index["programs"][d]["occurrences"]) == 2 for d in index["files"][str(dumps / 'pedal1.hex')])
+
+    with open(out / INDEX_FILENAME) as f:
+        assert json.load(f) == index
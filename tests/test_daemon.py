@@ -0,0 +1,67 @@
+import threading
+import json
+import urllib.request
+
+from adaptor.emulated import EmulatedEEPROMAdaptor
+from eeprom.eeprom import I2CEEPROM
+from fv1_programmer.daemon import JobServer, Station, submit_job
+
+
+def _station(name, **kwargs):
+    adaptor = EmulatedEEPROMAdaptor(**kwargs)
+    return Station(name, I2CEEPROM(adaptor, 4096, page_size_in_bytes=32), adaptor)
+
+
+def test_emulated_eeprom_page_writes():
+    adaptor = EmulatedEEPROMAdaptor()
+    ee = I2CEEPROM(adaptor, 4096, page_size_in_bytes=32)
+    ee.write(20, bytes(range(100)))
+    assert ee.read(20, 100) == bytes(range(100))
+    assert adaptor.memory[:20] == b'\xff'*20
+    # Writing past the end of a page wraps around to its start
+    adaptor.write_bytes(b'\x00\x1e' + bytes([1, 2, 3, 4]))
+    assert adaptor.memory[30:32] == bytes([1, 2]) and adaptor.memory[0:2] == bytes([3, 4])
+
+
+def test_jobs_over_http():
+    jobs = JobServer({"a" : _station("a"), "b" : _station("b")})
+    jobs.start()
+    server = jobs.serve(port=0)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = f"http://127.0.0.1:{server.server_address[1]}"
+    try:
+        updates = []
+        status = submit_job(url, {"station" : "a", "type" : "program", "address" : 512,
+                                  "data" : bytes(range(256)).hex()*2}, updates.append)
+        assert status["state"] == "done" and updates[-1] == status
+        assert jobs.stations["a"].eeprom.adaptor.memory[512:1024] == bytes(range(256))*2
+        assert jobs.stations["b"].eeprom.adaptor.memory == b'\xff'*4096
+
+        status = submit_job(url, {"station" : "a", "type" : "read", "address" : 512, "size" : 16})
+        assert bytes.fromhex(status["data"]) == bytes(range(16))
+        status = submit_job(url, {"station" : "a", "type" : "verify", "data" : "00"})
+        assert status["state"] == "failed"
+
+        with urllib.request.urlopen(f"{url}/stations") as response:
+            stations = {s["name"] : s for s in json.loads(response.read())}
+        assert stations["a"]["counters"]["completed"] == 2 and stations["a"]["counters"]["failed"] == 1
+        assert stations["a"]["counters"]["bytes_written"] == 512
+    finally:
+        server.shutdown()
+        server.server_close()
+        jobs.stop()
+
+
+def test_priority_and_cancel():
+    station = _station("a")
+    jobs = JobServer({"a" : station})
+    # Queue everything before the station starts so the order is decided by priority
+    low = jobs.submit({"type" : "program", "data" : "01", "priority" : 0})
+    high = jobs.submit({"type" : "program", "data" : "02", "priority" : 5})
+    cancelled = jobs.submit({"type" : "program", "data" : "03", "priority" : 9})
+    jobs.cancel(cancelled.id)
+    jobs.start()
+    jobs.stop()
+    assert high.started <= low.started
+    assert cancelled.state == "cancelled" and low.state == "done"
+    assert station.eeprom.adaptor.memory[0] == 1
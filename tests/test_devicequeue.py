@@ -0,0 +1,139 @@
+import threading
+
+from adaptor.emulated import EmulatedEEPROMAdaptor
+from eeprom.eeprom import I2CEEPROM, TransferProgress
+from fv1_programmer.devicequeue import DeviceQueue, DeviceOperation
+
+
+def _write(address, data):
+    def run(eeprom, progress):
+        eeprom.write(address, data, progress)
+        return address
+    return run
+
+
+def test_operations_run_in_order_and_coalesce():
+    eeprom = I2CEEPROM(EmulatedEEPROMAdaptor(), 4096)
+    started = threading.Event()
+    release = threading.Event()
+
+    def blocked(eeprom, progress):
+        started.set()
+        release.wait(5)
+
+    queue = DeviceQueue(lambda device: eeprom)
+    first = queue.submit(DeviceOperation("ee", "Blocked", blocked))
+    started.wait(5)
+    progress = [TransferProgress(512), TransferProgress(512)]
+    a = queue.submit(DeviceOperation("ee", "Write 1", _write(0, bytes([1]*512)), key=("write", 0), progress=progress[0]))
+    b = queue.submit(DeviceOperation("ee", "Write 2", _write(512, bytes([2]*512)), key=("write", 512)))
+    # The newer write of slot 1 replaces the queued one
+    c = queue.submit(DeviceOperation("ee", "Write 1 again", _write(0, bytes([3]*512)), key=("write", 0),
+                                     progress=progress[1]))
+    assert c is a and a.coalesced == 1 and a.description == "Write 1 again"
+    assert [op.state for op in queue.pending()] == ["running", "queued", "queued"]
+
+    release.set()
+    assert queue.wait(5)
+    assert [op.state for op in (first, a, b)] == ["done"]*3 and a.id < b.id
+    assert eeprom.adaptor.memory[:1024] == bytes([3]*512 + [2]*512)
+    # Both requests see the merged write finish
+    assert [p.done for p in progress] == [512, 512]
+
+
+def test_cancel_and_failure():
+    eeprom = I2CEEPROM(EmulatedEEPROMAdaptor(), 4096)
+    started = threading.Event()
+    changes = []
+
+    def cancellable(eeprom, progress):
+        started.set()
+        while True:
+            progress.check_cancelled("write")
+
+    def failing(eeprom, progress):
+        raise ValueError("failed verification")
+
+    queue = DeviceQueue(lambda device: eeprom, on_change=lambda op: changes.append((op.description, op.state)))
+    running = queue.submit(DeviceOperation("ee", "Running", cancellable))
+    started.wait(5)
+    queued = queue.submit(DeviceOperation("ee", "Queued", _write(0, bytes(512))))
+    queue.cancel()
+    assert queue.wait(5)
+    assert running.state == "cancelled" and queued.state == "cancelled"
+    assert eeprom.adaptor.memory[:512] == bytes([0xFF]*512)
+    assert ("Queued", "running") not in changes
+
+    failed = queue.submit(DeviceOperation("ee", "Failing", failing))
+    after = queue.submit(DeviceOperation("ee", "After", _write(0, bytes(512))))
+    assert queue.wait(5)
+    assert failed.state == "failed" and isinstance(failed.error, ValueError)
+    assert after.state == "done" and eeprom.adaptor.memory[:512] == bytes(512)
+
+
+def test_merged_operation_runs_after_the_requests_before_it():
+    eeprom = I2CEEPROM(EmulatedEEPROMAdaptor(), 4096)
+    started = threading.Event()
+    release = threading.Event()
+    reads = []
+
+    def blocked(eeprom, progress):
+        started.set()
+        release.wait(5)
+
+    def read(eeprom, progress):
+        reads.append(bytes(eeprom.read(0, 512)))
+
+    queue = DeviceQueue(lambda device: eeprom)
+    queue.submit(DeviceOperation("ee", "Blocked", blocked))
+    started.wait(5)
+    write = queue.submit(DeviceOperation("ee", "Write 1", _write(0, bytes([1]*512)), key=("write", 0)))
+    queue.submit(DeviceOperation("ee", "Read", read))
+    assert queue.submit(DeviceOperation("ee", "Write 1 again", _write(0, bytes([2]*512)), key=("write", 0))) is write
+    assert [op.description for op in queue.pending()] == ["Blocked", "Read", "Write 1 again"]
+
+    release.set()
+    assert queue.wait(5)
+    # The read was requested before the new data
+    assert reads == [bytes([0xFF]*512)] and eeprom.adaptor.memory[:512] == bytes([2]*512)
+
+
+def test_cancelling_a_merged_request_keeps_the_others():
+    eeprom = I2CEEPROM(EmulatedEEPROMAdaptor(), 4096)
+    started = threading.Event()
+    release = threading.Event()
+
+    def blocked(eeprom, progress):
+        started.set()
+        release.wait(5)
+
+    queue = DeviceQueue(lambda device: eeprom)
+    queue.submit(DeviceOperation("ee", "Blocked", blocked))
+    started.wait(5)
+    progress = [TransferProgress(512), TransferProgress(512), TransferProgress(512)]
+    write = queue.submit(DeviceOperation("ee", "Write 1", _write(0, bytes([1]*512)), key=("write", 0),
+                                         progress=progress[0]))
+    for p in progress[1:]:
+        queue.submit(DeviceOperation("ee", "Write 1 again", _write(0, bytes([2]*512)), key=("write", 0), progress=p))
+    assert write.coalesced == 2
+
+    # Only the cancelled requests stop following the write
+    assert queue.cancel([write], progress[0]) == [write]
+    assert queue.cancel([write], progress[2]) == [write]
+    assert write.state == "queued" and write.coalesced == 0 and write.progress is progress[1]
+    release.set()
+    assert queue.wait(5)
+    assert write.state == "done" and eeprom.adaptor.memory[:512] == bytes([2]*512)
+    assert [p.done for p in progress] == [0, 512, 0]
+
+    # Cancelling the last request cancels the operation
+    started.clear()
+    release.clear()
+    queue.submit(DeviceOperation("ee", "Blocked", blocked))
+    started.wait(5)
+    write = queue.submit(DeviceOperation("ee", "Write 1", _write(0, bytes(512)), key=("write", 0),
+                                         progress=progress[0]))
+    assert queue.cancel([write], progress[0]) == [] and write.state == "cancelled"
+    release.set()
+    assert queue.wait(5)
+    assert eeprom.adaptor.memory[:512] == bytes([2]*512)
@@ -0,0 +1,46 @@
+import pytest
+
+from eeprom.eeprom import DummyEEPROM, TransferProgress, OperationCancelled
+
+
+class PagedDummyEEPROM(DummyEEPROM):
+    @property
+    def page_size(self,):
+        return 32
+
+
+def test_progress_events(tmp_path):
+    ee = PagedDummyEEPROM(tmp_path / "sim.bin", 4096)
+    events = []
+    progress = TransferProgress(callback=events.append)
+    progress.expect(1024)
+    ee.write(512, bytes(range(256))*2, progress)
+    assert ee.verify(512, bytes(range(256))*2, progress)
+    assert len(events) == 32
+    assert [e.operation for e in events] == ["write"]*16 + ["verify"]*16
+    assert [e.done for e in events] == list(range(32, 1025, 32))
+    assert events[-1].fraction == 1.0
+    assert events[-1].eta in (0.0, None)
+
+
+def test_cancel_on_page_boundary(tmp_path):
+    ee = PagedDummyEEPROM(tmp_path / "sim.bin", 4096)
+    events = []
+    progress = TransferProgress(callback=events.append, is_cancelled=lambda: len(events) == 3)
+    with pytest.raises(OperationCancelled) as e:
+        ee.write(0, [0]*512, progress)
+    assert e.value.event.done == 96
+    assert ee.read_bytes(0, 512) == bytes(96) + b'\xff'*416
+
+
+def test_save_file_cancelled(tmp_path):
+    ee = PagedDummyEEPROM(tmp_path / "sim.bin", 4096)
+    with pytest.raises(OperationCancelled):
+        ee.save_file(tmp_path / "out.bin", progress=TransferProgress(is_cancelled=lambda: True))
+    assert not (tmp_path / "out.bin").exists()
+
+
+def test_split_transaction_within_page():
+    assert DummyEEPROM.split_transaction(4096, 1024, 512) == [(1024, 0, 512)]
+    assert DummyEEPROM.split_transaction(32, 1030, 40) == [(1030, 0, 26), (1056, 26, 14)]
+    assert DummyEEPROM.split_transaction(32, 1030, 10) == [(1030, 0, 10)]
@@ -0,0 +1,71 @@
+import io
+import os
+
+import pytest
+
+from adaptor.emulated import EmulatedEEPROMAdaptor
+from eeprom.eeprom import I2CEEPROM, TransferProgress
+from eeprom.hexfile import read_records, read_hex, write_hex
+
+
+this_path = os.path.dirname(os.path.abspath(__file__))
+
+
+def test_round_trip_across_64k_boundary(tmp_path):
+    data = bytes(i & 0xFF for i in range(300))
+    f = io.StringIO()
+    write_hex(f, data, start_address=0x10000 - 100, record_size=32)
+    lines = f.getvalue().splitlines()
+    assert lines[-1] == ":00000001FF"
+    assert ":020000040001F9" in lines
+    assert b''.join(d for _, d in read_records(lines)) == data
+    assert [a for a, _ in read_records(lines)][:5] == [0xFF9C, 0xFFBC, 0xFFDC, 0xFFFC, 0x10000]
+
+    (tmp_path / "image.hex").write_text(f.getvalue())
+    image = read_hex(tmp_path / "image.hex")
+    assert len(image) == 0x10000 + 200 and image[:0xFF9C] == bytes([0xFF]*0xFF9C)
+    assert read_hex(tmp_path / "image.hex", size=0x10000)[-100:] == data[:100]
+
+
+def test_segment_records_and_errors():
+    lines = [":020000021000EC", ":03000000010203F7", ":00000001FF", ":0100000099FF"]
+    assert list(read_records(lines)) == [(0x10000, bytes([1, 2, 3]))]
+    with pytest.raises(ValueError, match="checksum"):
+        list(read_records([":0300000001020308"]))
+    with pytest.raises(ValueError, match="Line 2"):
+        list(read_records([":0100000000FF", "03000000010203F7"]))
+
+
+def test_streaming_load_and_save(tmp_path):
+    # Records out of order
+    records = io.StringIO()
+    write_hex(records, bytes([1]*1040), start_address=32)
+    lines = records.getvalue().splitlines()
+    first, rest = lines[:1], lines[1:-1]
+    (tmp_path / "image.hex").write_text("\n".join(rest + first + lines[-1:]) + "\n")
+
+    ee = I2CEEPROM(EmulatedEEPROMAdaptor(), 4096)
+    progress = TransferProgress()
+    ee.load_file(tmp_path / "image.hex", verify=True, progress=progress)
+    # Every page is written and verified once, and reported
+    assert progress.done == progress.total == 2*4096
+    assert ee.adaptor.memory[:32] == bytes([0xFF]*32)
+    assert ee.adaptor.memory[32:1072] == bytes([1]*1040)
+
+    ee.save_file(tmp_path / "saved.hex")
+    assert read_hex(tmp_path / "saved.hex") == ee.adaptor.memory
+    assert read_hex(os.path.join(this_path, "reverbs.hex"), 4096)[:4] != bytes([0xFF]*4)
+
+
+def test_bad_record_writes_nothing(tmp_path):
+    records = io.StringIO()
+    write_hex(records, bytes([1]*4096))
+    lines = records.getvalue().splitlines()
+    # A bad checksum near the end of the file
+    lines[-2] = lines[-2][:-2] + ("00" if lines[-2][-2:] != "00" else "01")
+    (tmp_path / "image.hex").write_text("\n".join(lines) + "\n")
+
+    ee = I2CEEPROM(EmulatedEEPROMAdaptor(), 4096)
+    with pytest.raises(ValueError, match="checksum"):
+        ee.load_file(tmp_path / "image.hex")
+    assert ee.adaptor.memory == bytes([0xFF]*4096)
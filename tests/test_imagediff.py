@@ -0,0 +1,50 @@
+import pytest
+
+from adaptor.emulated import EmulatedEEPROMAdaptor
+from eeprom.eeprom import I2CEEPROM
+from fv1_programmer.imagediff import diff_image, estimate_write_time, write_changed_pages, PAGE_WRITE_TIME
+
+
+def test_diff_pages_and_slots():
+    current = bytes([0xFF]*4096)
+    target = bytearray(current)
+    target[0] = 0
+    target[40:70] = bytes(30)
+    target[1536] = 1
+    result = diff_image(current, {0 : bytes(target)}, 32)
+    assert result.num_bytes == 32
+    assert result.pages == [0, 32, 64, 1536]
+    assert result.page_ranges == ["0x0000-0x005f", "0x0600-0x061f"]
+    assert result.slots == [1, 4]
+
+
+def test_diff_only_covers_target_regions():
+    current = bytes(4096)
+    result = diff_image(current, {1024 : bytes(512)}, 32)
+    assert result.pages == [] and result.slots == []
+    result = diff_image(current, {1024 : bytes([1]*512)}, 32)
+    assert result.slots == [3] and len(result.pages) == 16
+
+
+def test_estimate_write_time():
+    assert estimate_write_time(512, 32, 1024) == pytest.approx(0.5 + 16*PAGE_WRITE_TIME)
+    assert estimate_write_time(33, 32, 1024) == pytest.approx(33/1024 + 2*PAGE_WRITE_TIME)
+
+
+def test_write_changed_pages():
+    eeprom = I2CEEPROM(EmulatedEEPROMAdaptor(), 4096)
+    program = bytearray([0xFF]*512)
+    program[40] = 0
+    program[500:512] = bytes(12)
+    # Compared with what's read from the EEPROM
+    assert write_changed_pages(eeprom, 1024, bytes(program), verify=True) == [1024 + 32, 1024 + 480]
+    assert eeprom.adaptor.memory[1024:1536] == program
+
+    # Compared with what was last written, without reading
+    previous = bytes(program)
+    program[0] = 1
+    writes = []
+    eeprom.write_bytes = lambda address, data: writes.append((address, bytes(data)))
+    eeprom.read_bytes = None
+    assert write_changed_pages(eeprom, 1024, bytes(program), current=previous) == [1024]
+    assert writes == [(1024, bytes(program[:32]))]
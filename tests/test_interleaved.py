@@ -0,0 +1,66 @@
+import time
+
+import pytest
+
+from adaptor.emulated import EmulatedEEPROMAdaptor
+from eeprom.eeprom import I2CEEPROM, TransferProgress, OperationCancelled
+from eeprom.interleaved import InterleavedI2CEEPROMs
+
+
+ADDRESSES = [0x50, 0x51, 0x52, 0x53]
+
+
+def test_same_image_to_every_eeprom():
+    adaptor = EmulatedEEPROMAdaptor(addresses=ADDRESSES)
+    group = InterleavedI2CEEPROMs(adaptor, ADDRESSES, 4096)
+    data = bytes(range(256))*2
+    events = []
+    progress = TransferProgress(callback=events.append)
+    progress.expect(len(data)*len(ADDRESSES)*2)
+    group.write(100, data, progress)
+    assert group.verify(100, data, progress) == []
+    assert events[-1].done == events[-1].total
+    for address in ADDRESSES:
+        assert adaptor.devices[address].memory[100:612] == data
+    assert adaptor.address == 0x50
+
+
+def test_different_images_and_failed_verify():
+    adaptor = EmulatedEEPROMAdaptor(addresses=ADDRESSES[:2])
+    group = InterleavedI2CEEPROMs(adaptor, ADDRESSES[:2], 4096)
+    images = {0x50 : bytes([1])*64, 0x51 : bytes([2])*96}
+    group.write(0, images)
+    assert group.verify(0, images) == []
+    adaptor.devices[0x51].memory[5] = 0
+    assert group.verify(0, images) == [0x51]
+    assert group.read(0x50, 0, 2) == bytes([1, 1])
+
+
+def test_cancel_stops_on_a_page_boundary():
+    adaptor = EmulatedEEPROMAdaptor(addresses=ADDRESSES)
+    group = InterleavedI2CEEPROMs(adaptor, ADDRESSES, 4096)
+    events = []
+    progress = TransferProgress(callback=events.append, is_cancelled=lambda: len(events) == 5)
+    with pytest.raises(OperationCancelled):
+        group.write(0, bytes(128), progress)
+    assert events[-1].done == 5*32
+
+
+def test_interleaving_overlaps_write_cycles():
+    kwargs = {"i2c_clock_speed" : 400000, "realtime" : True, "write_cycle_time" : 0.005}
+    data = bytes(512)
+
+    start = time.perf_counter()
+    for address in ADDRESSES:
+        ee = I2CEEPROM(EmulatedEEPROMAdaptor(address, **kwargs), 4096)
+        ee.write(0, data)
+    one_at_a_time = time.perf_counter() - start
+
+    adaptor = EmulatedEEPROMAdaptor(addresses=ADDRESSES, **kwargs)
+    group = InterleavedI2CEEPROMs(adaptor, ADDRESSES, 4096)
+    start = time.perf_counter()
+    group.write(0, data)
+    interleaved = time.perf_counter() - start
+
+    assert interleaved < one_at_a_time/2
+    assert group.busy_polls > 0
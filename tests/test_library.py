@@ -0,0 +1,49 @@
+import pathlib
+import shutil
+
+from fv1_programmer.library import ProgramLibrary
+
+
+def test_library_refresh_and_search(tmp_path):
+    this_path = pathlib.Path(__file__).parent.resolve()
+    programs = tmp_path / "programs"
+    programs.mkdir()
+    shutil.copy(this_path / 'reverbs.hex', programs / 'reverbs.hex')
+    spn = programs / 'passthrough.spn'
+    spn.write_text("; Stereo passthrough\nrdax adcl,1.0\nwrax dacl,0\nrdax adcr,1.0\nwrax dacr,0\n")
+
+    library = ProgramLibrary(tmp_path / "library.sqlite3")
+    assert library.refresh([programs]) == (2, 0)
+    # Nothing changed, so nothing is re-indexed
+    assert library.refresh([programs]) == (0, 0)
+
+    hits = library.search("stereo")
+    assert len(hits) == 1
+    assert hits[0].name == "passthrough"
+    assert hits[0].instructions == 4
+    assert library.load(hits[0]) == spn.read_text()
+
+    assert len(library.search("reverbs")) == 8
+    assert library.search("reverbs 3")[0].slot == 3
+
+    (programs / 'reverbs.hex').unlink()
+    assert library.refresh([programs]) == (0, 1)
+    assert library.search("reverbs") == []
+
+
+def test_refresh_only_removes_files_below_its_roots(tmp_path):
+    programs, other = tmp_path / "programs", tmp_path / "programs2"
+    programs.mkdir()
+    other.mkdir()
+    (programs / "chorus.spn").write_text("; Chorus\nrdax adcl,1.0\nwrax dacl,0\n")
+    (other / "flanger.spn").write_text("; Flanger\nrdax adcl,1.0\nwrax dacl,0\n")
+
+    library = ProgramLibrary(tmp_path / "library.sqlite3")
+    assert not library.exists
+    assert library.refresh([programs, other]) == (2, 0)
+    assert library.exists
+    # "programs" is a prefix of "programs2" but not its parent
+    assert library.refresh([programs]) == (0, 0)
+    assert [hit.name for hit in library.search("flang")] == ["flanger"]
+    # Query syntax is searched for as text
+    assert library.search('"chorus" OR') == []
@@ -0,0 +1,57 @@
+import pathlib
+
+from fv1_programmer.bank import read_image, split_program_slots
+from fv1_programmer.fv1 import FV1Program
+from fv1_programmer.isa import decode_program, make, encode_program
+from fv1_programmer.optimizer import optimize, _verify
+
+
+def _assemble(asm):
+    data, _, _, errors = FV1Program(asm).assemble(spinreals=True)
+    assert errors == []
+    return data
+
+
+def test_rewrites():
+    data = _assemble("rdax adcl,1.0\nwrax reg0,0\nrdax reg0,0.5\nsof 1.0,0\nwrax reg1,1.0\n"
+                     "sof 0.5,0\nsof 0.25,0.125\nwrax dacl,0\nsof 0,0.5\nsof -0.5,0.25\nwrax dacr,0\n")
+    result = optimize(data)
+    assert result.verified
+    assert result.instructions_before == 11
+    assert [str(i) for i in decode_program(result.program)[:result.instructions_after]] == [
+        str(make('RDAX', 0x14, 0x4000)),
+        # REG0 is never read once the load is merged into the store, so the
+        # remaining scaling folds into a single SOF
+        str(make('SOF', 0x0400, 0x80)),
+        str(make('WRAX', 0x16, 0)),
+        str(make('SOF', 0, 0)),
+        str(make('WRAX', 0x17, 0)),
+    ]
+    assert result.saved == 6
+
+
+def test_skip_targets_follow_removed_instructions():
+    data = _assemble("skp run,start\nsof 1.0,0\nwlds sin0,12,100\nstart:\nrdax adcl,1.0\nwrax dacl,0\n")
+    result = optimize(data)
+    assert result.saved == 1
+    assert decode_program(result.program)[0].args[1] == 1
+
+
+def test_pacc_dependencies_are_kept():
+    data = _assemble("rdax adcl,1.0\nsof 1.0,0\nwrhx reg0,0.5\nwrax dacl,0\nrdax reg0,1.0\nwrax dacr,0\n")
+    assert optimize(data).saved == 0
+
+
+def test_verify_detects_differences():
+    data = _assemble("rdax adcl,1.0\nwrax dacl,0\n")
+    other = encode_program([make('RDAX', 0x14, 0x2000), make('WRAX', 0x16, 0)])
+    assert _verify(data, data, 256)
+    assert not _verify(data, other, 256)
+
+
+def test_bundled_programs():
+    this_path = pathlib.Path(__file__).parent.resolve()
+    for data in split_program_slots(read_image(this_path / 'delays.hex')):
+        result = optimize(data)
+        assert result.verified
+        assert result.saved > 0
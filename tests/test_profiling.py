@@ -0,0 +1,19 @@
+from adaptor.emulated import EmulatedEEPROMAdaptor
+from eeprom.eeprom import I2CEEPROM
+from fv1_programmer.profiling import Profile
+
+
+def test_bus_time_is_split_out(tmp_path):
+    ee = I2CEEPROM(EmulatedEEPROMAdaptor(realtime=True, write_cycle_time=0.01), 4096, page_size_in_bytes=32)
+    with Profile("write") as profile:
+        ee.write(0, bytes(64))
+        sum(i*i for i in range(100000))
+    assert profile.wall_time >= 0.02
+    assert profile.categories["bus I/O"] >= 0.02
+    assert profile.categories["other"] > 0
+    assert abs(sum(profile.categories.values()) - profile.wall_time) < 0.01
+    assert profile.summary().startswith("write: ")
+
+    profile.write_report(tmp_path / "profile.txt")
+    profile.write_report(tmp_path / "profile.txt")
+    assert (tmp_path / "profile.txt").read_text().count("write: ") == 2
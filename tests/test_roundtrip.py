@@ -0,0 +1,29 @@
+import json
+
+from fv1_programmer.roundtrip import run_round_trips, write_report, is_known_difference, DEFAULT_CORPUS
+
+
+def test_bundled_banks_round_trip(tmp_path):
+    results = run_round_trips(DEFAULT_CORPUS, repeat=1)
+    assert len(results) == 8
+    for result in results:
+        assert result.programs == 16 and result.disassemble_rate > 0 and result.assemble_rate > 0
+        assert result.mismatches == [], result.summary()
+        # 1.0 is disassembled as "1", the integer 1 without spinreals
+        assert bool(len(result.known_mismatches)) != result.spinreals
+
+    write_report(tmp_path / "report.jsonl", DEFAULT_CORPUS, results)
+    write_report(tmp_path / "report.jsonl", DEFAULT_CORPUS, results)
+    records = [json.loads(line) for line in (tmp_path / "report.jsonl").read_text().splitlines()]
+    assert len(records) == 2
+    assert [(r["clamp"], r["spinreals"], r["relative"]) for r in records[0]["results"]] == \
+        [(r.clamp, r.spinreals, r.relative) for r in results]
+
+
+def test_known_differences():
+    rdax_pot0_1 = bytes.fromhex("40000204")
+    assert is_known_difference("\trdax\tPOT0,1   \t; reg:0x10 k:0x4000", rdax_pot0_1, clamp=True)
+    assert is_known_difference("addr0e:\trdax\tPOT0,1", rdax_pot0_1, clamp=True)
+    # Anything else is a real difference
+    assert not is_known_difference("\trdax\tPOT0,1", bytes.fromhex("30000204"), clamp=True)
+    assert not is_known_difference("\trdax\tPOT0,0.5", bytes.fromhex("20000204"), clamp=True)
@@ -0,0 +1,58 @@
+import struct
+import wave
+
+from fv1_programmer.simulator import FV1Simulator, render_wav
+
+
+def test_passthrough():
+    sim = FV1Simulator.from_asm("rdax adcl,1.0\nwrax dacl,0\nrdax adcr,-0.5\nwrax dacr,0\n")
+    left, right = sim.process([0, 1000, -4096, 8388607], [0, 1000, -4096, 8388607])
+    assert left == [0, 1000, -4096, 8388607]
+    assert right == [0, -500, 2048, -4194304]
+
+
+def test_delay_line():
+    sim = FV1Simulator.from_asm("mem dly 100\nrdax adcl,1.0\nwra dly,0\nrda dly#,1.0\nwrax dacl,0\n")
+    impulse = [0]*300
+    impulse[10] = 1 << 20
+    left, _ = sim.process(impulse, [0]*300)
+    assert [i for i, v in enumerate(left) if v] == [110]
+
+
+def test_saturation():
+    sim = FV1Simulator.from_asm("rdax adcl,1.5\nrdax adcl,1.5\nwrax dacl,0\nrdax adcl,-2.0\nwrax dacr,0\n")
+    left, right = sim.process([1 << 22, -(1 << 23)], [0, 0])
+    assert left == [8388607, -8388608]
+    assert right == [-8388608, 8388607]
+
+
+def test_skip_run_executes_once():
+    sim = FV1Simulator.from_asm("skp run,done\nsof 0,0.5\nwrax reg0,0\ndone:\nrdax reg0,1.0\nwrax dacl,0\n")
+    left, _ = sim.process([0]*3, [0]*3)
+    assert left == [1 << 22]*3
+    assert sim.state.regs[0x20] == 1 << 22
+
+
+def test_render_wav(tmp_path):
+    input_path = tmp_path / "in.wav"
+    with wave.open(str(input_path), 'wb') as w:
+        w.setnchannels(1)
+        w.setsampwidth(2)
+        w.setframerate(32768)
+        w.writeframes(struct.pack('<5h', 0, 100, -100, 32767, -32768))
+
+    sim = FV1Simulator.from_asm("rdax adcl,1.0\nwrax dacl,0\nrdax adcr,1.0\nwrax dacr,0\n")
+    assert render_wav(sim, input_path, tmp_path / "out.wav", block_size=2) == 5
+    with wave.open(str(tmp_path / "out.wav"), 'rb') as w:
+        assert w.getnchannels() == 2
+        assert struct.unpack('<10h', w.readframes(5)) == (0, 0, 100, 100, -100, -100, 32767, 32767, -32768, -32768)
+
+
+def test_delay_pointer_wraps_around_memory():
+    sim = FV1Simulator.from_asm("mem dly 32767\nrdax adcl,1.0\nwra dly,0\nrda dly#,1.0\nwrax dacl,0\n")
+    impulse = [0]*70000
+    impulse[10], impulse[30000] = 1 << 20, -(1 << 20)
+    first, _ = sim.process(impulse[:50000], [0]*50000)
+    second, _ = sim.process(impulse[50000:], [0]*20000)
+    assert [(i, v) for i, v in enumerate(first + second) if v] == [(32777, 1 << 20), (62767, -(1 << 20))]
+    assert sim.state.ptr == -70000 % 32768
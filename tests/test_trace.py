@@ -0,0 +1,76 @@
+import pytest
+
+from adaptor.emulated import EmulatedEEPROMAdaptor
+from adaptor.trace import (TracingAdaptor, ReplayAdaptor, TraceMismatch, ReplayedException, read_trace,
+                           WRITE, WRITE_THEN_READ)
+from eeprom.eeprom import I2CEEPROM
+
+
+class FailingAdaptor(EmulatedEEPROMAdaptor):
+    def read_bytes(self, num_bytes):
+        raise IOError("Bus stuck")
+
+
+def test_record_and_replay(tmp_path):
+    trace = tmp_path / "trace.bin"
+    adaptor = TracingAdaptor(EmulatedEEPROMAdaptor(), trace)
+    adaptor.open()
+    ee = I2CEEPROM(adaptor, 4096, page_size_in_bytes=32)
+    ee.write(100, bytes(range(64)))
+    data = ee.read(96, 72)
+    adaptor.close()
+
+    records = read_trace(trace)
+    assert [r.kind for r in records[1:4]] == [WRITE]*3
+    assert records[1].written == b'\x00\x64' + bytes(range(28))
+    assert records[-2].kind == WRITE_THEN_READ and records[-2].result == data
+
+    replay = ReplayAdaptor(trace)
+    replay.open()
+    ee = I2CEEPROM(replay, 4096, page_size_in_bytes=32)
+    ee.write(100, bytes(range(64)))
+    assert ee.read(96, 72) == data
+    replay.close()
+    assert replay.finished
+
+
+def test_replay_mismatch(tmp_path):
+    trace = tmp_path / "trace.bin"
+    adaptor = TracingAdaptor(EmulatedEEPROMAdaptor(), trace)
+    I2CEEPROM(adaptor, 4096).write(0, b'\x01')
+    adaptor.close()
+    with pytest.raises(TraceMismatch):
+        I2CEEPROM(ReplayAdaptor(trace), 4096).write(0, b'\x02')
+
+
+def test_exceptions_are_replayed(tmp_path):
+    trace = tmp_path / "trace.bin"
+    adaptor = TracingAdaptor(FailingAdaptor(), trace)
+    with pytest.raises(IOError):
+        adaptor.read_bytes(4)
+    adaptor.close()
+    assert read_trace(trace)[0].exception == "OSError: Bus stuck"
+    with pytest.raises(ReplayedException, match="Bus stuck"):
+        ReplayAdaptor(trace).read_bytes(4)
+
+
+def test_replay_several_eeproms(tmp_path):
+    from eeprom.interleaved import InterleavedI2CEEPROMs
+    trace = tmp_path / "trace.bin"
+    addresses = [0x50, 0x51]
+    adaptor = TracingAdaptor(EmulatedEEPROMAdaptor(addresses=addresses), trace)
+    InterleavedI2CEEPROMs(adaptor, addresses, 4096).write(0, bytes(range(64)))
+    adaptor.close()
+
+    replay = ReplayAdaptor(trace)
+    InterleavedI2CEEPROMs(replay, addresses, 4096).write(0, bytes(range(64)))
+    replay.close()
+    assert replay.finished and replay.address == 0x50
+
+
+def test_large_transfers(tmp_path):
+    trace = tmp_path / "trace.bin"
+    adaptor = TracingAdaptor(EmulatedEEPROMAdaptor(size=131072), trace)
+    data = adaptor.write_then_read_bytes(b'\x00\x00', 70000)
+    adaptor.close()
+    assert read_trace(trace)[0].result == bytes(data) and len(data) == 70000
@@ -0,0 +1,54 @@
+import json
+
+import pytest
+
+from fv1_programmer.bank import read_bank
+from fv1_programmer.variants import render_template, generate_variants, REPORT_FILENAME
+
+
+TEMPLATE = """; delay
+mem\tdly\t1000
+equ\tmix\t0.5
+FB equ 0.3 ; feedback
+\trdax\tadcl, {{gain}}
+\trda\tdly#, fb
+\twra\tdly, 0
+\trda\tdly#, mix
+\twrax\tdacl, 0
+"""
+
+
+def test_render_template():
+    asm = render_template(TEMPLATE, {"dly" : 2000, "mix" : 0.25, "fb" : 0.4, "gain" : 1.0})
+    assert "mem\tdly\t2000\n" in asm and "equ\tmix\t0.25\n" in asm
+    assert "FB equ 0.4 ; feedback\n" in asm and "adcl, 1.0\n" in asm
+    with pytest.raises(ValueError, match="gain"):
+        render_template(TEMPLATE, {"dly" : 2000})
+    with pytest.raises(ValueError, match="unknown"):
+        render_template(TEMPLATE, {"gain" : 1.0, "unknown" : 1})
+
+
+def test_generate_variants(tmp_path, monkeypatch):
+    (tmp_path / "delay.spn").write_text(TEMPLATE)
+    spec = {"template" : "delay.spn", "name" : "Delay {dly} {gain}",
+            "parameters" : {"dly" : {"start" : 10000, "stop" : 40000, "step" : 10000}, "gain" : [0.5, 1.0, 2.5]}}
+    (tmp_path / "spec.json").write_text(json.dumps(spec))
+    options = {"clamp" : True, "spinreals" : False, "optimize" : False}
+    variants = generate_variants(tmp_path / "spec.json", tmp_path / "out", options, max_workers=1)
+
+    assert len(variants) == 12
+    # Gain 2.5 is clamped and 40000 words of delay memory is too long
+    ok = [v.name for v in variants if v.status == "ok"]
+    assert ok == [f"Delay {d} {g}" for d in (10000, 20000, 30000) for g in (0.5, 1.0)]
+    assert all(v.status == "limits" and len(v.reasons) for v in variants if v.name not in ok)
+    assert [(v.bank, v.slot) for v in variants if v.status == "ok"] == [(1, 1), (1, 2), (1, 3), (1, 4), (1, 5), (1, 6)]
+
+    bank = read_bank(tmp_path / "out" / "bank_001.json")
+    assert bank.names == ok and bank.options == options
+    with open(tmp_path / "out" / REPORT_FILENAME) as f:
+        assert [v["status"] for v in json.load(f)["variants"]] == [v.status for v in variants]
+
+    # A second run uses the cached results
+    monkeypatch.setattr("fv1_programmer.variants.ProcessPoolExecutor", None)
+    again = generate_variants(tmp_path / "spec.json", tmp_path / "out", options)
+    assert [(v.name, v.status, v.binary) for v in again] == [(v.name, v.status, v.binary) for v in variants]
@@ -0,0 +1,76 @@
+import json
+import os
+
+from eeprom.eeprom import DummyEEPROM
+from fv1_programmer.fv1 import FV1Program
+from fv1_programmer.watch import ProgramWatcher, read_manifest
+
+
+PASSTHROUGH = "rdax adcl,1.0\nwrax dacl,0\nrdax adcr,1.0\nwrax dacr,0\n"
+GAIN = "rdax adcl,0.5\nwrax dacl,0\nrdax adcr,0.5\nwrax dacr,0\n"
+
+
+def _touch(path, text):
+    path.write_text(text)
+    # Make sure the change is seen even on file systems with coarse timestamps
+    mtime = path.stat().st_mtime_ns + 1_000_000_000
+    os.utime(path, ns=(mtime, mtime))
+
+
+def test_read_manifest(tmp_path):
+    (tmp_path / "a.spn").write_text(PASSTHROUGH)
+    manifest = tmp_path / "bank.json"
+    manifest.write_text(json.dumps({"programs" : [{"name" : "A", "path" : "a.spn"}, None,
+                                                  {"name" : "B", "asm" : PASSTHROUGH}]}))
+    assert read_manifest(manifest) == {1 : tmp_path / "a.spn"}
+    assert read_manifest(tmp_path / "a.spn", 3) == {3 : tmp_path / "a.spn"}
+    # Placed in --bank
+    assert read_manifest(manifest, bank=2) == {9 : tmp_path / "a.spn"}
+    assert read_manifest(tmp_path / "a.spn", bank=2) == {9 : tmp_path / "a.spn"}
+
+
+def test_only_changed_slot_is_written(tmp_path):
+    ee = DummyEEPROM(tmp_path / "sim.bin", 4096)
+    a, b = tmp_path / "a.spn", tmp_path / "b.spn"
+    _touch(a, PASSTHROUGH)
+    _touch(b, PASSTHROUGH)
+    watcher = ProgramWatcher({1 : a, 2 : b}, ee)
+
+    results = watcher.poll()
+    assert [(r.slot, r.written, r.verified, r.cached) for r in results] == [(1, True, True, False), (2, True, True, True)]
+    assert watcher.poll() == []
+
+    _touch(b, GAIN)
+    results = watcher.poll()
+    assert [(r.slot, r.written) for r in results] == [(2, True)]
+    expected, _, _, _ = FV1Program(GAIN).assemble()
+    assert ee.read_bytes(512, 512) == bytes(expected)
+    assert ee.read_bytes(1024, 3072) == b'\xff'*3072
+
+    # A change that assembles to the same program doesn't touch the EEPROM
+    _touch(b, GAIN + "\n; comment\n")
+    results = watcher.poll()
+    assert [(r.slot, r.written) for r in results] == [(2, False)]
+
+
+def test_assembly_errors_leave_slot_alone(tmp_path):
+    ee = DummyEEPROM(tmp_path / "sim.bin", 4096)
+    a = tmp_path / "a.spn"
+    _touch(a, "rdax adcl,\n")
+    results = ProgramWatcher({1 : a}, ee).poll()
+    assert len(results[0].errors) and not results[0].written
+    assert ee.read_bytes(0, 4096) == b'\xff'*4096
+
+
+def test_missing_file_is_tried_again(tmp_path, monkeypatch):
+    ee = DummyEEPROM(tmp_path / "sim.bin", 4096)
+    a = tmp_path / "a.spn"
+    _touch(a, PASSTHROUGH)
+    watcher = ProgramWatcher({1 : a}, ee)
+    # Removed between stat() and open()
+    def missing(path, *args, **kwargs):
+        raise FileNotFoundError(path)
+    monkeypatch.setattr("fv1_programmer.watch.open", missing, raising=False)
+    assert watcher.poll() == []
+    monkeypatch.undo()
+    assert [(r.slot, r.written) for r in watcher.poll()] == [(1, True)]